@@ -1,30 +1,12 @@
 #!/bin/bash
 # This file checks the daily uploads for niwotflir for Jim LeMoine
+# usage: count_niwot.sh YEAR DOY1 DOY2 (counts from DOY1 down to DOY2)
 year="$1"
 d1="$2"
 d2="$3"
 
-printf "Year "
-printf $year
-printf ":  "
-printf $d1
-printf " to "
-printf $d2
-printf "\n"
-echo  "----------------------------"
-#echo $d1
-#echo $d2
-
-for doy in $(seq -f "%03g" $d1 -1 $d2)
-do 
-	printf "DOY "
-	printf $doy
-	printf ":\t"
-	cmd="find /data/archive/niwotflir/$year/*/niwotflir-*-"
-	cmd+=$doy
-	cmd+="_* -type f -size 617180c -ls"
-	$cmd 2> /dev/null |wc -l
-done
-
-
-
+# the archive is scanned once for the whole range, see
+# torm/countUploads.py
+exec python3 "$(dirname "$0")/torm/countUploads.py" \
+	--pattern '{site}-*-{doy}_*' --size 617180c \
+	niwotflir "$year" "$d1" "$d2"
@@ -1,3 +1,116 @@
 # -*- coding:utf-8 -*-
 
-from PhenoCamUtils import *
+"""
+A general module for utilities frequently used in the PhenoCam
+server python scripts.  Based on scripts written by R. Braswell
+(possibly via other sources) Compiled 2011 by C. Teshera-Sterne
+<cory@teshera.net>.  Updated and expanded by T. Milliman.
+
+The functions live in submodules which are only imported when one
+of their names is first used, so e.g. a script which only needs the
+filename utilities doesn't load psycopg2, PIL or numpy:
+
+  config     : STARTDIR, CACHEDIR and the other settings
+  filenames  : "standard" filename parsing and day of year conversion
+  archive    : archive scanning and the per-site archive index
+  midday     : midday / target time image selection, midday store
+  siteindex  : SiteImageIndex
+  db         : database access, dbinfo()
+  imaging    : JPEG checks and thumbnails
+  metadata   : .meta file parsing, latest metadata in the FTP area
+  metastore  : per-site store of the parsed .meta files, query_meta()
+  profiling  : opt-in instrumentation
+  daemon     : in-memory archive query daemon (archiveDaemon.py)
+  client     : getMiddayImage() etc. answered by the daemon if it's
+               running (from PhenoCamUtils import client)
+
+All the names are available directly from the package as before
+(import PhenoCamUtils as pcu; pcu.dbinfo(), pcu.STARTDIR, ...).
+Settings assigned through the package, e.g. pcu.STARTDIR = "...",
+are passed on to the config module and seen by all the functions.
+"""
+
+import sys as _sys
+import types as _types
+import importlib as _importlib
+
+from . import config
+
+# public names and the submodule which defines them
+_EXPORTS = {}
+for _modname, _names in (
+        ('profiling', ['enable_profiling', 'profiling_enabled',
+                       'get_profile', 'merge_profile', 'print_profile',
+                       'write_profile']),
+        ('filenames', ['parse_archive_filename', 'doy2date', 'date2doy',
+                       'fn2date', 'fn2datetime', 'datetime2fn', 'fn2path',
+                       'fn2datetime_array', 'dictprint']),
+        ('archive', ['set_scan_semaphore', 'archive_index_path',
+                     'update_archive_index', 'getsiteimgpaths',
+                     'iter_site_images', 'getsiteimglist',
+                     'getDayImageList', 'getImageCount',
+                     'getFirstImagePath', 'getLastImagePath',
+                     'getFirstLastCount', 'getSiteInventory',
+                     'getDailyFileCountsRange', 'getDailyFileCounts',
+                     'getDOYFileCounts']),
+        ('siteindex', ['SiteImageIndex']),
+        ('midday', ['getMiddayImage', 'solar_noon_table',
+                    'getMonthTargetImages', 'getTargetImageRange',
+                    'getMonthMiddayImages', 'getMiddayImageRange',
+                    'getMidDayImageList', 'serializeMidDayImgList',
+                    'MIDDAY_STORE_DTYPE', 'midday_store_path',
+                    'make_midday_records', 'write_midday_store',
+                    'read_midday_store', 'midday_store_image',
+                    'iter_midday_store', 'write_midday_json']),
+        ('db', ['db_connect_str', 'db_connect_ro', 'db_connection',
+                'dbinfo', 'dbinfo_site', 'write_dbinfo_snapshot',
+                'dbinfo_roilist', 'dbinfo_roilists', 'get_roilists',
+                'get_user_id']),
+        ('imaging', ['check_jpeg', 'check_jpegs', 'make_thumb',
+                     'THUMB_SIZE', 'make_thumbs']),
+        ('metadata', ['parse_meta', 'read_meta', 'parse_meta_term',
+                      'match_meta', 'latest_meta_files']),
+        ('metastore', ['SiteMetaStore', 'meta_store_sites',
+                       'update_meta_store', 'query_meta'])):
+    for _name in _names:
+        _EXPORTS[_name] = _modname
+del _modname, _names, _name
+
+# settings which are looked up in (and assigned to) the config module
+_CONFIG = [name for name in dir(config) if name.isupper()]
+
+__all__ = sorted(_CONFIG) + sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _CONFIG:
+        return getattr(config, name)
+
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+            __name__, name))
+
+    module = _importlib.import_module("." + _EXPORTS[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _Package(_types.ModuleType):
+    """
+    Module type for the package which passes assignments to settings
+    on to the config module.
+    """
+
+    def __setattr__(self, name, value):
+        if name in _CONFIG:
+            setattr(config, name, value)
+        else:
+            super().__setattr__(name, value)
+
+
+_sys.modules[__name__].__class__ = _Package
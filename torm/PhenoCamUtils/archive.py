@@ -0,0 +1,1141 @@
+"""
+Archive scanning: listing the images for a site from the archive
+directories or from the per-site sqlite archive index, image counts
+and first/last images, and daily file counts.
+"""
+
+import os
+import sys
+import re
+import glob
+import sqlite3
+import datetime
+import time
+from contextlib import closing, contextmanager
+
+from . import config
+from .profiling import _profiled, _profile_count
+from .filenames import fn2datetime, parse_archive_filename, \
+    _archive_name_re, _archive_channel
+
+# optional semaphore limiting concurrent archive directory scans,
+# see set_scan_semaphore()
+_scan_semaphore = None
+
+######################################################################
+
+
+def set_scan_semaphore(semaphore):
+    """
+    Limit the number of concurrent archive directory scans.  The
+    semaphore should be shared between processes, e.g. a
+    multiprocessing.Semaphore(n) passed to each worker of a pool.
+    Set to None to remove the limit.
+    """
+
+    global _scan_semaphore
+    _scan_semaphore = semaphore
+
+######################################################################
+
+
+@contextmanager
+def _scan_slot():
+    """
+    Context manager holding a slot of the scan semaphore (if any) for
+    the duration of a directory scan.
+    """
+
+    if _scan_semaphore is None:
+        yield
+        return
+
+    _scan_semaphore.acquire()
+    try:
+        yield
+    finally:
+        _scan_semaphore.release()
+
+######################################################################
+
+
+def _listdir(path):
+    """
+    os.listdir() subject to the scan semaphore.
+    """
+
+    with _scan_slot():
+        names = os.listdir(path)
+    _profile_count('listdir')
+    _profile_count('files', len(names))
+    return names
+
+######################################################################
+
+
+def _glob(pattern):
+    """
+    glob.glob() subject to the scan semaphore.
+    """
+
+    with _scan_slot():
+        paths = glob.glob(pattern)
+    _profile_count('glob')
+    _profile_count('files', len(paths))
+    return paths
+
+######################################################################
+
+
+def _listdir_files(path):
+    """
+    Return the names of the non-directory entries in path.  Uses
+    os.scandir() where available so that no per-file stat() is
+    needed.
+    """
+
+    with _scan_slot():
+        if hasattr(os, 'scandir'):
+            with closing(os.scandir(path)) as it:
+                entries = list(it)
+            names = [entry.name for entry in entries if not entry.is_dir()]
+        else:
+            entries = os.listdir(path)
+            names = [name for name in entries
+                     if not os.path.isdir(os.path.join(path, name))]
+            _profile_count('stat', len(entries))
+
+    _profile_count('listdir')
+    _profile_count('files', len(entries))
+    return names
+
+######################################################################
+
+
+def _archive_month_dirs(sitename, year=None):
+    """
+    Return a sorted list of (year, month, monpath) tuples for the
+    YYYY/MM directories in the archive for a site, or with year set
+    for the MM directories of that year only.
+    """
+
+    months = []
+    sitepath = os.path.join(config.STARTDIR, sitename)
+    if year is not None:
+        yeardirs = ["%4.4d" % (year,)]
+    else:
+        try:
+            yeardirs = _listdir(sitepath)
+        except OSError:
+            return months
+
+    for yeardir in yeardirs:
+        if not re.match(r'^\d\d\d\d$', yeardir):
+            continue
+
+        yearpath = os.path.join(sitepath, yeardir)
+        try:
+            mondirs = _listdir(yearpath)
+        except OSError:
+            continue
+
+        for mondir in mondirs:
+            if not re.match(r'^\d\d$', mondir):
+                continue
+            if (int(mondir) < 1) | (int(mondir) > 12):
+                continue
+            months.append((int(yeardir), int(mondir),
+                           os.path.join(yearpath, mondir)))
+
+    months.sort()
+    return months
+
+######################################################################
+
+
+def archive_index_path(sitename):
+    """
+    Return the path of the sqlite archive index file for a site.
+    """
+
+    return os.path.join(config.ARCHIVE_INDEX_DIR, "{}.sqlite".format(sitename))
+
+######################################################################
+
+
+def _open_archive_index(indexpath):
+    """
+    Open (creating if necessary) an archive index file and make sure
+    the tables exist.
+    """
+
+    conn = sqlite3.connect(indexpath, timeout=60)
+    conn.execute("""CREATE TABLE IF NOT EXISTS months (
+                    year INTEGER, month INTEGER, mtime REAL,
+                    PRIMARY KEY (year, month));""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS images (
+                    year INTEGER, month INTEGER, day INTEGER,
+                    channel TEXT, ts TEXT, filename TEXT,
+                    PRIMARY KEY (channel, ts));""")
+    conn.execute("""CREATE INDEX IF NOT EXISTS images_ymd
+                    ON images (year, month, day);""")
+    conn.commit()
+
+    return conn
+
+######################################################################
+
+
+@_profiled
+def update_archive_index(sitename, create=True, months=None):
+    """
+    Bring the archive index for a site up to date.  Each month
+    directory is relisted only if its mtime differs from the one
+    recorded in the index, so after the initial scan an update costs
+    one stat() per month directory.  If create is False and no index
+    exists for the site nothing is done.  If months is a list of
+    (year, month) tuples only those month directories are checked.
+
+    Returns the number of month directories (re)scanned or None if
+    there is no index.
+    """
+
+    if config.ARCHIVE_INDEX_DIR is None:
+        return None
+
+    indexpath = archive_index_path(sitename)
+    if not os.path.exists(indexpath):
+        if not create:
+            return None
+        if not os.path.exists(config.ARCHIVE_INDEX_DIR):
+            os.makedirs(config.ARCHIVE_INDEX_DIR)
+
+    name_re = _archive_name_re(sitename)
+    nscanned = 0
+
+    with closing(_open_archive_index(indexpath)) as conn:
+        cur = conn.execute("SELECT year, month, mtime FROM months;")
+        stored = dict(((row[0], row[1]), row[2]) for row in cur)
+
+        if months is None:
+            monthdirs = _archive_month_dirs(sitename)
+        else:
+            monthdirs = [(year, month,
+                          os.path.join(config.STARTDIR, sitename,
+                                       "%4.4d" % (year,),
+                                       "%2.2d" % (month,)))
+                         for (year, month) in sorted(set(months))]
+
+        found = set()
+        for year, month, monpath in monthdirs:
+            try:
+                _profile_count('stat')
+                mtime = os.stat(monpath).st_mtime
+                names = None
+                if stored.get((year, month)) != mtime:
+                    names = _listdir_files(monpath)
+            except OSError:
+                continue
+
+            found.add((year, month))
+            if names is None:
+                continue
+
+            rows = []
+            for name in names:
+                m = name_re.match(name)
+                if m is None:
+                    continue
+                (ir, yr, mo, dy, hr, mn, sc, ext) = m.groups()
+                if (int(yr) != year) | (int(mo) != month):
+                    continue
+                ts = "%s-%s-%s %s:%s:%s" % (yr, mo, dy, hr, mn, sc)
+                rows.append((year, month, int(dy),
+                             _archive_channel(ir, ext), ts, name))
+
+            # a directory modified in the last couple of seconds may
+            # still change without its mtime changing, so make sure
+            # it gets rescanned next time
+            if time.time() - mtime < 2:
+                mtime = -1
+
+            with conn:
+                conn.execute("DELETE FROM images WHERE year = ? " +
+                             "AND month = ?;", (year, month))
+                conn.executemany("INSERT OR REPLACE INTO images " +
+                                 "VALUES (?, ?, ?, ?, ?, ?);", rows)
+                conn.execute("INSERT OR REPLACE INTO months " +
+                             "VALUES (?, ?, ?);", (year, month, mtime))
+            nscanned += 1
+
+        # drop month directories which have disappeared
+        if months is None:
+            missing = set(stored.keys()) - found
+        else:
+            missing = set(months) & (set(stored.keys()) - found)
+        with conn:
+            for (year, month) in missing:
+                conn.execute("DELETE FROM images WHERE year = ? " +
+                             "AND month = ?;", (year, month))
+                conn.execute("DELETE FROM months WHERE year = ? " +
+                             "AND month = ?;", (year, month))
+
+    if months is None:
+        _archive_index_checked[sitename] = time.time()
+
+    return nscanned
+
+######################################################################
+
+
+# time of the last mtime check for each site index in this process
+_archive_index_checked = {}
+
+
+def _archive_index(sitename):
+    """
+    Return an open connection to the archive index for a site or None
+    if there is no usable index, in which case callers should fall
+    back to scanning the archive.  The index is refreshed first if it
+    hasn't been checked in the last ARCHIVE_INDEX_RECHECK seconds.
+    """
+
+    if config.ARCHIVE_INDEX_DIR is None:
+        return None
+
+    indexpath = archive_index_path(sitename)
+    if not os.path.exists(indexpath):
+        return None
+
+    try:
+        last_check = _archive_index_checked.get(sitename, 0)
+        if time.time() - last_check > config.ARCHIVE_INDEX_RECHECK:
+            update_archive_index(sitename, create=False)
+        return sqlite3.connect(indexpath, timeout=60)
+    except (sqlite3.Error, OSError) as e:
+        errmsg = "Archive index for {} unusable: {}\n".format(sitename, e)
+        sys.stderr.write(errmsg)
+        return None
+
+######################################################################
+
+
+def _index_path(sitename, year, month, filename):
+    """
+    Build an archive path from an archive index row.
+    """
+
+    return os.path.join(config.STARTDIR, sitename, "%4.4d" % (year,),
+                        "%2.2d" % (month,), filename)
+
+######################################################################
+
+
+def _index_date(ts):
+    """
+    Convert an archive index timestamp string to a date object.
+    """
+
+    return datetime.date(int(ts[0:4]), int(ts[5:7]), int(ts[8:10]))
+
+######################################################################
+
+
+@_profiled
+def getsiteimgpaths(sitename, getIR=False,
+                    startYear=1990, startMonth=1,
+                    endYear=2030, endMonth=12):
+    """
+    Returns a list of image pathnames for ALL images in
+    archive for specified site.  Optional arguments:
+
+      getIR:  If set to true only return IR images.
+      startYear: 
+      startMonth:
+      endYear:
+      endMonth:
+
+    NOTE: This might be lots faster if we just do a glob.glob()
+    on a pattern.  Might not be quite as robust since we're skipping
+    the check the .jpg file being a regular file.  See, getImageCount()
+    below for how this would work!
+
+    If an archive index exists for the site the list comes from the
+    index rather than from the archive directories.
+    """
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        if getIR:
+            channel = 'IR'
+        else:
+            channel = 'RGB'
+        sql = "SELECT year, month, filename FROM images " + \
+              "WHERE channel = ? AND year * 100 + month BETWEEN ? AND ?;"
+        with closing(conn):
+            rows = conn.execute(sql, (channel,
+                                      startYear * 100 + startMonth,
+                                      endYear * 100 + endMonth)).fetchall()
+        imgpaths = [_index_path(sitename, row[0], row[1], row[2])
+                    for row in rows]
+        imgpaths.sort()
+        return imgpaths
+
+    imgpaths = []
+    sitepath = os.path.join(config.STARTDIR, sitename)
+    if os.path.exists(sitepath):
+
+        # get a list of files in the directory
+        yeardirs = _listdir(sitepath)
+
+        # loop over all files
+        for yeardir in yeardirs:
+
+            # check that its a directory
+            yearpath = os.path.join(sitepath, yeardir)
+            if not os.path.isdir(yearpath):
+                continue
+
+            # check if this yeardir could be a 4-digit year.  if not skip
+            if not re.match(r'^\d\d\d\d$', yeardir):
+                continue
+
+            # check if we're before startYear
+            if (int(yeardir) < startYear) | (int(yeardir) > endYear):
+                continue
+
+            # get a list of all files in year directory
+            mondirs = _listdir(yearpath)
+
+            # loop over all files
+            for mondir in mondirs:
+
+                # check that its a directory
+                monpath = os.path.join(yearpath, mondir)
+                _profile_count('stat')
+                if not os.path.isdir(monpath):
+                    continue
+
+                # check if this mondir could be a 2-digit month.
+                # if not skip
+                if not re.match(r'^\d\d$', mondir):
+                    continue
+
+                # check month range
+                if (int(mondir) < 1) | (int(mondir) > 12):
+                    continue
+
+                # check start year/month
+                if (int(yeardir) == startYear) & \
+                   (int(mondir) < startMonth):
+                    continue
+
+                # check end year/month
+                if (int(yeardir) == endYear) & (int(mondir) > endMonth):
+                    continue
+
+                try:
+                    imgfiles = _listdir(monpath)
+                    if getIR:
+                        image_re = r"^%s_IR_%s_%s_.*\.jpg$" % \
+                                   (sitename, yeardir, mondir)
+                    else:
+                        image_re = r"^%s_%s_%s_.*\.jpg$" % \
+                                   (sitename, yeardir, mondir)
+
+                    for imgfile in imgfiles:
+                        # check for pattern match
+                        if not re.match(image_re, imgfile):
+                            continue
+
+                        # only add regular files
+                        imgpath = os.path.join(monpath, imgfile)
+                        _profile_count('stat')
+                        if not os.path.isdir(imgpath):
+                            imgpaths.append(imgpath)
+
+                except OSError as e:
+                    if e.errno == 20:
+                        continue
+                    else:
+                        errstring = "Python OSError: %s" % (e,)
+                        print(errstring)
+
+    imgpaths.sort()
+    return imgpaths
+
+######################################################################
+
+
+def iter_site_images(sitename, startDT=None, endDT=None, getIR=False):
+    """
+    Generator yielding the archive image paths for a site in
+    chronological order, one month directory at a time, so memory use
+    is bounded by the size of a month.  Optional arguments:
+
+      getIR   : If set to true only return IR images.
+      startDT : Start datetime (inclusive), default is the first image
+      endDT   : End datetime (inclusive), default is the last image
+
+    Iteration stops as soon as endDT is passed.  Only "standard"
+    filenames are returned.  Months come from the archive index if
+    there is one, otherwise each month directory is read with
+    os.scandir() (where available) so files don't need a stat().
+    """
+
+    if getIR:
+        channel = 'IR'
+        nstart = len(sitename) + 4
+    else:
+        channel = 'RGB'
+        nstart = len(sitename) + 1
+
+    # compare times as the YYYY_MM_DD_HHNNSS part of the filename
+    fnfmt = '%Y_%m_%d_%H%M%S'
+    startmonth = None
+    startstr = None
+    if startDT is not None:
+        if startDT.microsecond > 0:
+            startDT = startDT.replace(microsecond=0) + \
+                datetime.timedelta(seconds=1)
+        startmonth = (startDT.year, startDT.month)
+        startstr = startDT.strftime(fnfmt)
+    endmonth = None
+    endstr = None
+    if endDT is not None:
+        endmonth = (endDT.year, endDT.month)
+        endstr = endDT.strftime(fnfmt)
+
+    # one index connection for the whole iteration, closed when the
+    # generator finishes or is discarded
+    conn = _archive_index(sitename)
+    try:
+        if conn is not None:
+            sql = "SELECT DISTINCT year, month FROM images " + \
+                  "WHERE channel = ? ORDER BY year, month;"
+            months = conn.execute(sql, (channel,)).fetchall()
+            monthdirs = [(year, month, None) for year, month in months]
+        else:
+            name_re = _archive_name_re(sitename)
+            monthdirs = _archive_month_dirs(sitename)
+
+        for year, month, monpath in monthdirs:
+            if startmonth is not None and (year, month) < startmonth:
+                continue
+            if endmonth is not None and (year, month) > endmonth:
+                return
+
+            if monpath is None:
+                sql = "SELECT filename FROM images WHERE channel = ? " + \
+                      "AND year = ? AND month = ?;"
+                rows = conn.execute(sql, (channel, year, month)).fetchall()
+                fnames = [row[0] for row in rows]
+                monpath = _index_path(sitename, year, month, "")
+            else:
+                try:
+                    names = _listdir_files(monpath)
+                except OSError:
+                    continue
+                fnames = []
+                for name in names:
+                    m = name_re.match(name)
+                    if m is None:
+                        continue
+                    (ir, yr, mo, dy, hr, mn, sc, ext) = m.groups()
+                    if (int(yr) != year) | (int(mo) != month):
+                        continue
+                    if _archive_channel(ir, ext) == channel:
+                        fnames.append(name)
+
+            # standard names sort in time order
+            fnames.sort()
+            for fname in fnames:
+                fnstr = fname[nstart:nstart+17]
+                if startstr is not None and fnstr < startstr:
+                    continue
+                if endstr is not None and fnstr > endstr:
+                    return
+                yield os.path.join(monpath, fname)
+    finally:
+        if conn is not None:
+            conn.close()
+
+######################################################################
+
+
+@_profiled
+def getsiteimglist(sitename,
+                   startDT=datetime.datetime(1990, 1, 1, 0, 0, 0),
+                   endDT=datetime.datetime.now(),
+                   getIR=False):
+
+    """
+    Returns a list of imagepath names for ALL images in
+    archive for specified site.  Optional arguments:
+
+      getIR   : If set to true only return IR images.
+      startDT : Start datetime for image list
+      endDT   : End datetime for image list
+
+    Uses the archive index if there is one, otherwise the archive is
+    scanned with iter_site_images().
+    """
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        if getIR:
+            channel = 'IR'
+        else:
+            channel = 'RGB'
+        sql = "SELECT year, month, filename FROM images " + \
+              "WHERE channel = ? AND ts BETWEEN ? AND ?;"
+        tsfmt = '%Y-%m-%d %H:%M:%S'
+        with closing(conn):
+            rows = conn.execute(sql, (channel,
+                                      startDT.strftime(tsfmt),
+                                      endDT.strftime(tsfmt))).fetchall()
+        imglist = [_index_path(sitename, row[0], row[1], row[2])
+                   for row in rows]
+        imglist.sort()
+        return imglist
+
+    imglist = list(iter_site_images(sitename, startDT=startDT,
+                                    endDT=endDT, getIR=getIR))
+    return imglist
+
+######################################################################
+
+
+@_profiled
+def getDayImageList(sitename, year, month, day, irFlag=False):
+    """
+    Given a site, year, month and day return a list of archive image
+    paths. If irFlag is True then get the IR images only.  We're just
+    doing simple filename matching so if irFlag is True and this is
+    not an IR camera an empty list will be returned.
+    """
+
+    # flag for debugging
+    dbgFlg = False
+
+    # need this to allow for uppercase letters in the site name
+    namelen = len(sitename)
+
+    # initialize a list of paths to return
+    imgpaths = []
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        if irFlag:
+            channel = 'IR'
+        else:
+            channel = 'RGB'
+        sql = "SELECT filename FROM images WHERE channel = ? " + \
+              "AND year = ? AND month = ? AND day = ?;"
+        with closing(conn):
+            rows = conn.execute(sql, (channel, year, month,
+                                      day)).fetchall()
+        imgpaths = [_index_path(sitename, year, month, row[0])
+                    for row in rows]
+        imgpaths.sort()
+        return imgpaths
+
+    # set path base
+    yrstr = "%2.2d" % (year,)
+    mostr = "%2.2d" % (month,)
+    imdir = os.path.join(config.STARTDIR, sitename, yrstr, mostr)
+    if dbgFlg:
+        print("imdir: " + imdir)
+
+    # if image dir doesn't exist return empty list
+    if not os.path.exists(imdir):
+        return imgpaths
+
+    # grab filenames matching pattern
+    if irFlag:
+        fnpattern = '%s_IR_%4.4d_%2.2d_%2.2d_??????.jpg' % (sitename,
+                                                            year,
+                                                            month,
+                                                            day,)
+    else:
+        fnpattern = '%s_%4.4d_%2.2d_%2.2d_??????.jpg' % (sitename,
+                                                         year,
+                                                         month,
+                                                         day,)
+
+    pattern = os.path.join(imdir, fnpattern)
+    imlist = _glob(pattern)
+
+    # sort list by time
+    imlist.sort()
+
+    return imlist
+
+######################################################################
+
+
+@_profiled
+def getImageCount(sitename, irFlag=False):
+    """
+    Use glob to make a list of files matching a pattern for
+    the archive.  Should probably be changed to db query once
+    images are in archive.
+    """
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        if irFlag:
+            channel = 'IR'
+        else:
+            channel = 'RGB'
+        sql = "SELECT COUNT(*) FROM images WHERE channel = ?;"
+        with closing(conn):
+            nimages = conn.execute(sql, (channel,)).fetchone()[0]
+        return nimages
+
+    sitepath = os.path.join(config.STARTDIR, sitename)
+    if irFlag:
+        sitename = sitename + '_IR'
+
+    pattern = "%s/[12][0-9][0-9][0-9]/[01][0-9]/%s_[12]*.jpg" % (sitepath,
+                                                                 sitename,)
+    imglist = _glob(pattern)
+    nimages = len(imglist)
+    return nimages
+
+######################################################################
+
+
+@_profiled
+def getFirstImagePath(sitename, irFlag=False):
+    """
+    Find date of first image file for this site.
+
+    irFlag just uses pattern matching ... could do a database check as
+    well to verify that this camera has IR capability, see
+    dbinfo_site().
+    """
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        if irFlag:
+            channel = 'IR'
+        else:
+            channel = 'RGB'
+        sql = "SELECT year, month, filename FROM images " + \
+              "WHERE channel = ? ORDER BY ts ASC LIMIT 1;"
+        with closing(conn):
+            row = conn.execute(sql, (channel,)).fetchone()
+        if row is None:
+            return ""
+        return _index_path(sitename, row[0], row[1], row[2])
+
+    sitepath = os.path.join(config.STARTDIR, sitename)
+
+    if irFlag:
+        sitename = sitename + '_IR'
+
+    pattern = "%s/[12][0-9][0-9][0-9]/[01][0-9]/%s_[12]*.jpg" % \
+              (sitepath, sitename,)
+    imglist = _glob(pattern)
+    imglist.sort()
+    nimages = len(imglist)
+
+    if nimages > 0:
+        first_img = imglist[0]
+    else:
+        first_img = ""
+
+    return first_img
+
+######################################################################
+
+
+@_profiled
+def getLastImagePath(sitename, irFlag=False):
+    """
+    Find date of first image file for this site.
+
+    irFlag just uses pattern matching ... could do a database check as
+    well to verify that this camera has IR capability, see
+    dbinfo_site().
+    """
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        if irFlag:
+            channel = 'IR'
+        else:
+            channel = 'RGB'
+        sql = "SELECT year, month, filename FROM images " + \
+              "WHERE channel = ? ORDER BY ts DESC LIMIT 1;"
+        with closing(conn):
+            row = conn.execute(sql, (channel,)).fetchone()
+        if row is None:
+            return ""
+        return _index_path(sitename, row[0], row[1], row[2])
+
+    sitepath = os.path.join(config.STARTDIR, sitename)
+
+    if irFlag:
+        sitename = sitename + '_IR'
+    pattern = "%s/[12][0-9][0-9][0-9]/[01][0-9]/%s_[12]*.jpg" % \
+              (sitepath, sitename,)
+
+    imglist = _glob(pattern)
+    imglist.sort()
+    nimages = len(imglist)
+
+    if nimages > 0:
+        last_img = imglist[nimages-1]
+    else:
+        last_img = ""
+
+    return last_img
+
+######################################################################
+
+
+@_profiled
+def getFirstLastCount(sitename, irFlag=False):
+    """
+    Find date of first image file, date of last image file,
+    and image count.
+
+    irFlag just uses pattern matching ... could do a database check as
+    well to verify that this camera has IR capability, see
+    dbinfo_site().
+    """
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        if irFlag:
+            channel = 'IR'
+        else:
+            channel = 'RGB'
+        sql = "SELECT MIN(ts), MAX(ts), COUNT(*) FROM images " + \
+              "WHERE channel = ?;"
+        with closing(conn):
+            (first_ts, last_ts, nimages) = conn.execute(sql,
+                                                        (channel,)).fetchone()
+        if nimages > 0:
+            return _index_date(first_ts), _index_date(last_ts), nimages
+        return None, None, 0
+
+    sitepath = os.path.join(config.STARTDIR, sitename)
+
+    if irFlag:
+        sitename = sitename + '_IR'
+
+    pattern = "%s/[12][0-9][0-9][0-9]/[01][0-9]/%s_[12]*.jpg" % \
+              (sitepath, sitename,)
+    imglist = _glob(pattern)
+    imglist.sort()
+    nimages = len(imglist)
+
+    if nimages > 0:
+        first_path = imglist[0]
+        first_img = os.path.basename(first_path)
+        first_dt = fn2datetime(sitename, first_img, irFlag=irFlag)
+        first_date = first_dt.date()
+        last_path = imglist[-1]
+        last_img = os.path.basename(last_path)
+        last_dt = fn2datetime(sitename, last_img, irFlag=irFlag)
+        last_date = last_dt.date()
+    else:
+        first_date = None
+        last_date = None
+
+    return first_date, last_date, nimages
+
+######################################################################
+
+
+def _month_channel_names(sitename, year, month):
+    """
+    Return a dictionary keyed by channel ('RGB', 'IR', 'meta' or
+    'IR_meta') of the "standard" filenames in an archive month
+    directory.  The names come from the archive index if there is
+    one, otherwise the month directory is listed once.
+    """
+
+    channels = {}
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        sql = "SELECT channel, filename FROM images " + \
+              "WHERE year = ? AND month = ?;"
+        with closing(conn):
+            rows = conn.execute(sql, (year, month)).fetchall()
+        for channel, filename in rows:
+            channels.setdefault(channel, []).append(filename)
+        return channels
+
+    imdir = os.path.join(config.STARTDIR, sitename, "%4.4d" % (year,),
+                         "%2.2d" % (month,))
+    try:
+        names = _listdir(imdir)
+    except OSError:
+        return channels
+
+    name_re = _archive_name_re(sitename)
+    for name in names:
+        m = name_re.match(name)
+        if m is None:
+            continue
+        (ir, yr, mo, dy, hr, mn, sc, ext) = m.groups()
+        if (int(yr) != year) | (int(mo) != month):
+            continue
+        channels.setdefault(_archive_channel(ir, ext), []).append(name)
+
+    return channels
+
+######################################################################
+
+
+def _month_image_names(sitename, year, month, channel='RGB'):
+    """
+    Return the "standard" filenames for one channel ('RGB', 'IR',
+    'meta' or 'IR_meta') in an archive month directory.
+    """
+
+    return _month_channel_names(sitename, year, month).get(channel, [])
+
+######################################################################
+
+
+def _index_ts(sitename, fname, channel):
+    """
+    Convert a "standard" filename to the archive index timestamp
+    string format, YYYY-MM-DD HH:NN:SS.
+    """
+
+    if channel in ('IR', 'IR_meta'):
+        nstart = len(sitename) + 4
+    else:
+        nstart = len(sitename) + 1
+    dtstring = fname[nstart:nstart+17]
+
+    return "%s-%s-%s %s:%s:%s" % (dtstring[0:4], dtstring[5:7],
+                                  dtstring[8:10], dtstring[11:13],
+                                  dtstring[13:15], dtstring[15:17])
+
+######################################################################
+
+
+@_profiled
+def getSiteInventory(sitename):
+    """
+    Summarize the archive for a site.  Returns a list of tuples
+
+        (year, month, channel, count, first_ts, last_ts)
+
+    for each month directory and channel ('RGB', 'IR', 'meta' or
+    'IR_meta') with files, where first_ts and last_ts are the
+    timestamps (YYYY-MM-DD HH:NN:SS) of the first and last file.  Uses
+    the archive index if there is one.
+    """
+
+    conn = _archive_index(sitename)
+    if conn is not None:
+        sql = "SELECT year, month, channel, COUNT(*), MIN(ts), MAX(ts) " + \
+              "FROM images GROUP BY year, month, channel " + \
+              "ORDER BY year, month, channel;"
+        with closing(conn):
+            rows = conn.execute(sql).fetchall()
+        return [tuple(row) for row in rows]
+
+    inventory = []
+    for year, month, monpath in _archive_month_dirs(sitename):
+        channels = _month_channel_names(sitename, year, month)
+        for channel in sorted(channels.keys()):
+            fnames = channels[channel]
+            inventory.append((year, month, channel, len(fnames),
+                              _index_ts(sitename, min(fnames), channel),
+                              _index_ts(sitename, max(fnames), channel)))
+
+    return inventory
+
+######################################################################
+
+
+def _month_day_counts(sitename, channels):
+    """
+    Count the RGB images, IR images and (RGB) metadata files for each
+    day of a month from the month's filenames by channel (see
+    _month_channel_names()).  Returns a dictionary keyed by day of
+    month of [nrgb, nir, nmeta] lists, days without files are left
+    out.
+    """
+
+    # column in the count table for each channel
+    columns = {'RGB': 0, 'IR': 1, 'meta': 2}
+    prefixlen = {'RGB': len(sitename) + 1, 'IR': len(sitename) + 4,
+                 'meta': len(sitename) + 1}
+
+    daycounts = {}
+    for channel in columns:
+        nstart = prefixlen[channel]
+        for fname in channels.get(channel, []):
+            day = int(fname[nstart+8:nstart+10])
+            if day not in daycounts:
+                daycounts[day] = [0, 0, 0]
+            daycounts[day][columns[channel]] += 1
+
+    return daycounts
+
+######################################################################
+
+
+@_profiled
+def getDailyFileCountsRange(sitename, date_first, date_last):
+    """
+    Count the RGB images, IR images and (RGB) metadata files for
+    each day from date_first to date_last (inclusive).  Each archive
+    month directory is listed once (or read from the archive index).
+    Returns a list with a (date, nrgb, nir, nmeta) tuple for every
+    day in the range.
+    """
+
+    counts = []
+    daycounts = {}
+    month = None
+
+    mydate = date_first
+    while mydate <= date_last:
+        if (mydate.year, mydate.month) != month:
+            month = (mydate.year, mydate.month)
+            channels = _month_channel_names(sitename, mydate.year,
+                                            mydate.month)
+            daycounts = _month_day_counts(sitename, channels)
+
+        (nrgb, nir, nmeta) = daycounts.get(mydate.day, (0, 0, 0))
+        counts.append((mydate, nrgb, nir, nmeta))
+        mydate = mydate + datetime.timedelta(days=1)
+
+    return counts
+
+######################################################################
+
+
+def getDailyFileCounts(sitename, date):
+    """
+    Count the RGB images, IR images and metadata files in the archive
+    for a single day.  Returns a tuple (nrgb, nir, nmeta).  See
+    getDailyFileCountsRange() for counts over a range of days.
+    """
+
+    (mydate, nrgb, nir, nmeta) = getDailyFileCountsRange(sitename,
+                                                         date, date)[0]
+
+    return nrgb, nir, nmeta
+
+######################################################################
+
+
+def _doy_pattern_re(sitename, pattern):
+    """
+    Compile a shell-style filename pattern in which "{site}" stands
+    for the sitename and "{doy}" for a three digit day of year, e.g.
+    "{site}-*-{doy}_*".  The day of year is the regex's only group.
+    """
+
+    pattern = pattern.replace("{site}", sitename)
+    parts = pattern.split("{doy}")
+    if len(parts) != 2:
+        raise ValueError("pattern '{}' must contain {{doy}} once".format(
+            pattern))
+
+    regex = []
+    for part in parts:
+        chars = []
+        i = 0
+        while i < len(part):
+            c = part[i]
+            if c == '*':
+                chars.append('.*')
+            elif c == '?':
+                chars.append('.')
+            elif c == '[' and part.find(']', i + 2) > 0:
+                j = part.find(']', i + 2)
+                charset = part[i+1:j]
+                if charset.startswith('!'):
+                    charset = '^' + charset[1:]
+                chars.append('[' + charset + ']')
+                i = j
+            else:
+                chars.append(re.escape(c))
+            i += 1
+        regex.append(''.join(chars))
+
+    return re.compile(r'(\d\d\d)'.join(regex) + r'\Z', re.DOTALL)
+
+######################################################################
+
+
+@_profiled
+def getDOYFileCounts(sitename, year, pattern=None, min_size=None,
+                     max_size=None):
+    """
+    Count the files for each day of year in one year of the archive
+    for a site.  Each of the year's month directories is listed once.
+
+    With pattern None the site's "standard" RGB images are counted by
+    image date.  Otherwise pattern is a shell-style pattern for the
+    filenames with "{doy}" marking the day of year and "{site}"
+    standing for the sitename, e.g. "{site}-*-{doy}_*", and matching
+    files are counted by the day of year in their name.
+
+    Optional "min_size" and "max_size" (in bytes, inclusive) count
+    only files within the size range, min_size == max_size for an
+    exact size.
+
+    Returns a dictionary keyed by day of year with the number of
+    files, days without files are left out.
+    """
+
+    name_re = None
+    if pattern is not None:
+        name_re = _doy_pattern_re(sitename, pattern)
+    sized = min_size is not None or max_size is not None
+
+    counts = {}
+    for yr, month, monpath in _archive_month_dirs(sitename, year):
+        try:
+            with _scan_slot():
+                with closing(os.scandir(monpath)) as it:
+                    entries = list(it)
+        except OSError:
+            continue
+        _profile_count('listdir')
+        _profile_count('files', len(entries))
+
+        for entry in entries:
+            if name_re is None:
+                parsed = parse_archive_filename(sitename, entry.name)
+                if parsed is None or parsed[0] != 'RGB' or \
+                        parsed[1].year != year:
+                    continue
+                doy = parsed[1].timetuple().tm_yday
+            else:
+                m = name_re.match(entry.name)
+                if m is None:
+                    continue
+                doy = int(m.group(1))
+
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if sized:
+                    _profile_count('stat')
+                    size = entry.stat(follow_symlinks=False).st_size
+                    if min_size is not None and size < min_size:
+                        continue
+                    if max_size is not None and size > max_size:
+                        continue
+            except OSError:
+                continue
+
+            counts[doy] = counts.get(doy, 0) + 1
+
+    return counts
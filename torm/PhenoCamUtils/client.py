@@ -0,0 +1,185 @@
+"""
+Thin client for the archive query daemon (see daemon and
+archiveDaemon.py).  The functions have the same signatures and results
+as the package functions of the same name, e.g.
+
+    from PhenoCamUtils import client
+    client.getMiddayImage(sitename, 2020, 6, 1)
+
+The query goes to the daemon at DAEMON_ADDRESS if it is running,
+otherwise the package function is called locally, so scripts work
+the same with or without the daemon.  Only the standard library is
+imported until a local call is needed.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import http.client
+from urllib.parse import urlencode
+
+from . import config
+
+# time of the last failure to reach the daemon, queries are made
+# locally for DAEMON_RETRY seconds afterwards
+_daemon_failed = 0
+
+######################################################################
+
+
+def parse_daemon_address(address):
+    """
+    Parse a daemon address: a Unix socket path, or a localhost port
+    given as "PORT", "HOST:PORT" or "http://HOST:PORT".  Returns the
+    socket path, a (host, port) tuple or None if address is None.
+    """
+
+    if address is None:
+        return None
+
+    if address.startswith("http://"):
+        address = address[len("http://"):].rstrip("/")
+
+    host, sep, port = address.rpartition(":")
+    if port.isdigit() and "/" not in address:
+        return (host or "localhost", int(port))
+
+    return address
+
+######################################################################
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a Unix socket.
+    """
+
+    def __init__(self, path, timeout):
+        http.client.HTTPConnection.__init__(self, "localhost",
+                                            timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+######################################################################
+
+
+class DaemonError(Exception):
+    """
+    The daemon was reached but couldn't answer a query.
+    """
+
+######################################################################
+
+
+def daemon_query(name, **args):
+    """
+    Send a query to the daemon and return the decoded result.  Raises
+    OSError (including socket.timeout) if the daemon can't be reached
+    and DaemonError if it returns an error.
+    """
+
+    address = parse_daemon_address(config.DAEMON_ADDRESS)
+    if address is None:
+        raise OSError("no daemon address")
+
+    if isinstance(address, tuple):
+        conn = http.client.HTTPConnection(address[0], address[1],
+                                          timeout=config.DAEMON_TIMEOUT)
+    else:
+        conn = _UnixHTTPConnection(address, config.DAEMON_TIMEOUT)
+
+    try:
+        conn.request("GET", "/{}?{}".format(name, urlencode(args)))
+        response = conn.getresponse()
+        body = json.loads(response.read().decode('utf-8'))
+    except (http.client.HTTPException, ValueError) as e:
+        raise OSError("bad response from daemon: {}".format(e))
+    finally:
+        conn.close()
+
+    if response.status != 200:
+        raise DaemonError(body.get('error', response.reason))
+
+    return body['result']
+
+######################################################################
+
+
+def _query(name, args, kwargs, **query):
+    """
+    Run a query on the daemon, or call the package function name with
+    args and kwargs if the daemon isn't available.
+    """
+
+    global _daemon_failed
+
+    if time.time() - _daemon_failed > config.DAEMON_RETRY:
+        try:
+            return daemon_query(name, **query)
+        except OSError as e:
+            if config.DAEMON_ADDRESS is not None and \
+                    os.environ.get("PHENOCAM_DAEMON", "") != "":
+                errmsg = "Archive daemon unavailable ({}), " + \
+                    "working locally.\n"
+                sys.stderr.write(errmsg.format(e))
+            _daemon_failed = time.time()
+        except DaemonError as e:
+            errmsg = "Archive daemon error ({}), working locally.\n"
+            sys.stderr.write(errmsg.format(e))
+
+    return getattr(sys.modules[__package__], name)(*args, **kwargs)
+
+######################################################################
+
+
+def getMiddayImage(sitename, year, month, day, irFlag=False):
+    """
+    Return the path of the image closest to midday for a day, see
+    PhenoCamUtils.getMiddayImage().
+    """
+
+    return _query('getMiddayImage', (sitename, year, month, day),
+                  {'irFlag': irFlag}, site=sitename, year=year,
+                  month=month, day=day, ir=int(bool(irFlag)))
+
+
+def getLastImagePath(sitename, irFlag=False):
+    """
+    Return the path of the last image for a site, see
+    PhenoCamUtils.getLastImagePath().
+    """
+
+    return _query('getLastImagePath', (sitename,), {'irFlag': irFlag},
+                  site=sitename, ir=int(bool(irFlag)))
+
+
+def getDailyFileCounts(sitename, date):
+    """
+    Return (nrgb, nir, nmeta) for a single day, see
+    PhenoCamUtils.getDailyFileCounts().
+    """
+
+    result = _query('getDailyFileCounts', (sitename, date), {},
+                    site=sitename, date=date.strftime("%Y-%m-%d"))
+
+    return tuple(result)
+
+######################################################################
+
+
+def daemon_status():
+    """
+    Return the daemon's status (sites held, last refresh, ...) or None
+    if it isn't running.
+    """
+
+    try:
+        return daemon_query('status')
+    except (OSError, DaemonError):
+        return None
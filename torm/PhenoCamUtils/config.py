@@ -0,0 +1,100 @@
+"""
+Configuration for the PhenoCamUtils package.  The settings can be
+changed at run time through the package, e.g.
+
+    import PhenoCamUtils as pcu
+    pcu.STARTDIR = "./test_data"
+
+and are looked up by the other modules each time they're used.
+"""
+
+import os
+
+# can set the following for testing, or set PHENOCAM_ARCHIVE in the
+# environment (e.g. to a fake archive from makeFakeArchive.py)
+STARTDIR = os.environ.get("PHENOCAM_ARCHIVE", "/data/archive")
+# STARTDIR = "./test_data"
+
+# local (non-NFS) directory for derived data such as the archive index,
+# PHENOCAM_CACHEDIR in the environment overrides it
+CACHEDIR = os.environ.get("PHENOCAM_CACHEDIR", "/var/cache/phenocam")
+
+# per-site sqlite archive index files live here.  Set to None to
+# disable the index and always scan the archive directories.
+ARCHIVE_INDEX_DIR = os.path.join(CACHEDIR, "archive_index")
+
+# minimum number of seconds between checks of the archive month
+# directory mtimes for an existing index in a single process
+ARCHIVE_INDEX_RECHECK = 60
+
+# number of idle connections kept open by the database connection
+# pool (at least 1, connections beyond this are closed when returned)
+# and the maximum number of open connections
+DB_POOL_MINCONN = 1
+DB_POOL_MAXCONN = 4
+
+# rows fetched from the server at a time by dbinfo()'s server-side
+# cursor
+DBINFO_ITERSIZE = 500
+
+# dbinfo() result snapshots are kept here.  A snapshot younger than
+# DBINFO_CACHE_TTL seconds is used instead of querying the database,
+# by default never (0), so callers get current site information
+# unless they ask for a max_age.  The batch scripts accept snapshots
+# up to DBINFO_BATCH_TTL seconds old.  Set DBINFO_CACHE_DIR to None to
+# disable the snapshots.
+DBINFO_CACHE_DIR = os.path.join(CACHEDIR, "dbinfo")
+DBINFO_CACHE_TTL = 0
+DBINFO_BATCH_TTL = 600
+
+# if True dbinfo() falls back to the last snapshot, however old, when
+# the database is unavailable
+DBINFO_OFFLINE = os.environ.get("PHENOCAM_OFFLINE", "") != ""
+
+# sqlite cache of check_jpegs() results
+JPEG_CHECK_CACHE = os.path.join(CACHEDIR, "jpeg_check.sqlite")
+
+# opt-in instrumentation records (None when off), see
+# enable_profiling().  Run summaries are written to PROFILE_DIR.
+PROFILE_DIR = os.path.join(CACHEDIR, "profile")
+
+# the archive query daemon (archiveDaemon.py) listens on this Unix
+# socket, or on a localhost port if PHENOCAM_DAEMON is set to one
+# ("8765" or "localhost:8765").  PHENOCAM_DAEMON may also name a
+# different socket path.  Set DAEMON_ADDRESS to None to make the
+# client functions always work locally.
+DAEMON_ADDRESS = os.environ.get("PHENOCAM_DAEMON",
+                                os.path.join(CACHEDIR, "archive_daemon.sock"))
+
+# seconds between the daemon's checks of the archive month directories
+# and between its reloads of the site information
+DAEMON_REFRESH = 60
+DAEMON_DBINFO_REFRESH = 600
+
+# sites the daemon doesn't track which it loads when they are queried,
+# the least recently queried are dropped beyond this number
+DAEMON_EXTRA_SITES = 100
+
+# client timeout in seconds for a daemon query, and how long the
+# client works locally after failing to reach the daemon
+DAEMON_TIMEOUT = 10
+DAEMON_RETRY = 30
+
+# camera FTP upload area (one directory per camera) checked by
+# latest_meta_files(), PHENOCAM_FTPDIR in the environment overrides it
+FTP_DATADIR = os.environ.get("PHENOCAM_FTPDIR", "/home/ftp/data")
+
+# latest_meta_files() keeps what it found for each upload directory
+# here, keyed by directory mtime, and scans META_SCAN_THREADS
+# directories at a time.  Set META_SCAN_CACHE to None to always scan.
+META_SCAN_CACHE = os.path.join(CACHEDIR, "latest_meta.json")
+META_SCAN_THREADS = 16
+
+# per-site columnar stores of the parsed archive .meta files, see
+# SiteMetaStore.  Set to None to disable them.
+META_STORE_DIR = os.path.join(CACHEDIR, "meta_store")
+
+# an update of a store lists a site's last META_STORE_RECHECK_MONTHS
+# month directories even if their mtime hasn't changed, to pick up
+# .meta files rewritten in place
+META_STORE_RECHECK_MONTHS = 2
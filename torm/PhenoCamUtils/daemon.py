@@ -0,0 +1,461 @@
+"""
+Archive query daemon.  ArchiveState keeps, for each site, the daily
+file counts, midday images and last images of every archive month
+together with the dbinfo() site information in memory, and refreshes
+them incrementally: only month directories whose mtime has changed
+are read again.  serve() answers queries for it over HTTP on a Unix
+socket or a localhost port, see archiveDaemon.py and the client
+module.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import datetime
+import threading
+import socketserver
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from . import config
+from .archive import _archive_month_dirs, _month_channel_names, \
+    _month_day_counts, archive_index_path, update_archive_index
+from .midday import getMonthTargetImages
+from .db import dbinfo
+from .client import parse_daemon_address
+
+# dbinfo() columns held by the daemon
+DAEMON_COLUMNS = ["Site", "Lat", "Lon", "Format", "active",
+                  "date_first", "date_last"]
+
+# what a sitename may look like, anything else is never used in a path
+_SITENAME_RE = re.compile(r'^[\w-]+$')
+
+######################################################################
+
+
+class ArchiveState(object):
+    """
+    In-memory archive information for a set of sites.  With sitelist
+    None all the active sites are loaded and sites which become active
+    are added on refresh.  Any other known site is loaded when it is
+    first queried, and up to DAEMON_EXTRA_SITES of these are kept,
+    dropping the least recently queried.
+    """
+
+    def __init__(self, sitelist=None, offline=None, verbose=False):
+        self.sitelist = sitelist
+        self.offline = offline
+        self.verbose = verbose
+        self.siteinfo = {}
+        self.dbinfo_time = 0
+        self.refresh_time = 0
+        self.started = time.time()
+        self._sites = {}
+        self._extra = OrderedDict()
+        self._lock = threading.Lock()
+        self._site_locks = {}
+
+    def refresh_dbinfo(self):
+        """
+        Reload the site information, keeping the old copy if the
+        database can't be reached.
+        """
+
+        try:
+            info = dbinfo(colnames=DAEMON_COLUMNS, max_age=0,
+                          offline=self.offline)
+        except Exception as e:
+            errmsg = "Unable to refresh site information: {}\n"
+            sys.stderr.write(errmsg.format(e))
+            return
+
+        self.siteinfo = info
+        self.dbinfo_time = time.time()
+
+    def tracked_sites(self):
+        """
+        Return the sites kept up to date on every refresh.
+        """
+
+        if self.sitelist is not None:
+            sites = set(self.sitelist)
+        else:
+            sites = set(x for x in self.siteinfo
+                        if self.siteinfo[x]['active'])
+
+        with self._lock:
+            sites.update(self._sites.keys())
+
+        return sorted(sites)
+
+    def _is_tracked(self, sitename):
+        """
+        Return True if a site is kept whether or not it's queried.
+        """
+
+        if self.sitelist is not None:
+            return sitename in self.sitelist
+
+        info = self.siteinfo.get(sitename)
+        return info is not None and bool(info['active'])
+
+    def _is_known(self, sitename):
+        """
+        Return True if a sitename from a query is a site: one in the
+        site information, or in the archive if there is no site
+        information.
+        """
+
+        if _SITENAME_RE.match(sitename) is None:
+            return False
+        if self.sitelist is not None and sitename in self.sitelist:
+            return True
+        if len(self.siteinfo) > 0:
+            return sitename in self.siteinfo
+
+        return os.path.isdir(os.path.join(config.STARTDIR, sitename))
+
+    def _load_month(self, sitename, year, month):
+        """
+        Read one archive month for a site and return its entry: the
+        day counts, the midday image and the last image for each
+        channel.
+        """
+
+        channels = _month_channel_names(sitename, year, month)
+        entry = {'counts': _month_day_counts(sitename, channels),
+                 'midday': {},
+                 'last': {}}
+        for irFlag in (False, True):
+            if irFlag:
+                names = channels.get('IR', [])
+            else:
+                names = channels.get('RGB', [])
+            entry['midday'][irFlag] = getMonthTargetImages(
+                sitename, year, month, {'midday': 12.}, irFlag=irFlag,
+                names=names)['midday']
+            if len(names) > 0:
+                entry['last'][irFlag] = max(names)
+
+        return entry
+
+    def refresh_site(self, sitename):
+        """
+        Bring the information for a site up to date, rereading the
+        month directories whose mtime has changed.  Returns the number
+        of months read.
+        """
+
+        with self._lock:
+            sitelock = self._site_locks.setdefault(sitename,
+                                                   threading.Lock())
+
+        with sitelock:
+            with self._lock:
+                old = self._sites.get(sitename, {})
+
+            changed = []
+            stats = {}
+            for year, month, monpath in _archive_month_dirs(sitename):
+                try:
+                    mtime = os.stat(monpath).st_mtime
+                except OSError:
+                    continue
+                # a directory modified in the last couple of seconds
+                # may still change without its mtime changing
+                if time.time() - mtime < 2:
+                    mtime = -1
+                stats[(year, month)] = mtime
+                if (year, month) not in old or \
+                        old[(year, month)]['mtime'] != mtime or mtime < 0:
+                    changed.append((year, month))
+
+            if len(changed) == 0 and set(stats) == set(old):
+                return 0
+
+            # make sure the archive index has the changed months
+            if config.ARCHIVE_INDEX_DIR is not None and \
+                    os.path.exists(archive_index_path(sitename)):
+                update_archive_index(sitename, create=False, months=changed)
+
+            months = {}
+            for key in stats:
+                if key in changed:
+                    months[key] = self._load_month(sitename, key[0], key[1])
+                    months[key]['mtime'] = stats[key]
+                else:
+                    months[key] = old[key]
+
+            with self._lock:
+                # unless a site dropped from the extra sites meanwhile
+                if self._is_tracked(sitename) or sitename in self._extra:
+                    self._sites[sitename] = months
+
+        if self.verbose and len(changed) > 0:
+            print("{}: {} months read".format(sitename, len(changed)))
+
+        return len(changed)
+
+    def refresh(self):
+        """
+        Refresh the site information (every DAEMON_DBINFO_REFRESH seconds)
+        and every tracked site.  Returns the number of months read.
+        """
+
+        if time.time() - self.dbinfo_time > config.DAEMON_DBINFO_REFRESH:
+            self.refresh_dbinfo()
+
+        nmonths = 0
+        for sitename in self.tracked_sites():
+            try:
+                nmonths += self.refresh_site(sitename)
+            except Exception as e:
+                errmsg = "Unable to refresh {}: {}\n".format(sitename, e)
+                sys.stderr.write(errmsg)
+
+        self.refresh_time = time.time()
+        return nmonths
+
+    def _months(self, sitename):
+        """
+        Return the month entries for a site, loading it if needed.
+        Unknown sites have no months.
+        """
+
+        with self._lock:
+            months = self._sites.get(sitename)
+            if sitename in self._extra:
+                self._extra.move_to_end(sitename)
+        if months is not None:
+            return months
+
+        if not self._is_known(sitename):
+            return {}
+
+        with self._lock:
+            if not self._is_tracked(sitename):
+                self._extra[sitename] = True
+                while len(self._extra) > config.DAEMON_EXTRA_SITES:
+                    dropped = self._extra.popitem(last=False)[0]
+                    self._sites.pop(dropped, None)
+                    self._site_locks.pop(dropped, None)
+
+        self.refresh_site(sitename)
+        with self._lock:
+            return self._sites.get(sitename, {})
+
+    def _path(self, sitename, year, month, filename):
+        return os.path.join(config.STARTDIR, sitename, "%4.4d" % (year,),
+                            "%2.2d" % (month,), filename)
+
+    def getMiddayImage(self, sitename, year, month, day, irFlag=False):
+        entry = self._months(sitename).get((year, month))
+        if entry is None:
+            return ""
+
+        return entry['midday'][irFlag].get(day, "")
+
+    def getLastImagePath(self, sitename, irFlag=False):
+        months = self._months(sitename)
+        for key in sorted(months.keys(), reverse=True):
+            last = months[key]['last'].get(irFlag)
+            if last is not None:
+                return self._path(sitename, key[0], key[1], last)
+
+        return ""
+
+    def getDailyFileCounts(self, sitename, date):
+        entry = self._months(sitename).get((date.year, date.month))
+        if entry is None:
+            return (0, 0, 0)
+
+        return tuple(entry['counts'].get(date.day, (0, 0, 0)))
+
+    def dbinfo_site(self, sitename):
+        return self.siteinfo.get(sitename)
+
+    def status(self):
+        with self._lock:
+            nsites = len(self._sites)
+            nmonths = sum(len(x) for x in self._sites.values())
+
+        return {'pid': os.getpid(),
+                'started': self.started,
+                'sites': nsites,
+                'months': nmonths,
+                'dbinfo_sites': len(self.siteinfo),
+                'dbinfo_time': self.dbinfo_time,
+                'refresh_time': self.refresh_time}
+
+######################################################################
+
+
+def _parse_date(datestr):
+    """
+    Parse a YYYY-MM-DD date query argument.
+    """
+
+    return datetime.datetime.strptime(datestr, "%Y-%m-%d").date()
+
+
+def _parse_site(sitename):
+    """
+    Check a site query argument is a plain sitename.
+    """
+
+    if _SITENAME_RE.match(sitename) is None:
+        raise ValueError("invalid sitename {!r}".format(sitename))
+
+    return sitename
+
+
+def _parse_flag(flagstr):
+    return flagstr not in ("", "0", "false", "False")
+
+
+# query name -> (ArchiveState method, [(argument, parser), ...])
+_QUERIES = {
+    'getMiddayImage': ('getMiddayImage',
+                       [('site', _parse_site), ('year', int), ('month', int),
+                        ('day', int), ('ir', _parse_flag)]),
+    'getLastImagePath': ('getLastImagePath',
+                         [('site', _parse_site), ('ir', _parse_flag)]),
+    'getDailyFileCounts': ('getDailyFileCounts',
+                           [('site', _parse_site), ('date', _parse_date)]),
+    'dbinfo_site': ('dbinfo_site', [('site', _parse_site)]),
+    'status': ('status', []),
+}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    Answer GET /<query>?<arguments> with a JSON object holding either
+    the "result" or an "error" message.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = _QUERIES.get(url.path.strip("/"))
+        if query is None:
+            self._reply(404, {'error': "unknown query"})
+            return
+
+        method, argspec = query
+        qs = parse_qs(url.query)
+        try:
+            args = []
+            for name, parser in argspec:
+                if name == 'ir' and name not in qs:
+                    args.append(False)
+                else:
+                    args.append(parser(qs[name][0]))
+        except (KeyError, ValueError) as e:
+            self._reply(400, {'error': "bad argument {}".format(e)})
+            return
+
+        try:
+            result = getattr(self.server.state, method)(*args)
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+            return
+
+        self._reply(200, {'result': result})
+
+    def _reply(self, status, body):
+        data = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "local"
+
+    def log_message(self, format, *args):
+        if self.server.state.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+######################################################################
+
+
+def _remove_stale_socket(path):
+    """
+    Remove a socket file left behind by a daemon which is no longer
+    running.  Raises OSError if a daemon is listening on it.
+    """
+
+    if not os.path.exists(path):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        sock.close()
+
+    raise OSError("a daemon is already listening on {}".format(path))
+
+
+def serve(state, address=None, interval=None):
+    """
+    Answer queries for state (an ArchiveState) on address, a Unix
+    socket path or (host, port) tuple, default DAEMON_ADDRESS, while
+    refreshing it every interval seconds (default DAEMON_REFRESH) in
+    a background thread.  Runs until interrupted.
+    """
+
+    if address is None:
+        address = parse_daemon_address(config.DAEMON_ADDRESS)
+    if interval is None:
+        interval = config.DAEMON_REFRESH
+
+    if isinstance(address, tuple):
+        server = _TCPHTTPServer(address, _RequestHandler)
+    else:
+        _remove_stale_socket(address)
+        sockdir = os.path.dirname(address)
+        if sockdir != "" and not os.path.exists(sockdir):
+            os.makedirs(sockdir)
+        server = _UnixHTTPServer(address, _RequestHandler)
+    server.state = state
+
+    stop = threading.Event()
+
+    def refresher():
+        while not stop.wait(interval):
+            state.refresh()
+
+    thread = threading.Thread(target=refresher, name="refresh")
+    thread.daemon = True
+    thread.start()
+
+    try:
+        server.serve_forever()
+    finally:
+        stop.set()
+        server.server_close()
+        if not isinstance(address, tuple):
+            try:
+                os.unlink(address)
+            except OSError:
+                pass
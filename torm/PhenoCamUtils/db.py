@@ -0,0 +1,776 @@
+"""
+PhenoCam database access: the connection pool, dbinfo() with its
+snapshot cache, and the ROI list and user queries.  psycopg2 is only
+imported when a database connection is first needed.
+"""
+
+import os
+import sys
+import json
+import fcntl
+import decimal
+import hashlib
+import datetime
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from . import config
+from .profiling import _profiled, _profile_count
+
+# module database connection pool (created on first use), the process
+# which created it, and pools inherited from a parent process
+_db_pool = None
+_db_pool_pid = None
+_db_inherited_pools = []
+
+# per-thread connection shared by a db_connection() block
+_db_local = threading.local()
+
+# cached column names keyed by table name
+_db_columns = {}
+
+# tables joined by the dbinfo() query, columns are looked up in order
+_DBINFO_TABLES = ['cameras', 'network_sitemetadata']
+
+######################################################################
+
+
+def _psycopg2():
+    """
+    Return the psycopg2 module, importing it on first use.
+    """
+
+    import psycopg2
+    import psycopg2.pool
+    return psycopg2
+
+######################################################################
+
+
+def db_connect_str():
+    """
+    Return the connection string for read-only database access.
+    """
+
+    dbname, user, host, password = \
+        ('webcam', 'webcam_ro', 'localhost', 'phenodude')
+    connect_str = 'dbname=%s user=%s host=%s password=%s' % \
+        (dbname, user, host, password)
+
+    return connect_str
+
+######################################################################
+
+
+def db_connect_ro():
+    """
+    Connect to the postgresql database for read-only access.
+    Returns a psycopg2 database connection object.
+    """
+
+    # connect to database
+    conn = _psycopg2().connect(db_connect_str())
+
+    return conn
+
+######################################################################
+
+
+def _get_db_pool():
+    """
+    Return the module connection pool, creating it on first use.
+    DB_POOL_MINCONN connections are opened with the pool and kept
+    open when returned to it, further ones up to DB_POOL_MAXCONN
+    are opened when needed and closed when returned.
+    """
+
+    global _db_pool, _db_pool_pid
+
+    if _db_pool is not None and _db_pool_pid != os.getpid():
+        # pool inherited over fork() -- its connections belong to the
+        # parent.  Keep a reference so they are never closed from
+        # here, which would end the parent's sessions.
+        _db_inherited_pools.append(_db_pool)
+        _db_pool = None
+
+    if _db_pool is None:
+        pool = _psycopg2().pool
+        _db_pool = pool.ThreadedConnectionPool(
+            max(config.DB_POOL_MINCONN, 1), config.DB_POOL_MAXCONN,
+            db_connect_str())
+        _db_pool_pid = os.getpid()
+
+    return _db_pool
+
+######################################################################
+
+
+@contextmanager
+def db_connection():
+    """
+    Context manager giving a read-only database connection from the
+    module connection pool, e.g.
+
+        with pcu.db_connection():
+            for roi in pcu.get_roilists():
+                info = pcu.dbinfo_roilist(...)
+
+    All the PhenoCamUtils database functions called inside the block
+    (and nested db_connection() blocks) share the one connection.
+    The connection is returned to the pool afterwards, or discarded if
+    it is broken.
+    """
+
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+
+    pool = _get_db_pool()
+    conn = pool.getconn()
+    _db_local.conn = conn
+    broken = False
+    try:
+        yield conn
+    except _psycopg2().Error:
+        broken = True
+        raise
+    finally:
+        _db_local.conn = None
+        if not broken and not conn.closed:
+            # end the read transaction so the connection sits idle
+            try:
+                conn.rollback()
+            except _psycopg2().Error:
+                broken = True
+        pool.putconn(conn, close=(broken or bool(conn.closed)))
+
+######################################################################
+
+
+def _table_columns(cur, tablename):
+    """
+    Return the list of column names for a table.  Taking this approach
+    allows updates to the table->model definition without changes
+    here.  The names are cached per table, see _clear_table_columns().
+    """
+
+    if tablename not in _db_columns:
+        sql = "SELECT column_name FROM information_schema.columns " + \
+              "WHERE table_name = %s ORDER BY ordinal_position;"
+        cur.execute(sql, (tablename,))
+        _profile_count('db_queries')
+        _db_columns[tablename] = [row[0] for row in cur.fetchall()]
+
+    return _db_columns[tablename]
+
+######################################################################
+
+
+def _clear_table_columns(*tablenames):
+    """
+    Drop cached column names, e.g. after a query error which might
+    mean the table definition has changed.  With no arguments the
+    whole cache is cleared.
+    """
+
+    if len(tablenames) == 0:
+        _db_columns.clear()
+
+    for tablename in tablenames:
+        _db_columns.pop(tablename, None)
+
+######################################################################
+
+
+@_profiled
+def dbinfo(debug=False, hide=False,
+           colnames=["Site", "Lat", "Lon", "Format"],
+           max_age=None, offline=None, active=None, sites=None):
+
+    """
+    Get basic information (lon,lat,format,name) from the webcam
+    camera table.  Default is to return info for all sites, with
+    the following options:
+
+      Optional "debug" which can be set to True to execute print
+      statements.
+
+      Optional "hide" which can be set to True to return only non-hidden
+      sites.  NOTE: this is pretty confusing and should probably
+      be changed.
+
+      Optional "colnames"  which can be set to the columns of table
+      to return.  If colnames contains invalid column names this
+      should generate an error.  Only these columns are fetched
+      from the database.
+
+      Optional "active" which can be set to True or False to return
+      only active or inactive sites.
+
+      Optional "sites", a sitename or list of sitenames to return.
+      Sites which don't exist are left out of the result.  See also
+      dbinfo_site().
+
+      Optional "max_age", the age in seconds of a snapshot of the
+      result (in DBINFO_CACHE_DIR) which may be returned instead of
+      querying the database.  Default is DBINFO_CACHE_TTL, which
+      is 0 (always query the database) unless it's changed.  The
+      batch scripts pass DBINFO_BATCH_TTL.
+
+      Optional "offline" which can be set to True to return the last
+      snapshot, however old, if the database can't be reached.
+      Default is DBINFO_OFFLINE.
+
+      FIXME -- this should really be called dbinfo_cameras() or something
+      like that since we could have lots of tables, e.g. dbinfo_users(),
+      dbinfo_rois()
+    """
+
+    if max_age is None:
+        max_age = config.DBINFO_CACHE_TTL
+    if offline is None:
+        offline = config.DBINFO_OFFLINE
+    if isinstance(sites, str):
+        sites = [sites]
+
+    query = dict(debug=debug, hide=hide, colnames=colnames,
+                 active=active, sites=sites)
+
+    if config.DBINFO_CACHE_DIR is None or (max_age <= 0 and not offline):
+        return _dbinfo_query(**query)
+
+    snappath = _dbinfo_snapshot_path(hide, colnames, active, sites)
+    info = _read_snapshot(snappath, max_age)
+    if info is not None:
+        return info
+
+    # only one process refreshes the snapshot, any others wait for
+    # the lock and then pick up the new snapshot
+    try:
+        lockfh = _lock_snapshot(snappath)
+    except EnvironmentError:
+        return _dbinfo_query(**query)
+
+    try:
+        info = _read_snapshot(snappath, max_age)
+        if info is not None:
+            return info
+
+        try:
+            info = _dbinfo_query(**query)
+        except _psycopg2().OperationalError:
+            if not offline:
+                raise
+            info = _read_snapshot(snappath, None)
+            if info is None:
+                raise
+            errmsg = "Database unavailable, using dbinfo snapshot {}\n"
+            sys.stderr.write(errmsg.format(snappath))
+            return info
+
+        _write_snapshot(snappath, info)
+    finally:
+        lockfh.close()
+
+    return info
+
+######################################################################
+
+
+@_profiled
+def dbinfo_site(sitename, colnames=["Site", "Lat", "Lon", "Format"],
+                debug=False, max_age=None, offline=None):
+    """
+    Get the dbinfo() information for a single site, a dictionary of
+    the colnames columns, or None if there is no such site.  A fresh
+    dbinfo() snapshot for colnames is used if there is one, otherwise
+    just the one row is read from the database.  max_age and offline
+    are as for dbinfo().
+    """
+
+    if max_age is None:
+        max_age = config.DBINFO_CACHE_TTL
+    if offline is None:
+        offline = config.DBINFO_OFFLINE
+
+    snappath = None
+    if config.DBINFO_CACHE_DIR is not None:
+        snappath = _dbinfo_snapshot_path(False, colnames)
+        if max_age > 0:
+            info = _read_snapshot(snappath, max_age)
+            if info is not None:
+                return info.get(sitename)
+
+    try:
+        info = _dbinfo_query(debug=debug, colnames=colnames,
+                             sites=[sitename], stream=False)
+    except _psycopg2().OperationalError:
+        if not offline or snappath is None:
+            raise
+        info = _read_snapshot(snappath, None)
+        if info is None:
+            raise
+        errmsg = "Database unavailable, using dbinfo snapshot {}\n"
+        sys.stderr.write(errmsg.format(snappath))
+
+    return info.get(sitename)
+
+######################################################################
+
+
+def write_dbinfo_snapshot(info, hide=False,
+                          colnames=["Site", "Lat", "Lon", "Format"],
+                          active=None, sites=None):
+    """
+    Store info as the dbinfo() snapshot for the hide, colnames, active
+    and sites arguments, so that dbinfo() returns it (while it's
+    younger than the max_age asked for) without querying the
+    database.
+    Used to run the scripts against a fake archive without a database.
+    """
+
+    if isinstance(sites, str):
+        sites = [sites]
+    snappath = _dbinfo_snapshot_path(hide, colnames, active, sites)
+    lockfh = _lock_snapshot(snappath)
+    try:
+        _write_snapshot(snappath, info)
+    finally:
+        lockfh.close()
+
+######################################################################
+
+
+def _dbinfo_snapshot_path(hide, colnames, active=None, sites=None):
+    """
+    Return the path of the dbinfo() snapshot file for a set of
+    arguments.  Snapshots of unfiltered results keep the same name
+    whatever the filter arguments default to.
+    """
+
+    key = (bool(hide), list(colnames))
+    if active is not None or sites is not None:
+        if sites is not None:
+            sites = sorted(set(sites))
+        key = key + (active, sites)
+    key = repr(key).encode('utf-8')
+    fname = "dbinfo-{}.json".format(hashlib.md5(key).hexdigest())
+
+    return os.path.join(config.DBINFO_CACHE_DIR, fname)
+
+######################################################################
+
+
+def _snapshot_default(obj):
+    """
+    JSON encoding of the database values which JSON doesn't have.
+    """
+
+    if isinstance(obj, datetime.datetime):
+        offset = obj.utcoffset()
+        if offset is not None:
+            offset = offset.total_seconds()
+        return {'__datetime__': [obj.year, obj.month, obj.day, obj.hour,
+                                 obj.minute, obj.second, obj.microsecond,
+                                 offset]}
+    if isinstance(obj, datetime.date):
+        return {'__date__': [obj.year, obj.month, obj.day]}
+    if isinstance(obj, decimal.Decimal):
+        return {'__decimal__': str(obj)}
+
+    raise TypeError("{!r} can't be stored in a snapshot".format(obj))
+
+
+def _snapshot_object(obj):
+    """
+    Decode the values encoded by _snapshot_default().
+    """
+
+    if len(obj) == 1:
+        if '__datetime__' in obj:
+            fields = obj['__datetime__']
+            tz = None
+            if fields[7] is not None:
+                tz = datetime.timezone(datetime.timedelta(seconds=fields[7]))
+            return datetime.datetime(*fields[:7], tzinfo=tz)
+        if '__date__' in obj:
+            return datetime.date(*obj['__date__'])
+        if '__decimal__' in obj:
+            return decimal.Decimal(obj['__decimal__'])
+
+    return obj
+
+
+def _read_snapshot(snappath, max_age):
+    """
+    Return the object stored in a snapshot file or None if the file
+    doesn't exist, can't be read or is older than max_age seconds.
+    A max_age of None accepts a snapshot of any age.  Snapshots are
+    JSON so that reading one from a shared cache directory can't run
+    code.
+    """
+
+    try:
+        if max_age is not None:
+            age = time.time() - os.stat(snappath).st_mtime
+            if age > max_age:
+                return None
+        with open(snappath, 'rb') as fh:
+            return json.loads(fh.read().decode('utf-8'),
+                              object_hook=_snapshot_object)
+    except (EnvironmentError, ValueError):
+        return None
+
+######################################################################
+
+
+def _write_snapshot(snappath, obj):
+    """
+    Atomically replace a snapshot file with obj encoded as JSON (see
+    _snapshot_default()).  Failure to write the snapshot is not an
+    error.
+    """
+
+    try:
+        data = json.dumps(obj, default=_snapshot_default, sort_keys=True)
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(snappath),
+                                       prefix=".snapshot")
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data.encode('utf-8'))
+        os.chmod(tmppath, 0o644)
+        os.rename(tmppath, snappath)
+    except (EnvironmentError, TypeError, ValueError) as e:
+        errmsg = "Unable to write snapshot {}: {}\n".format(snappath, e)
+        sys.stderr.write(errmsg)
+
+######################################################################
+
+
+def _lock_snapshot(snappath):
+    """
+    Take an exclusive lock for refreshing a snapshot file.  Returns
+    the open lock file, closing it releases the lock.
+    """
+
+    snapdir = os.path.dirname(snappath)
+    if not os.path.exists(snapdir):
+        os.makedirs(snapdir)
+
+    lockfh = open(snappath + ".lock", 'a')
+    fcntl.flock(lockfh, fcntl.LOCK_EX)
+
+    return lockfh
+
+######################################################################
+
+
+def _dbinfo_column(cur, colname):
+    """
+    Return the SQL for a dbinfo() column, qualified with the first of
+    the joined tables which has it.
+    """
+
+    for tablename in _DBINFO_TABLES:
+        if colname in _table_columns(cur, tablename):
+            return '{}."{}"'.format(tablename, colname.replace('"', '""'))
+
+    print("Error: column " + colname + " not found.")
+    raise ValueError("column {} not found".format(colname))
+
+######################################################################
+
+
+def _dbinfo_query(debug=False, hide=False,
+                  colnames=["Site", "Lat", "Lon", "Format"],
+                  active=None, sites=None, stream=True):
+    """
+    Run the dbinfo() query against the database.  Only the colnames
+    columns are selected, with the filters applied by the database.
+    If stream is True the rows are read through a server-side cursor
+    DBINFO_ITERSIZE at a time rather than all at once.
+    """
+
+    info = {}
+    if sites is not None and len(sites) == 0:
+        return info
+
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+
+            # the output dictionary is keyed to "Site" name, so it's
+            # always selected first even if it's not requested
+            selected = [_dbinfo_column(cur, 'Site')] + \
+                [_dbinfo_column(cur, colname) for colname in colnames]
+            if debug:
+                print("Columns: " + ", ".join(selected))
+
+            sql = "SELECT " + ", ".join(selected) + \
+                """ FROM (cameras left join
+                network_sitemetadata on "Site" = site_id) WHERE TRUE"""
+            sqldata = {}
+            if hide is True:
+                sql += """ AND "Hide" = 'N'"""
+            if active is not None:
+                sql += " AND {} = %(active)s".format(
+                    _dbinfo_column(cur, 'active'))
+                sqldata['active'] = bool(active)
+            if sites is not None:
+                sql += " AND {} = ANY(%(sites)s)".format(selected[0])
+                sqldata['sites'] = list(sites)
+            sql += " ORDER by {};".format(selected[0])
+            if debug:
+                print(sql)
+
+            if stream:
+                cur.close()
+                cur = conn.cursor(name='pcu_dbinfo')
+                cur.itersize = config.DBINFO_ITERSIZE
+            try:
+                cur.execute(sql, sqldata)
+                _profile_count('db_queries')
+                for row in cur:
+                    if debug:
+                        print("values:")
+                        print(row)
+                    info[row[0]] = dict(zip(colnames, row[1:]))
+            finally:
+                cur.close()
+    except Exception:
+        _clear_table_columns(*_DBINFO_TABLES)
+        raise
+
+    if debug:
+        print("nrows: " + str(len(info)))
+
+    return info
+
+######################################################################
+
+
+def dbinfo_roilist(sitename, roitype, seqno, debug=False):
+    ''' Get roilist info from database'''
+
+    rois = dbinfo_roilists(roilist=[(sitename, roitype, seqno)],
+                           debug=debug)
+
+    # return None if no rows
+    if len(rois) == 0:
+        return None
+
+    # create output dictionary keyed by sitename
+    info = {}
+    for key in sorted(rois.keys()):
+        info[key[0]] = rois[key]
+
+    return info
+
+######################################################################
+
+
+@_profiled
+def dbinfo_roilists(roilist=None, sitename=None, roitype=None,
+                    active=None, debug=False):
+    """
+    Get roi_roilist rows for many ROIs with a single query.  Rows can
+    be selected with:
+
+      Optional "roilist", a list of (sitename, roitype, seqno) tuples.
+
+      Optional "sitename", a sitename or list of sitenames.
+
+      Optional "roitype", a roitype or list of roitypes.
+
+      Optional "active", True or False to select only active or
+      inactive ROIs.
+
+    With no arguments all rows are returned.  The result is a
+    dictionary keyed by (site_id, roitype, sequence_number) where each
+    value is a dictionary of all the roi_roilist columns, as returned
+    by dbinfo_roilist().
+    """
+
+    tablename = 'roi_roilist'
+
+    sql = "SELECT * FROM {} WHERE TRUE".format(tablename)
+    sqldata = {}
+
+    if roilist is not None:
+        roilist = tuple(tuple(roi) for roi in roilist)
+        if len(roilist) == 0:
+            return {}
+        sql += " AND (site_id, roitype, sequence_number) IN %(rois)s"
+        sqldata['rois'] = roilist
+
+    if sitename is not None:
+        if isinstance(sitename, (list, tuple, set)):
+            sql += " AND site_id = ANY(%(sitenames)s)"
+            sqldata['sitenames'] = list(sitename)
+        else:
+            sql += " AND site_id = %(sitenames)s"
+            sqldata['sitenames'] = sitename
+
+    if roitype is not None:
+        if isinstance(roitype, (list, tuple, set)):
+            sql += " AND roitype = ANY(%(roitypes)s)"
+            sqldata['roitypes'] = list(roitype)
+        else:
+            sql += " AND roitype = %(roitypes)s"
+            sqldata['roitypes'] = roitype
+
+    if active is not None:
+        sql += " AND active = %(active)s"
+        sqldata['active'] = bool(active)
+
+    sql += " ORDER BY site_id, roitype, sequence_number;"
+
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+
+            # Get the column names
+            names = _table_columns(cur, tablename)
+            if debug:
+                print("Column Names:")
+                print(names)
+
+            cur.execute(sql, sqldata)
+            _profile_count('db_queries')
+            rows = cur.fetchall()
+            if len(cur.description) != len(names):
+                raise ValueError("Column names out of date.")
+    except Exception:
+        _clear_table_columns(tablename)
+        raise
+
+    if debug:
+        print("nrows: " + str(len(rows)))
+
+    siteidx = names.index('site_id')
+    typeidx = names.index('roitype')
+    seqidx = names.index('sequence_number')
+
+    info = {}
+    for row in rows:
+        if debug:
+            print("values:")
+            print(row)
+
+        key = (row[siteidx], row[typeidx], row[seqidx])
+        info[key] = dict(zip(names, row))
+
+    return info
+
+######################################################################
+
+
+@_profiled
+def get_roilists(linked=True, active=True, debug=False, full=False):
+    """
+    Make a list of sitenames  roilist info from database.  If "full"
+    is True each entry also has all the roi_roilist columns.
+    """
+
+    # get the data needed to make the list
+    tablename = 'roi_roilist'
+    if full:
+        sql1 = "SELECT * FROM {0}".format(tablename)
+    else:
+        sql1 = "SELECT site_id, roitype, " + \
+               "sequence_number, first_date FROM {0}".format(tablename)
+    sql2 = " where roitype ~ '[A-Z][A-Z]' AND "
+    if active:
+        sql3 = "active = TRUE AND "
+    else:
+        sql3 = "active = FALSE AND "
+
+    if linked:
+        sql4 = "show_link = TRUE "
+    else:
+        sql4 = "show_link = FALSE "
+
+    sql5 = "order by site_id, sequence_number;"
+    sql = sql1 + sql2 + sql3 + sql4 + sql5
+    if debug:
+        print(sql)
+
+    # execute query and retrieve rows
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            if full:
+                names = _table_columns(cur, tablename)
+            else:
+                names = ['site_id', 'roitype', 'sequence_number',
+                         'first_date']
+            cur.execute(sql)
+            _profile_count('db_queries')
+            rows = cur.fetchall()
+            if full and len(cur.description) != len(names):
+                raise ValueError("Column names out of date.")
+    except Exception:
+        if full:
+            _clear_table_columns(tablename)
+        raise
+
+    nrows = len(rows)
+    if debug:
+        print("nrows: " + str(nrows))
+
+    # return None if no rows
+    if nrows == 0:
+        return None
+
+    # assemble a list of dictionaries with sitename, roiname
+    outlist = []
+    for row in rows:
+        if debug:
+            print(row)
+
+        rowdict = dict(zip(names, row))
+        sitename = rowdict['site_id']
+        roitype = rowdict['roitype']
+        roi_seqno = rowdict['sequence_number']
+        first_date = rowdict['first_date']
+        roiname = "{0}_{1:04d}".format(roitype, roi_seqno)
+
+        if full:
+            entry = rowdict
+        else:
+            entry = {}
+        entry.update({'sitename': sitename,
+                      'roiname': roiname,
+                      'roitype': roitype,
+                      'roi_seqno': roi_seqno,
+                      'first_date': first_date})
+        outlist.append(entry)
+
+    return outlist
+
+######################################################################
+
+
+def get_user_id(username):
+    """
+    Retrieve the id field from auth_user given the username.
+    """
+
+    sql = "SELECT id from auth_user where username = %(username)s;"
+    sqldata = {'username': username}
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, sqldata)
+        _profile_count('db_queries')
+        ids = cur.fetchall()
+    if len(ids) != 1:
+        errmsg = "Error getting user id for {}\n".format(username)
+        sys.stderr.write(errmsg)
+        return None
+
+    id = ids[0][0]
+    return id
+
+######################################################################
@@ -0,0 +1,377 @@
+"""
+PhenoCam archive filename utilities: parsing and building "standard"
+image filenames and paths, and day of year conversions.  This module
+only needs the standard library (numpy is imported by
+fn2datetime_array() when it's called).
+"""
+
+import sys
+import re
+import datetime
+
+from . import config
+
+######################################################################
+
+
+def _archive_name_re(sitename):
+    """
+    Return a compiled regex matching "standard" archive filenames
+    for a site, i.e.
+
+          sitename_YYYY_MM_DD_HHNNSS.jpg
+          sitename_IR_YYYY_MM_DD_HHNNSS.jpg
+          sitename_YYYY_MM_DD_HHNNSS.meta
+          sitename_IR_YYYY_MM_DD_HHNNSS.meta
+
+    Groups are (IR, year, month, day, hour, minute, second, extension).
+    """
+
+    pattern = r"^%s(_IR)?_(\d{4})_(\d{2})_(\d{2})_" % (re.escape(sitename),)
+    pattern += r"(\d{2})(\d{2})(\d{2})\.(jpg|meta)$"
+    return re.compile(pattern)
+
+######################################################################
+
+
+def _archive_channel(irgroup, ext):
+    """
+    Map the IR group and extension of an archive filename onto the
+    channel name used in the archive index.
+    """
+
+    if ext == 'jpg':
+        if irgroup:
+            return 'IR'
+        return 'RGB'
+
+    if irgroup:
+        return 'IR_meta'
+    return 'meta'
+
+######################################################################
+
+
+def parse_archive_filename(sitename, filename):
+    """
+    Parse a "standard" archive image or metadata filename for a site.
+    Returns a tuple (channel, datetime) where channel is 'RGB', 'IR',
+    'meta' or 'IR_meta', or None if the name isn't a standard name
+    or doesn't give a valid date and time.
+    """
+
+    m = _archive_name_re(sitename).match(filename)
+    if m is None:
+        return None
+
+    (ir, yr, mo, dy, hr, mn, sc, ext) = m.groups()
+    try:
+        dt = datetime.datetime(int(yr), int(mo), int(dy), int(hr),
+                               int(mn), int(sc))
+    except ValueError:
+        return None
+
+    return _archive_channel(ir, ext), dt
+
+######################################################################
+
+
+def doy2date(year, doy, out='tuple'):
+    """
+    Convert year and yearday into calendar date. Output is a tuple
+    (out='tuple': default) ISO string (out='iso'), julian date
+    (out='julian'), or python date object (out='date')
+    """
+    year = int(year)
+    doy = int(doy)
+    thedate = datetime.date(year, 1, 1) + datetime.timedelta(doy-1)
+
+    if out == 'tuple':
+        return thedate.timetuple()[:3]
+    elif out == 'iso':
+        return thedate.isoformat()
+    elif out == 'julian':
+        return thedate.toordinal()
+    elif out == 'date':
+        return thedate
+    else:
+        return None
+
+######################################################################
+
+
+def date2doy(year, month, day):
+    """
+    Convert calendar date into year and yearday.
+    """
+    year = int(year)
+    month = int(month)
+    day = int(day)
+    thedate = datetime.date(year, month, day)
+    return (year, thedate.timetuple()[7])
+
+######################################################################
+
+
+def fn2date(sitename, filename, irFlag=False):
+    """
+    Function to extract the date from a "standard" filename based on a
+    sitename.  Here we assume the filename format is the standard:
+
+          sitename_YYYY_MM_DD_HHNNSS.jpg
+
+    So we just grab components from fixed positions.  If irFlag is
+    True then the "standard" format is:
+
+          sitename_IR_YYYY_MM_DD_HHNNSS.jpg
+
+    """
+
+    if irFlag:
+        prefix = sitename+"_IR"
+    else:
+        prefix = sitename
+
+    # set start of datetime part of name
+    nstart = len(prefix)+1
+
+    # assume 3-letter extension e.g. ".jpg"
+    dtstring = filename[nstart:-4]
+
+    # extract date-time pieces
+    try:
+        year = int(dtstring[0:4])
+        mon = int(dtstring[5:7])
+        day = int(dtstring[8:10])
+        hour = int(dtstring[11:13])
+        mins = int(dtstring[13:15])
+        sec = int(dtstring[15:17])
+    except ValueError:
+        print("Error extracting date from: {0}".format(filename))
+        return None
+
+    # return list
+    return [year, mon, day, hour, mins, sec]
+
+######################################################################
+
+
+def fn2datetime(sitename, filename, irFlag=False):
+    """
+    Function to extract the date from a "standard" filename based on a
+    sitename.  Here we assume the filename format is the standard:
+
+          sitename_YYYY_MM_DD_HHNNSS.jpg
+
+    So we just grab components from fixed positions.  If irFlag is
+    True then the "standard" format is:
+
+          sitename_IR_YYYY_MM_DD_HHNNSS.jpg
+
+    """
+
+    if irFlag:
+        prefix = sitename+"_IR"
+    else:
+        prefix = sitename
+
+    # set start of datetime part of name
+    nstart = len(prefix)+1
+
+    # assume 3-letter extension e.g. ".jpg"
+    dtstring = filename[nstart:-4]
+
+    # extract date-time pieces
+    try:
+        year = int(dtstring[0:4])
+        mon = int(dtstring[5:7])
+        day = int(dtstring[8:10])
+        hour = int(dtstring[11:13])
+        mins = int(dtstring[13:15])
+        sec = int(dtstring[15:17])
+    except ValueError:
+        print("Error extracting datetime from: {0}".format(filename))
+        return None
+
+    # return list
+    return datetime.datetime(year, mon, day, hour, mins, sec)
+
+######################################################################
+
+
+def datetime2fn(sitename, dt, irFlag=False):
+    """
+    Given a datetime object construct the "standard" image filename for the
+    a given site.
+    """
+
+    dt_str = dt.strftime('%Y_%m_%d_%H%M%S')
+
+    fn_base = sitename
+    if irFlag:
+        fn_base = '{0}_IR'.format(fn_base)
+
+    fn = '{0}_{1}.jpg'.format(fn_base, dt_str)
+
+    return fn
+
+######################################################################
+
+
+def fn2path(sitename, filename, irFlag=False):
+    """
+    Function to extract the date from a "standard" filename based on a
+    sitename.  Here we assume the filename format is the standard:
+
+          sitename_YYYY_MM_DD_HHNNSS.jpg
+
+    So we just grab components from fixed positions.  If irFlag is
+    True then the "standard" format is:
+
+          sitename_IR_YYYY_MM_DD_HHNNSS.jpg
+
+    """
+
+    if irFlag:
+        prefix = sitename+"_IR"
+    else:
+        prefix = sitename
+
+    # set start of datetime part of name
+    nstart = len(prefix)+1
+
+    # assume 3-letter extension e.g. ".jpg"
+    dtstring = filename[nstart:-4]
+
+    # extract date-time pieces
+    year = int(dtstring[0:4])
+    mon = int(dtstring[5:7])
+
+    # create path
+    archive_path = '%s/%s/%4.4d/%2.2d/%s' % (config.STARTDIR, sitename,
+                                             year, mon, filename,)
+
+    # return list
+    return archive_path
+
+######################################################################
+
+
+def fn2datetime_array(sitename, filenames, irFlag=False):
+    """
+    Batch version of fn2datetime().  Takes a list or array of
+    "standard" filenames (no directory part) for a site:
+
+          sitename_YYYY_MM_DD_HHNNSS.jpg
+          sitename_IR_YYYY_MM_DD_HHNNSS.jpg  (irFlag True)
+
+    and returns a tuple (datetimes, valid) of numpy arrays.  datetimes
+    has dtype datetime64[s] and is NaT wherever valid is False, i.e.
+    for any name which doesn't have the standard form or doesn't give
+    a valid date and time.  All the parsing is done with array
+    operations so there is no per-file python overhead.
+    """
+
+    import numpy as np
+
+    if irFlag:
+        prefix = sitename+"_IR"
+    else:
+        prefix = sitename
+
+    # set start of datetime part of name, assume 3-letter extension
+    nstart = len(prefix)+1
+    width = nstart + 21
+
+    names = np.asarray(filenames)
+    nnames = names.size
+    names = names.reshape(nnames)
+    if nnames == 0:
+        return (np.array([], dtype='datetime64[s]'),
+                np.array([], dtype=bool))
+
+    if names.dtype.kind == 'U':
+        names = np.char.encode(names, 'utf-8')
+
+    # fixed width 2-d array of characters.  Longer names are
+    # truncated here so check the lengths separately.
+    valid = np.char.str_len(names) == width
+    chars = np.frombuffer(names.astype('S%d' % (width,)).tobytes(),
+                          dtype=np.uint8).reshape(nnames, width)
+
+    expected = np.frombuffer((prefix + "_").encode('utf-8'),
+                             dtype=np.uint8)
+    valid &= np.all(chars[:, :nstart] == expected, axis=1)
+    for offset, char in ((4, '_'), (7, '_'), (10, '_'), (17, '.')):
+        valid &= chars[:, nstart + offset] == ord(char)
+
+    # digits for YYYY_MM_DD_HHNNSS
+    digitpos = nstart + np.array([0, 1, 2, 3, 5, 6, 8, 9,
+                                  11, 12, 13, 14, 15, 16])
+    digits = chars[:, digitpos].astype(np.int64) - ord('0')
+    valid &= np.all((digits >= 0) & (digits <= 9), axis=1)
+
+    year = digits[:, 0]*1000 + digits[:, 1]*100 + digits[:, 2]*10 + \
+        digits[:, 3]
+    mon = digits[:, 4]*10 + digits[:, 5]
+    day = digits[:, 6]*10 + digits[:, 7]
+    hour = digits[:, 8]*10 + digits[:, 9]
+    mins = digits[:, 10]*10 + digits[:, 11]
+    sec = digits[:, 12]*10 + digits[:, 13]
+    valid &= (mon >= 1) & (mon <= 12) & (day >= 1) & (hour < 24) & \
+        (mins < 60) & (sec < 60)
+
+    # zero out the invalid entries so the date arithmetic is safe
+    year = np.where(valid, year, 1970)
+    mon = np.where(valid, mon, 1)
+    day = np.where(valid, day, 1)
+
+    monthstart = ((year - 1970)*12 + mon - 1).astype('datetime64[M]')
+    daystart = monthstart.astype('datetime64[D]')
+    ndays = ((monthstart + 1).astype('datetime64[D]') -
+             daystart).astype(np.int64)
+    valid &= day <= ndays
+
+    seconds = hour*3600 + mins*60 + sec
+    datetimes = daystart.astype('datetime64[s]') + \
+        ((day - 1)*86400 + seconds).astype('timedelta64[s]')
+    datetimes[~valid] = np.datetime64('NaT')
+
+    return datetimes, valid
+
+######################################################################
+
+
+def dictprint(d, f=sys.stdout, keys=None):
+    """
+    Print the contents of a dictionary to a csv file.
+    Optional keyword 'keys' is an ordered list of any or all the keys
+    in d.
+    """
+    print(d)
+
+    if not keys:
+        keys = list(d.keys())
+    else:
+        if not all([k in d for k in keys]):
+            raise Exception('key mismatch in function dictprint')
+
+    nrows = len(d[keys[0]])
+    ncol = len(keys)
+    print(keys)
+    print(nrows, ncol)
+
+    for i, k in enumerate(keys):
+        if i < ncol-1:
+            f.write(str(k)+", ")
+        else:
+            f.write(str(k)+"\n")
+
+    for r in range(nrows):
+        for i, k in enumerate(keys):
+            if i < ncol-1:
+                f.write(str(d[k][r])+", ")
+            else:
+                f.write(str(d[k][r])+"\n")
+
+######################################################################
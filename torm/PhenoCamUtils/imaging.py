@@ -0,0 +1,408 @@
+"""
+Image utilities: JPEG completeness checks and gallery thumbnails.
+PIL is only imported when an image is first opened.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import multiprocessing
+
+from . import config
+from .profiling import _profiled, _profile_count, profiling_enabled
+from .archive import _listdir
+
+######################################################################
+
+
+@_profiled
+def check_jpeg(path, fast=False):
+    """
+    routine to check whether a jpeg file is complete
+    by reading it in using PIL.  Returns true if file
+    can be loaded in and False if load throws an error.
+
+    If fast is True the JPEG marker structure is checked first
+    without decoding any pixels (see _check_jpeg_markers()) and the
+    full decode is only done if that check is inconclusive.
+    """
+
+    if fast:
+        status = _check_jpeg_markers(path)
+        if status is not None:
+            return status
+
+    from PIL import Image
+
+    if profiling_enabled():
+        _profile_count('bytes_read', os.path.getsize(path))
+
+    # first try to open file in read-only mode ... this fails
+    # if the jpeg header is not complete but will succeed if the
+    # image file is truncated.
+    try:
+        im = Image.open(path, 'r')
+    except:
+        return False
+
+    # try to load file ... this fails if the image file is not
+    # complete.
+    try:
+        # data = im.load()
+        im.load()
+    except:
+        return False
+
+    return True
+
+######################################################################
+
+
+def _check_jpeg_markers(path):
+    """
+    Check the marker structure of a jpeg file without decoding it.
+    The header segments are walked from the SOI marker to the first
+    SOS (start of scan) marker and then the end of the file is checked
+    for the EOI marker.  Returns True if the structure is complete,
+    False if the file is not a jpeg or its header is truncated, and
+    None if a full decode is needed to decide (e.g. no EOI at the end
+    of the file).
+    """
+
+    try:
+        fh = open(path, 'rb')
+    except EnvironmentError:
+        return False
+
+    with fh:
+        size = os.fstat(fh.fileno()).st_size
+        if bytearray(fh.read(2)) != bytearray(b'\xff\xd8'):
+            return False
+
+        pos = 2
+        while True:
+            fh.seek(pos)
+            marker = bytearray(fh.read(4))
+            if len(marker) < 2:
+                return False
+            if marker[0] != 0xff:
+                return None
+            code = marker[1]
+
+            # fill byte
+            if code == 0xff:
+                pos += 1
+                continue
+
+            # markers without a length field
+            if (code == 0x01) | (0xd0 <= code <= 0xd7):
+                pos += 2
+                continue
+            if code == 0xd9:
+                return None
+
+            if len(marker) < 4:
+                return False
+            seglen = marker[2]*256 + marker[3]
+            if seglen < 2:
+                return None
+            if pos + 2 + seglen > size:
+                return False
+
+            # start of scan, the entropy coded data follows
+            if code == 0xda:
+                break
+            pos += 2 + seglen
+
+        fh.seek(size - 2)
+        if bytearray(fh.read(2)) == bytearray(b'\xff\xd9'):
+            return True
+
+    return None
+
+######################################################################
+
+
+def _check_jpeg_fast(path):
+    """
+    Pool worker for check_jpegs().
+    """
+
+    return path, check_jpeg(path, fast=True)
+
+######################################################################
+
+
+def _open_jpeg_cache(cachefile):
+    """
+    Open the check_jpegs() result cache, creating it if need be.
+    """
+
+    cachedir = os.path.dirname(cachefile)
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir)
+    conn = sqlite3.connect(cachefile, timeout=60)
+    try:
+        conn.execute("""CREATE TABLE IF NOT EXISTS jpeg_checks (
+                        path TEXT PRIMARY KEY, size INTEGER,
+                        mtime REAL, ok INTEGER);""")
+    except sqlite3.Error:
+        conn.close()
+        raise
+
+    return conn
+
+
+def check_jpegs(paths, nproc=4, cachefile=None):
+    """
+    Check many jpeg files with check_jpeg(fast=True) using a process
+    pool.  Results are kept in a sqlite cache (default
+    JPEG_CHECK_CACHE) keyed by path, size and mtime so only new or
+    changed files are checked again.  Set cachefile to False to skip
+    the cache.  If the cache can't be created or used the files are
+    checked without it.  Returns a dictionary of True/False keyed by
+    path.
+    """
+
+    if cachefile is None:
+        cachefile = config.JPEG_CHECK_CACHE
+
+    results = {}
+    stats = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            results[path] = False
+            continue
+        stats[path] = (st.st_size, st.st_mtime)
+
+    conn = None
+    if cachefile:
+        try:
+            conn = _open_jpeg_cache(cachefile)
+
+            # look up the cached results a chunk of paths at a time
+            statpaths = list(stats.keys())
+            for i in range(0, len(statpaths), 500):
+                chunk = statpaths[i:i+500]
+                sql = "SELECT path, size, mtime, ok FROM jpeg_checks " + \
+                      "WHERE path IN ({});".format(
+                          ",".join("?" * len(chunk)))
+                for path, size, mtime, ok in conn.execute(sql, chunk):
+                    if stats[path] == (size, mtime):
+                        results[path] = bool(ok)
+        except (OSError, sqlite3.Error) as e:
+            errmsg = "JPEG check cache {} unusable, not caching: {}\n"
+            sys.stderr.write(errmsg.format(cachefile, e))
+            if conn is not None:
+                conn.close()
+            conn = None
+
+    todo = [path for path in stats if path not in results]
+    if len(todo) > 0:
+        pool = multiprocessing.Pool(nproc)
+        try:
+            checked = pool.map(_check_jpeg_fast, todo, chunksize=32)
+        finally:
+            pool.close()
+            pool.join()
+        results.update(checked)
+
+        if conn is not None:
+            rows = [(path, stats[path][0], stats[path][1], int(ok))
+                    for path, ok in checked]
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO " +
+                                     "jpeg_checks VALUES (?, ?, ?, ?);",
+                                     rows)
+            except sqlite3.Error as e:
+                errmsg = "Unable to update JPEG check cache {}: {}\n"
+                sys.stderr.write(errmsg.format(cachefile, e))
+
+    if conn is not None:
+        conn.close()
+
+    return results
+
+######################################################################
+
+
+# thumbnail directories known to exist
+_thumb_dirs = set()
+
+
+@_profiled
+def make_thumb(infile, thumbfile):
+    """
+    make a thumbnail version (150x112) of an image for the gallery page
+    requires Image
+    """
+
+    # check if thumb already exists - don't worry about
+    # race condition since we're not going to open the
+    # file just create a web link to it.
+    if os.path.exists(thumbfile):
+        return
+
+    # make sure the directory exists
+    dirname = os.path.dirname(thumbfile)
+    if dirname not in _thumb_dirs:
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, mode=0o775)
+        _thumb_dirs.add(dirname)
+
+    # otherwise open infile assuming it's an image
+    from PIL import Image
+
+    if profiling_enabled():
+        _profile_count('bytes_read', os.path.getsize(infile))
+    im = Image.open(infile)
+    try:
+        thumb = im.resize((150, 112), resample=Image.LANCZOS)
+        thumb.save(thumbfile, "JPEG")
+    except:
+        errmsg = "Error reading {}\n".format(thumbfile)
+        sys.stderr.write(errmsg)
+        return
+
+    # set owner, group
+    # uid=0: root; gid=65534: nogroup
+    # os.chown(thumbfile,0,65534)
+
+    # set mode
+    # mode=0o644: -rw-rw-r--
+    os.chmod(thumbfile, 0o664)
+
+    return None
+
+######################################################################
+
+
+# thumbnail size used for the gallery pages
+THUMB_SIZE = (150, 112)
+
+
+def _make_thumb_draft(pair):
+    """
+    Pool worker for make_thumbs().  Uses JPEG draft mode so the image
+    is decoded at a reduced scale (DCT-domain downscaling) before the
+    final resize.  Returns (thumbfile, error) where error is None on
+    success.
+    """
+
+    from PIL import Image
+
+    infile, thumbfile = pair
+    try:
+        if profiling_enabled():
+            _profile_count('bytes_read', os.path.getsize(infile))
+        im = Image.open(infile)
+        im.draft('RGB', THUMB_SIZE)
+        thumb = im.resize(THUMB_SIZE, resample=Image.LANCZOS)
+        thumb.save(thumbfile, "JPEG")
+        os.chmod(thumbfile, 0o664)
+    except Exception as e:
+        return thumbfile, "{}".format(e)
+
+    return thumbfile, None
+
+######################################################################
+
+
+def make_thumbs(pairs, nproc=4, checkpoint=None, verbose=True,
+                report_every=1000):
+    """
+    Make thumbnails for a list of (infile, thumbfile) pairs using a
+    process pool.  Existing thumbnails are skipped, with a single
+    listing of each destination directory rather than a check per
+    file.
+
+      Optional "checkpoint", a file to which each completed thumbfile
+      is appended.  Thumbfiles listed in it are skipped, so an
+      interrupted run can be restarted with the same arguments.
+
+      Optional "verbose" which can be set to False to turn off the
+      progress report on stderr every "report_every" thumbnails.
+
+    Returns a tuple (nmade, nskipped, failed) where failed is a list
+    of (thumbfile, error message) tuples.
+    """
+
+    done = set()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint, 'r') as fh:
+            done = set(line.rstrip('\n') for line in fh)
+
+    # names in each destination directory
+    dircontents = {}
+
+    todo = []
+    nskipped = 0
+    for infile, thumbfile in pairs:
+        if thumbfile in done:
+            nskipped += 1
+            continue
+
+        dirname = os.path.dirname(thumbfile)
+        if dirname not in dircontents:
+            if os.path.isdir(dirname):
+                dircontents[dirname] = set(_listdir(dirname))
+            else:
+                os.makedirs(dirname, mode=0o775)
+                dircontents[dirname] = set()
+            _thumb_dirs.add(dirname)
+
+        if os.path.basename(thumbfile) in dircontents[dirname]:
+            nskipped += 1
+            continue
+
+        todo.append((infile, thumbfile))
+
+    ntodo = len(todo)
+    if verbose:
+        msg = "{} thumbnails to make, {} skipped\n".format(ntodo, nskipped)
+        sys.stderr.write(msg)
+
+    nmade = 0
+    failed = []
+    if ntodo == 0:
+        return nmade, nskipped, failed
+
+    if checkpoint is not None:
+        ckfh = open(checkpoint, 'a')
+    else:
+        ckfh = None
+
+    t0 = time.time()
+    pool = multiprocessing.Pool(nproc)
+    try:
+        results = pool.imap_unordered(_make_thumb_draft, todo, chunksize=16)
+        for ndone, (thumbfile, error) in enumerate(results, 1):
+            if error is None:
+                nmade += 1
+                if ckfh is not None:
+                    ckfh.write("{}\n".format(thumbfile))
+                    ckfh.flush()
+            else:
+                failed.append((thumbfile, error))
+
+            if verbose and (ndone % report_every == 0 or ndone == ntodo):
+                rate = ndone / max(time.time() - t0, 1e-6)
+                msg = "{}/{} thumbnails done, {} failed ({:.1f}/s)\n"
+                sys.stderr.write(msg.format(ndone, ntodo, len(failed),
+                                            rate))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if ckfh is not None:
+            ckfh.close()
+
+    return nmade, nskipped, failed
+
+######################################################################
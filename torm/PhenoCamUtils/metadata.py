@@ -0,0 +1,266 @@
+"""
+Camera metadata (.meta) files: parsing their key=value content and
+finding the latest metadata file uploaded by each camera to the FTP
+upload area.
+"""
+
+import os
+import time
+import threading
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .profiling import _profiled, _profile_count
+from .db import _read_snapshot, _write_snapshot
+
+######################################################################
+
+
+def parse_meta(text):
+    """
+    Parse the content of a .meta file.  Returns a dictionary of the
+    key=value lines with surrounding whitespace removed, lines without
+    an "=" are skipped.  If a key is repeated the last value is kept.
+    """
+
+    meta = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep == "" or key.strip() == "":
+            continue
+        meta[key.strip()] = value.strip()
+
+    return meta
+
+
+def read_meta(path):
+    """
+    Read and parse a .meta file, see parse_meta().
+    """
+
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    _profile_count('bytes_read', len(data))
+
+    return parse_meta(data.decode('utf-8', 'replace'))
+
+######################################################################
+
+
+def parse_meta_term(term):
+    """
+    Parse a "key=value" search term.  Returns (key, value), raises
+    ValueError if there's no "=".
+    """
+
+    key, sep, value = term.partition("=")
+    if sep == "" or key.strip() == "":
+        raise ValueError("term '{}' is not key=value".format(term))
+
+    return key.strip(), value.strip()
+
+
+def match_meta(meta, terms):
+    """
+    Return True if the parsed metadata meta has all the (key, value)
+    terms.  Keys and values are compared ignoring case.
+    """
+
+    lowered = dict((key.lower(), value.lower())
+                   for key, value in meta.items())
+    for key, value in terms:
+        if lowered.get(key.lower()) != value.lower():
+            return False
+
+    return True
+
+######################################################################
+
+
+def _latest_meta_entry(dirpath, names=None):
+    """
+    Find the .meta file in a directory with the latest mtime.  The
+    directory is read unless names, the .meta filenames it's known
+    to hold, is given, in which case only those files are checked.
+    Returns (path, mtime, size, names) for the latest file, names
+    being all the .meta filenames in the directory, or None if there
+    are none.  Only the latest entry is kept while the directory is
+    read.
+    """
+
+    latest = None
+    metanames = []
+
+    def check(name, stat):
+        try:
+            st = stat()
+        except OSError:
+            return None
+        _profile_count('stat')
+        metanames.append(name)
+        return (st.st_mtime, name, st.st_size)
+
+    if names is None:
+        with closing(os.scandir(dirpath)) as it:
+            nentries = 0
+            for entry in it:
+                nentries += 1
+                if not entry.name.endswith(".meta") or \
+                        entry.name.startswith("."):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                found = check(entry.name, entry.stat)
+                if found is not None and (latest is None or
+                                          found[:2] > latest[:2]):
+                    latest = found
+        _profile_count('listdir')
+        _profile_count('files', nentries)
+    else:
+        for name in names:
+            path = os.path.join(dirpath, name)
+            found = check(name, lambda: os.stat(path))
+            if found is not None and (latest is None or
+                                      found[:2] > latest[:2]):
+                latest = found
+
+    if latest is None:
+        return None
+
+    return (os.path.join(dirpath, latest[1]), latest[0], latest[2],
+            sorted(metanames))
+
+
+def _check_upload_dir(dirpath, cached):
+    """
+    Find and read the latest .meta file in an upload directory.
+    cached is the previous result for the directory (or None).  If
+    the directory hasn't changed since then the directory isn't read
+    again, but every .meta file found last time is checked, since any
+    of them may have been rewritten in place and become the latest.
+    The cached metadata is reused if the latest file is the same.
+    Returns the new result for the directory, a dictionary with the
+    directory mtime, the .meta filenames and the latest file's path,
+    mtime, size and parsed metadata (path None if there is no .meta
+    file).
+    """
+
+    dir_mtime = os.stat(dirpath).st_mtime
+    _profile_count('stat')
+
+    latest = None
+    if cached is not None and cached['dir_mtime'] == dir_mtime and \
+            'names' in cached:
+        if cached['path'] is None:
+            return cached
+        latest = _latest_meta_entry(dirpath, cached['names'])
+        if latest is not None and latest[:3] == (cached['path'],
+                                                 cached['mtime'],
+                                                 cached['size']):
+            return cached
+
+    if latest is None:
+        latest = _latest_meta_entry(dirpath)
+
+    # a directory modified in the last couple of seconds may still
+    # change without its mtime changing, so make sure it gets read
+    # again next time
+    if time.time() - dir_mtime < 2:
+        dir_mtime = -1
+
+    result = {'dir_mtime': dir_mtime, 'names': [], 'path': None,
+              'mtime': None, 'size': None, 'meta': {}}
+    if latest is not None:
+        (result['path'], result['mtime'], result['size'],
+         result['names']) = latest
+        try:
+            result['meta'] = read_meta(latest[0])
+        except OSError:
+            result['dir_mtime'] = -1
+
+    return result
+
+######################################################################
+
+
+# latest_meta_files() cache, loaded from META_SCAN_CACHE on first use
+_meta_scan_cache = None
+_meta_scan_lock = threading.Lock()
+
+
+@_profiled
+def latest_meta_files(datadir=None, nthreads=None, use_cache=True):
+    """
+    Find the latest (by mtime) .meta file in each directory of the FTP
+    upload area datadir (default FTP_DATADIR) and read it.  The
+    directories are scanned nthreads (default META_SCAN_THREADS) at a
+    time.  Directories whose mtime hasn't changed since the last call
+    (in this or an earlier process, see META_SCAN_CACHE) aren't read
+    again, only the .meta files found last time are checked for
+    rewrites, unless use_cache is False.
+
+    Returns a dictionary keyed by directory name with a (path,
+    metadata) tuple for every directory that has a .meta file, the
+    metadata being the parsed key=value content.
+    """
+
+    global _meta_scan_cache
+
+    if datadir is None:
+        datadir = config.FTP_DATADIR
+    if nthreads is None:
+        nthreads = config.META_SCAN_THREADS
+    datadir = os.path.abspath(datadir)
+
+    with _meta_scan_lock:
+        if _meta_scan_cache is None:
+            _meta_scan_cache = {}
+            if config.META_SCAN_CACHE is not None:
+                _meta_scan_cache = _read_snapshot(config.META_SCAN_CACHE,
+                                                  None) or {}
+        cached = {}
+        if use_cache:
+            cached = _meta_scan_cache.get(datadir, {})
+
+    with closing(os.scandir(datadir)) as it:
+        dirnames = sorted(entry.name for entry in it
+                          if entry.is_dir() and
+                          not entry.name.startswith("."))
+    _profile_count('listdir')
+    _profile_count('files', len(dirnames))
+
+    def check(dirname):
+        try:
+            return _check_upload_dir(os.path.join(datadir, dirname),
+                                     cached.get(dirname))
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(nthreads, 1)) as pool:
+        results = list(pool.map(check, dirnames))
+
+    scanned = {}
+    latest = {}
+    for dirname, result in zip(dirnames, results):
+        if result is None:
+            continue
+        scanned[dirname] = result
+        if result['path'] is not None:
+            latest[dirname] = (result['path'], result['meta'])
+
+    with _meta_scan_lock:
+        _meta_scan_cache[datadir] = scanned
+        if config.META_SCAN_CACHE is not None:
+            cachedir = os.path.dirname(config.META_SCAN_CACHE)
+            try:
+                if not os.path.exists(cachedir):
+                    os.makedirs(cachedir)
+            except OSError:
+                pass
+            _write_snapshot(config.META_SCAN_CACHE, _meta_scan_cache)
+
+    return latest
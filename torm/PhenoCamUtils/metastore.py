@@ -0,0 +1,436 @@
+"""
+Per-site columnar store of the parsed archive .meta files, updated
+incrementally, and queries of camera settings across sites and time
+ranges.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import tempfile
+from contextlib import closing
+
+import numpy as np
+
+from . import config
+from .profiling import _profiled, _profile_count
+from .archive import _archive_month_dirs
+from .filenames import parse_archive_filename
+from .metadata import read_meta
+
+######################################################################
+
+
+class SiteMetaStore(object):
+    """
+    Parsed .meta files for a site, kept in META_STORE_DIR/<sitename>/
+    as append-only columns:
+
+      records.bin  one RECORD_DTYPE record per .meta file: the image
+                   timestamp (seconds since 1970-01-01 in the archive's
+                   local standard time, as in the filenames), channel
+                   code (0 for RGB, 1 for IR) and file mtime
+      pairs.bin    one PAIR_DTYPE entry per key=value line: record
+                   number, key id and value id
+      keys.txt     the key and value strings, one JSON string per
+      values.txt   line, numbered from 0
+
+    update() appends the .meta files which are new or have changed
+    since they were stored.  Month directories whose mtime hasn't
+    changed (recorded in months.json) aren't read at all, apart from
+    the site's last few months (see META_STORE_RECHECK_MONTHS), so a
+    file rewritten in place in an older month, which leaves the
+    directory mtime alone, is only picked up by an update which
+    rechecks every month.  A file which changes is stored again and
+    the newer record is used.  Queries are answered from the columns
+    without reading the archive.
+    """
+
+    CHANNELS = ('meta', 'IR_meta')
+    RECORD_DTYPE = np.dtype([('time', '<i8'), ('channel', 'u1'),
+                             ('mtime', '<f8')])
+    PAIR_DTYPE = np.dtype([('record', '<u4'), ('key', '<u2'),
+                           ('value', '<u4')])
+
+    def __init__(self, sitename, storedir=None):
+        self.sitename = sitename
+        if storedir is None:
+            storedir = os.path.join(config.META_STORE_DIR, sitename)
+        self.storedir = storedir
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.storedir, name)
+
+    @staticmethod
+    def _read_strings(path):
+        """
+        Read a string table.  Returns the strings and the length of the
+        file up to the last complete entry.
+        """
+
+        strings = []
+        nbytes = 0
+        try:
+            with open(path, 'rb') as fh:
+                for line in fh:
+                    if not line.endswith(b'\n'):
+                        break
+                    strings.append(json.loads(line.decode('utf-8')))
+                    nbytes += len(line)
+        except (IOError, OSError):
+            pass
+
+        return strings, nbytes
+
+    @staticmethod
+    def _read_column(path, dtype):
+        """
+        Memory-map a column file, ignoring any incomplete entry at
+        the end.
+        """
+
+        try:
+            nitems = os.path.getsize(path) // dtype.itemsize
+        except OSError:
+            nitems = 0
+        if nitems == 0:
+            return np.zeros(0, dtype=dtype)
+
+        return np.memmap(path, dtype=dtype, mode='r', shape=(nitems,))
+
+    def _load(self):
+        """
+        (Re)read the store.  Entries left by an interrupted update
+        (pairs for records which weren't written) are ignored.  The
+        files are read in the reverse of the order update() appends
+        to them, records first and strings last, so that everything
+        the loaded records refer to has been read even if an update
+        is running.
+        """
+
+        self.records = self._read_column(self._path("records.bin"),
+                                         self.RECORD_DTYPE)
+        pairs = self._read_column(self._path("pairs.bin"), self.PAIR_DTYPE)
+        npairs = int(np.searchsorted(pairs['record'], len(self.records)))
+        self.pairs = pairs[:npairs]
+        self.keys, self._keys_nbytes = \
+            self._read_strings(self._path("keys.txt"))
+        self.values, self._values_nbytes = \
+            self._read_strings(self._path("values.txt"))
+        _profile_count('files', 4)
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def _timestamp(dt):
+        return int(np.datetime64(dt, 's').astype('int64'))
+
+    ##################################################################
+
+    def _truncate(self):
+        """
+        Cut the files back to the loaded entries before appending.
+        """
+
+        for name, size in (("keys.txt", self._keys_nbytes),
+                           ("values.txt", self._values_nbytes),
+                           ("records.bin",
+                            len(self.records) * self.RECORD_DTYPE.itemsize),
+                           ("pairs.bin",
+                            len(self.pairs) * self.PAIR_DTYPE.itemsize)):
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+
+    def _read_months(self):
+        try:
+            with open(self._path("months.json")) as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write_months(self, months):
+        fd, tmppath = tempfile.mkstemp(dir=self.storedir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(months, fh, sort_keys=True)
+            os.chmod(tmppath, 0o664)
+            os.rename(tmppath, self._path("months.json"))
+        except Exception:
+            os.unlink(tmppath)
+            raise
+
+    @_profiled
+    def update(self, recheck_months=None):
+        """
+        Append the .meta files which are new or have changed since the
+        last update.  The site's last recheck_months (default
+        META_STORE_RECHECK_MONTHS, a negative number for all) month
+        directories are listed even if their mtime hasn't changed, to
+        find files rewritten in place.  Returns the number of files
+        stored.
+        """
+
+        if recheck_months is None:
+            recheck_months = config.META_STORE_RECHECK_MONTHS
+
+        if not os.path.exists(self.storedir):
+            os.makedirs(self.storedir)
+
+        with open(self._path(".lock"), 'a') as lockfh:
+            fcntl.flock(lockfh, fcntl.LOCK_EX)
+            self._load()
+            self._truncate()
+            return self._update(recheck_months)
+
+    def _update(self, recheck_months):
+        months = self._read_months()
+
+        # file mtime of what's stored for each (channel, time)
+        stored = dict(zip(zip(self.records['channel'].tolist(),
+                              self.records['time'].tolist()),
+                          self.records['mtime'].tolist()))
+        key_ids = dict((key, i) for i, key in enumerate(self.keys))
+        value_ids = dict((value, i) for i, value in enumerate(self.values))
+        nkeys = len(self.keys)
+        nvalues = len(self.values)
+
+        monthdirs = _archive_month_dirs(self.sitename)
+        if recheck_months < 0:
+            recheck_from = 0
+        else:
+            recheck_from = len(monthdirs) - recheck_months
+
+        records = []
+        pairs = []
+        for imonth, (year, month, monpath) in enumerate(monthdirs):
+            monkey = "%4.4d/%2.2d" % (year, month)
+            try:
+                _profile_count('stat')
+                dir_mtime = os.stat(monpath).st_mtime
+                if months.get(monkey) == dir_mtime and \
+                        imonth < recheck_from:
+                    continue
+                with closing(os.scandir(monpath)) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            _profile_count('listdir')
+            _profile_count('files', len(entries))
+
+            for entry in sorted(entries, key=lambda x: x.name):
+                parsed = parse_archive_filename(self.sitename, entry.name)
+                if parsed is None or parsed[0] not in self.CHANNELS:
+                    continue
+                code = self.CHANNELS.index(parsed[0])
+                ts = self._timestamp(parsed[1])
+                try:
+                    _profile_count('stat')
+                    mtime = entry.stat().st_mtime
+                    if stored.get((code, ts), -1) >= mtime:
+                        continue
+                    meta = read_meta(entry.path)
+                except OSError:
+                    continue
+
+                irecord = len(self.records) + len(records)
+                records.append((ts, code, mtime))
+                stored[(code, ts)] = mtime
+                for key, value in meta.items():
+                    if key not in key_ids:
+                        key_ids[key] = len(key_ids)
+                    if value not in value_ids:
+                        value_ids[value] = len(value_ids)
+                    pairs.append((irecord, key_ids[key], value_ids[value]))
+
+            # a directory modified in the last couple of seconds may
+            # still change without its mtime changing
+            if time.time() - dir_mtime < 2:
+                dir_mtime = -1
+            months[monkey] = dir_mtime
+
+        if len(key_ids) > 65536:
+            raise ValueError("too many metadata keys for {}".format(
+                self.sitename))
+
+        # strings first and records last, so an interrupted update
+        # leaves nothing that _load() would use
+        self._append_strings("keys.txt", sorted(key_ids, key=key_ids.get),
+                             nkeys)
+        self._append_strings("values.txt",
+                             sorted(value_ids, key=value_ids.get), nvalues)
+        with open(self._path("pairs.bin"), 'ab') as fh:
+            fh.write(np.array(pairs, dtype=self.PAIR_DTYPE).tobytes())
+        with open(self._path("records.bin"), 'ab') as fh:
+            fh.write(np.array(records, dtype=self.RECORD_DTYPE).tobytes())
+        self._write_months(months)
+
+        self._load()
+        return len(records)
+
+    def _append_strings(self, name, strings, nold):
+        with open(self._path(name), 'ab') as fh:
+            for s in strings[nold:]:
+                fh.write(json.dumps(s).encode('utf-8') + b'\n')
+
+    ##################################################################
+
+    def _current(self, startDT=None, endDT=None, irFlag=False):
+        """
+        Return the record numbers in a channel between startDT and
+        endDT (inclusive, either may be None) in time order, using the
+        newest record where a file has been stored more than once.
+        """
+
+        times = self.records['time']
+        mask = self.records['channel'] == int(bool(irFlag))
+        if startDT is not None:
+            t0 = self._timestamp(startDT)
+            if startDT.microsecond > 0:
+                t0 += 1
+            mask &= times >= t0
+        if endDT is not None:
+            mask &= times <= self._timestamp(endDT)
+
+        irecords = np.nonzero(mask)[0]
+        order = np.lexsort((irecords, times[irecords]))
+        irecords = irecords[order]
+
+        # keep the last record for each time
+        rtimes = times[irecords]
+        last = np.ones(len(irecords), dtype=bool)
+        last[:-1] = rtimes[1:] != rtimes[:-1]
+
+        return irecords[last]
+
+    def _ids(self, strings, wanted):
+        """
+        Return the ids of the strings equal to wanted ignoring case.
+        """
+
+        wanted = wanted.lower()
+        return [i for i, s in enumerate(strings) if s.lower() == wanted]
+
+    def series(self, key, startDT=None, endDT=None, irFlag=False):
+        """
+        Return the values of a metadata key (compared ignoring case)
+        between startDT and endDT (inclusive) as an array of image
+        times (datetime64[s]) and a list of value strings, in time
+        order.  Files without the key are left out.
+        """
+
+        irecords = self._current(startDT, endDT, irFlag=irFlag)
+        pairs = self.pairs[np.isin(self.pairs['key'],
+                                   self._ids(self.keys, key))]
+        pairs = pairs[np.isin(pairs['record'], irecords)]
+
+        # one value per record, the last line if the key is repeated
+        # with different case
+        order = np.argsort(pairs['record'], kind='stable')
+        pairs = pairs[order]
+        last = np.ones(len(pairs), dtype=bool)
+        last[:-1] = pairs['record'][1:] != pairs['record'][:-1]
+        pairs = pairs[last]
+
+        times = self.records['time'][pairs['record']]
+        order = np.argsort(times, kind='stable')
+        values = [self.values[i] for i in pairs['value'][order]]
+
+        return times[order].astype('datetime64[s]'), values
+
+    def meta(self, startDT=None, endDT=None, irFlag=False):
+        """
+        Return a list of (datetime, metadata dictionary) for the .meta
+        files between startDT and endDT (inclusive) in time order.
+        """
+
+        irecords = self._current(startDT, endDT, irFlag=irFlag)
+        pairs = self.pairs[np.isin(self.pairs['record'], irecords)]
+
+        metas = dict((int(i), {}) for i in irecords)
+        for irecord, ikey, ivalue in pairs.tolist():
+            metas[irecord][self.keys[ikey]] = self.values[ivalue]
+
+        dts = self.records['time'][irecords].astype('datetime64[s]')
+        return [(dt, metas[int(i)])
+                for dt, i in zip(dts.astype(object), irecords)]
+
+######################################################################
+
+
+def meta_store_sites():
+    """
+    Return the sites which have a metadata store.
+    """
+
+    if config.META_STORE_DIR is None or \
+            not os.path.exists(config.META_STORE_DIR):
+        return []
+
+    return sorted(x for x in os.listdir(config.META_STORE_DIR)
+                  if os.path.exists(os.path.join(config.META_STORE_DIR,
+                                                 x, "records.bin")))
+
+
+@_profiled
+def update_meta_store(sitename, recheck_months=None):
+    """
+    Bring the metadata store for a site up to date, see
+    SiteMetaStore.update().  Returns the number of .meta files stored,
+    or None if the stores are disabled.
+    """
+
+    if config.META_STORE_DIR is None:
+        return None
+
+    return SiteMetaStore(sitename).update(recheck_months=recheck_months)
+
+
+@_profiled
+def query_meta(key, value=None, sites=None, startDT=None, endDT=None,
+               irFlag=False, latest=False):
+    """
+    Query the metadata stores for a key, e.g. which cameras are on
+    auto white balance:
+
+        query_meta('balance', '1', latest=True)
+
+    or the exposure history for a site:
+
+        query_meta('exposure', sites=['harvard'], startDT=...)
+
+    Keys and values are compared ignoring case.  With value None every
+    value of the key is returned.  sites (default all sites with a
+    store) may be a sitename or a list.  With latest True only the
+    newest .meta file with the key between startDT and endDT is
+    considered for each site.
+
+    Returns a list of (sitename, datetime, value) tuples sorted by
+    site and time.
+    """
+
+    if sites is None:
+        sites = meta_store_sites()
+    elif isinstance(sites, str):
+        sites = [sites]
+
+    results = []
+    for sitename in sorted(sites):
+        try:
+            store = SiteMetaStore(sitename)
+        except ValueError as e:
+            sys.stderr.write("{}: {}\n".format(sitename, e))
+            continue
+        times, values = store.series(key, startDT, endDT, irFlag=irFlag)
+        if latest:
+            times = times[-1:]
+            values = values[-1:]
+        for dt, v in zip(times.astype(object), values):
+            if value is None or v.lower() == value.lower():
+                results.append((sitename, dt, v))
+
+    return results
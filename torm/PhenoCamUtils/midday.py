@@ -0,0 +1,530 @@
+"""
+Selection of the daily images closest to midday or other target times
+of day, and the midday image lists and binary midday image store.
+The selection works with the standard library alone, numpy is
+imported by the functions which need it (solar_noon_table() and the
+midday store) and used for faster selection when it's available.
+"""
+
+import os
+import json
+import time
+import tempfile
+import math
+import datetime
+from math import fabs
+
+from . import config
+from .profiling import _profiled
+from .filenames import date2doy, fn2date, fn2datetime, fn2datetime_array, \
+    datetime2fn, fn2path, parse_archive_filename
+from .archive import getDayImageList, getFirstImagePath, \
+    getLastImagePath, _month_image_names
+
+######################################################################
+
+
+@_profiled
+def getMiddayImage(sitename, year, month, day, irFlag=False):
+    """
+    Get the list of images for a particular day and return the
+    one closest to midday.
+    """
+
+    imlist = getDayImageList(sitename, year, month, day, irFlag=irFlag)
+
+    # check for empty list
+    if len(imlist) == 0:
+        return ""
+
+    tmlist = []
+
+    for impath in imlist:
+        fname = os.path.basename(impath)
+        date = fn2date(sitename, fname, irFlag=irFlag)
+        hour = date[3] + date[4]/60. + date[5]/3600.
+        fromnoon = fabs(hour - 12.)
+        tmlist.append((fromnoon, impath,))
+
+    # find one with lowest time
+    sorted_tmlist = sorted(tmlist)
+
+    return sorted_tmlist[0][1]
+
+######################################################################
+
+
+def solar_noon_table(lon, year, utc_offset=None):
+    """
+    Return a numpy array (a list if numpy isn't available) with the
+    time of solar noon, in decimal hours of local standard time, for
+    each day of a year (index doy-1, 366 entries).  lon is in degrees
+    east.  utc_offset is the site's standard time offset from UTC in
+    hours; if it's not given the time zone is taken to be centred on
+    the nearest multiple of 15 degrees of longitude.  The equation of
+    time uses the usual three-term approximation which is good to
+    about a minute.
+    """
+
+    if utc_offset is None:
+        utc_offset = round(lon / 15.)
+
+    ndays = (datetime.date(year + 1, 1, 1) - datetime.date(year, 1, 1)).days
+
+    try:
+        import numpy as np
+    except ImportError:
+        table = []
+        for doy in range(1, 367):
+            b = 2. * math.pi * (doy - 81) / (ndays - 1)
+            eqtime = 9.87 * math.sin(2. * b) - 7.53 * math.cos(b) - \
+                1.5 * math.sin(b)
+            offset = 4. * (lon - 15. * utc_offset) + eqtime
+            table.append(12. - offset / 60.)
+        return table
+
+    doy = np.arange(1, 367)
+    b = 2. * np.pi * (doy - 81) / (ndays - 1)
+    eqtime = 9.87 * np.sin(2. * b) - 7.53 * np.cos(b) - 1.5 * np.sin(b)
+
+    # minutes of solar time ahead of (+) or behind (-) the zone meridian
+    offset = 4. * (lon - 15. * utc_offset) + eqtime
+
+    return 12. - offset / 60.
+
+######################################################################
+
+
+@_profiled
+def getMonthTargetImages(sitename, year, month, targets, irFlag=False,
+                         names=None):
+    """
+    Select the image closest to each of a set of target times for
+    every day in a month which has images.  targets is a dictionary
+    keyed by target name whose values are either a time of day in
+    decimal hours (e.g. 12. for midday) or an array of decimal hours
+    indexed by day of year - 1 (e.g. from solar_noon_table()) for the
+    year.  Returns a dictionary keyed by target name of dictionaries
+    keyed by day of month with the image path.
+
+    The month directory is listed once and each filename parsed once
+    whatever the number of targets.  Ties are resolved the same way
+    getMiddayImage() does.  If the caller already has the month's
+    image filenames for the channel they can be passed as names and
+    the directory isn't listed at all.
+    """
+
+    if irFlag:
+        channel = 'IR'
+    else:
+        channel = 'RGB'
+
+    if names is None:
+        names = _month_image_names(sitename, year, month, channel)
+    imdir = os.path.join(config.STARTDIR, sitename, "%4.4d" % (year,),
+                         "%2.2d" % (month,))
+
+    try:
+        import numpy as np
+    except ImportError:
+        return _select_month_targets(sitename, imdir, names, channel,
+                                     targets)
+
+    selected = dict((name, {}) for name in targets)
+    fnames = np.array(names)
+    dts, valid = fn2datetime_array(sitename, fnames, irFlag=irFlag)
+    fnames = fnames[valid]
+    dts = dts[valid]
+    if fnames.size == 0:
+        return selected
+
+    # same arithmetic as getMiddayImage() so ties are resolved the
+    # same way
+    days = dts.astype('datetime64[D]')
+    sod = (dts - days).astype(np.int64)
+    hour = sod // 3600 + (sod % 3600 // 60)/60. + (sod % 60)/3600.
+    doy0 = (days - days.astype('datetime64[Y]')).astype(np.int64)
+
+    for name, target in targets.items():
+        if np.ndim(target) > 0:
+            target = np.asarray(target)[doy0]
+        fromtarget = np.abs(hour - target)
+
+        # sort by day, then distance from target, then filename and
+        # take the first entry for each day
+        order = np.lexsort((fnames, fromtarget, days))
+        tdays = days[order].astype(object)
+        ifirst = np.unique(days[order], return_index=True)[1]
+        for i in ifirst:
+            selected[name][tdays[i].day] = os.path.join(
+                imdir, str(fnames[order[i]]))
+
+    return selected
+
+
+def _select_month_targets(sitename, imdir, names, channel, targets):
+    """
+    Pure Python version of the getMonthTargetImages() selection, used
+    when numpy isn't available.  Gives the same result one filename
+    at a time.
+    """
+
+    images = []
+    for fname in names:
+        parsed = parse_archive_filename(sitename, fname)
+        if parsed is not None and parsed[0] == channel:
+            images.append((parsed[1], fname))
+
+    selected = {}
+    for name, target in targets.items():
+        best = {}
+        for dt, fname in images:
+            hour = dt.hour + dt.minute/60. + dt.second/3600.
+            if hasattr(target, '__getitem__'):
+                fromtarget = abs(hour - target[dt.timetuple().tm_yday - 1])
+            else:
+                fromtarget = abs(hour - target)
+            if dt.day not in best or (fromtarget, fname) < best[dt.day]:
+                best[dt.day] = (fromtarget, fname)
+        selected[name] = dict((day, os.path.join(imdir, fname))
+                              for day, (fromtarget, fname) in best.items())
+
+    return selected
+
+######################################################################
+
+
+@_profiled
+def getTargetImageRange(sitename, date_first, date_last, targets,
+                        irFlag=False):
+    """
+    Return a dictionary keyed by target name with a list of the
+    selected image path for each day from date_first to date_last
+    (inclusive), an empty string for days without images.  targets
+    is as for getMonthTargetImages() except that per-day targets are
+    given as a function of the year returning the table for the year
+    (e.g. functools.partial(solar_noon_table, lon)).  The tables are
+    computed once per year and each month directory is listed once.
+    """
+
+    lists = dict((name, []) for name in targets)
+    selected = {}
+    month = None
+    tables = {}
+
+    mydate = date_first
+    while mydate <= date_last:
+        if (mydate.year, mydate.month) != month:
+            month = (mydate.year, mydate.month)
+            if mydate.year not in tables:
+                tables[mydate.year] = {}
+                for name, target in targets.items():
+                    if callable(target):
+                        target = target(mydate.year)
+                    tables[mydate.year][name] = target
+            selected = getMonthTargetImages(sitename, mydate.year,
+                                            mydate.month,
+                                            tables[mydate.year],
+                                            irFlag=irFlag)
+
+        for name in targets:
+            lists[name].append(selected[name].get(mydate.day, ""))
+        mydate = mydate + datetime.timedelta(days=1)
+
+    return lists
+
+######################################################################
+
+
+def getMonthMiddayImages(sitename, year, month, irFlag=False):
+    """
+    Return a dictionary keyed by day of month with the path of the
+    image closest to midday for every day in the month which has
+    images.  The month directory is listed once and each filename
+    parsed once, the selection is the same as getMiddayImage() makes
+    one day at a time.
+    """
+
+    return getMonthTargetImages(sitename, year, month, {'midday': 12.},
+                                irFlag=irFlag)['midday']
+
+######################################################################
+
+
+def getMiddayImageRange(sitename, date_first, date_last, irFlag=False):
+    """
+    Return a list with the path of the midday image for each day from
+    date_first to date_last (inclusive).  Days without images get an
+    empty string.  Each month directory is listed only once.
+    """
+
+    return getTargetImageRange(sitename, date_first, date_last,
+                               {'midday': 12.}, irFlag=irFlag)['midday']
+
+######################################################################
+
+
+@_profiled
+def getMidDayImageList(sitename, irFlag=False):
+    """
+    Get List of Mid-day images for this site.
+    """
+
+    midDayList = []
+
+    # get date of first image
+    firstPath = getFirstImagePath(sitename, irFlag=irFlag)
+    if firstPath == '':
+        return []
+
+    firstDT = fn2datetime(sitename, os.path.basename(firstPath),
+                          irFlag=irFlag)
+    firstDate = firstDT.date()
+
+    # get last image path
+    lastPath = getLastImagePath(sitename, irFlag=irFlag)
+    lastDT = fn2datetime(sitename, os.path.basename(lastPath),
+                         irFlag=irFlag)
+    lastDate = lastDT.date()
+
+    # get the mid-day image for each date
+    midDayList = getMiddayImageRange(sitename, firstDate, lastDate,
+                                     irFlag=irFlag)
+
+    return midDayList
+
+######################################################################
+
+
+@_profiled
+def serializeMidDayImgList(sitename, irFlag=False):
+    """
+    Get List of Mid-day images for this site and serialize into JSON.
+    """
+
+    midDayList = []
+
+    # get date of first image
+    firstPath = getFirstImagePath(sitename, irFlag=irFlag)
+    firstDT = fn2datetime(sitename, os.path.basename(firstPath),
+                          irFlag=irFlag)
+    firstDate = firstDT.date()
+
+    # get last image path
+    lastPath = getLastImagePath(sitename, irFlag=irFlag)
+    lastDT = fn2datetime(sitename, os.path.basename(lastPath),
+                         irFlag=irFlag)
+    lastDate = lastDT.date()
+
+    middayimgs = getMiddayImageRange(sitename, firstDate, lastDate,
+                                     irFlag=irFlag)
+
+    # for each date get the mid-day image
+    myDate = firstDate
+    for middayimg in middayimgs:
+        year = myDate.year
+        month = myDate.month
+        day = myDate.day
+        (year2, doy) = date2doy(year, month, day)
+        daynoon = datetime.datetime(year, month, day, 12, 0, 0)
+        timems = int(time.mktime(daynoon.timetuple()))
+
+        myvals = {'year': year,
+                  'doy': doy,
+                  'timems': timems,
+                  'path': middayimg}
+
+        midDayList.append(myvals)
+
+        myDate = myDate + datetime.timedelta(days=1)
+
+    return midDayList
+
+######################################################################
+
+
+# record layout (numpy dtype description) of the binary midday image
+# store, one record per day from the first date: days since
+# 1970-01-01, seconds after midnight of the midday image (-1 if there's
+# no image) and channel (0 RGB, 1 IR)
+MIDDAY_STORE_DTYPE = [('day', '<i4'),
+                      ('offset', '<i4'),
+                      ('channel', 'u1')]
+
+
+def midday_store_path(sitename, irFlag=False):
+    """
+    Return the path of the binary midday image store for a site.
+    It sits next to the <sitename>-midday.txt list.
+    """
+
+    if irFlag:
+        outfile = "{}_IR-midday.npy".format(sitename)
+    else:
+        outfile = "{}-midday.npy".format(sitename)
+
+    return os.path.join(config.STARTDIR, sitename, "ROI", outfile)
+
+######################################################################
+
+
+def make_midday_records(sitename, date_first, paths, irFlag=False):
+    """
+    Convert a list of midday image paths, one per day starting at
+    date_first with "" for days with no image (as returned by
+    getMiddayImageRange()), into a midday store record array.
+    """
+
+    import numpy as np
+
+    dtype = np.dtype(MIDDAY_STORE_DTYPE)
+    npaths = len(paths)
+    records = np.zeros(npaths, dtype=dtype)
+    day0 = (date_first - datetime.date(1970, 1, 1)).days
+    records['day'] = np.arange(day0, day0 + npaths)
+    records['channel'] = int(bool(irFlag))
+
+    fnames = [os.path.basename(path) for path in paths]
+    dts, valid = fn2datetime_array(sitename, fnames, irFlag=irFlag)
+    secs = dts[valid].astype('int64')
+    offsets = secs - records['day'][valid].astype('int64') * 86400
+    info = np.iinfo(dtype['offset'])
+    bad = (offsets < info.min) | (offsets > info.max)
+    if bad.any():
+        errmsg = "midday image {} is too far from its list date {}"
+        ibad = np.flatnonzero(valid)[np.argmax(bad)]
+        raise ValueError(errmsg.format(
+            paths[ibad], date_first + datetime.timedelta(int(ibad))))
+    records['offset'] = -1
+    records['offset'][valid] = offsets
+
+    return records
+
+######################################################################
+
+
+def write_midday_store(sitename, date_first, paths, irFlag=False,
+                       outpath=None):
+    """
+    Write the binary midday image store for a site from a list of
+    midday image paths (see make_midday_records()).  The store is
+    written to a temporary file and renamed into place.
+    """
+
+    import numpy as np
+
+    if outpath is None:
+        outpath = midday_store_path(sitename, irFlag=irFlag)
+    records = make_midday_records(sitename, date_first, paths,
+                                  irFlag=irFlag)
+
+    outdir = os.path.dirname(os.path.abspath(outpath))
+    fd, tmppath = tempfile.mkstemp(dir=outdir, suffix='.npy')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, records)
+        os.chmod(tmppath, 0o664)
+        os.rename(tmppath, outpath)
+    except Exception:
+        os.unlink(tmppath)
+        raise
+
+    return len(records)
+
+######################################################################
+
+
+def read_midday_store(sitename, irFlag=False, inpath=None):
+    """
+    Memory-map the binary midday image store for a site.  Returns
+    None if there isn't one.
+    """
+
+    import numpy as np
+
+    if inpath is None:
+        inpath = midday_store_path(sitename, irFlag=irFlag)
+    if not os.path.exists(inpath):
+        return None
+
+    records = np.load(inpath, mmap_mode='r')
+    if records.dtype != np.dtype(MIDDAY_STORE_DTYPE):
+        raise ValueError("{} is not a midday image store".format(inpath))
+
+    return records
+
+######################################################################
+
+
+def _midday_record_path(sitename, record):
+    """
+    Rebuild the archive path for a midday store record, "" if there
+    was no image that day.
+    """
+
+    offset = int(record['offset'])
+    if offset < 0:
+        return ""
+
+    irFlag = record['channel'] == 1
+    dt = datetime.datetime(1970, 1, 1) + \
+        datetime.timedelta(days=int(record['day']), seconds=offset)
+    fname = datetime2fn(sitename, dt, irFlag=irFlag)
+    return fn2path(sitename, fname, irFlag=irFlag)
+
+
+def midday_store_image(sitename, records, mydate):
+    """
+    Look up the midday image path for a date in a midday store record
+    array.  Returns "" if there is no image for the date or the date
+    is outside the store.
+    """
+
+    if len(records) == 0:
+        return ""
+
+    day = (mydate - datetime.date(1970, 1, 1)).days
+    i = day - int(records[0]['day'])
+    if i < 0 or i >= len(records):
+        return ""
+
+    return _midday_record_path(sitename, records[i])
+
+######################################################################
+
+
+def iter_midday_store(sitename, records):
+    """
+    Generator yielding the midday store records as dictionaries with
+    the same keys and values as the serializeMidDayImgList() entries.
+    """
+
+    for record in records:
+        mydate = datetime.date(1970, 1, 1) + \
+            datetime.timedelta(days=int(record['day']))
+        (year, doy) = date2doy(mydate.year, mydate.month, mydate.day)
+        daynoon = datetime.datetime(year, mydate.month, mydate.day,
+                                    12, 0, 0)
+        timems = int(time.mktime(daynoon.timetuple()))
+
+        yield {'year': year,
+               'doy': doy,
+               'timems': timems,
+               'path': _midday_record_path(sitename, record)}
+
+
+def write_midday_json(sitename, records, f):
+    """
+    Write the midday store records to the open file f as a JSON list
+    in the serializeMidDayImgList() format, one entry at a time.
+    """
+
+    f.write('[')
+    sep = ''
+    for myvals in iter_midday_store(sitename, records):
+        f.write(sep)
+        f.write(json.dumps(myvals, sort_keys=True))
+        sep = ',\n'
+    f.write(']\n')
+
+######################################################################
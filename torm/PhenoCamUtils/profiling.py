@@ -0,0 +1,288 @@
+"""
+Opt-in hot-path instrumentation for the PhenoCamUtils functions and
+per-run profile reports for the scripts.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import functools
+import threading
+
+from . import config
+
+_profile = None
+if os.environ.get("PHENOCAM_PROFILE", "") != "":
+    _profile = {}
+_profile_lock = threading.Lock()
+_profile_local = threading.local()
+
+######################################################################
+
+
+def enable_profiling(enable=True):
+    """
+    Turn the hot-path instrumentation on (or off with enable=False).
+    While it's on the instrumented functions record, per function and
+    per site, the number of calls, wall time, listdir/glob/stat calls,
+    files seen, database queries and bytes read.  Turning it on
+    discards anything recorded so far.  Setting PHENOCAM_PROFILE in
+    the environment turns it on at import.
+    """
+
+    global _profile
+    if enable:
+        _profile = {}
+    else:
+        _profile = None
+
+
+def profiling_enabled():
+    """
+    Return True if the instrumentation is on.
+    """
+
+    return _profile is not None
+
+######################################################################
+
+
+_PROFILE_COUNTERS = ('listdir', 'glob', 'stat', 'files', 'db_queries',
+                     'bytes_read')
+
+
+def _profiled(func):
+    """
+    Decorator recording calls of an instrumented function.  The site
+    is taken from the first argument if the function's first
+    parameter is sitename.  Wall time is inclusive of any nested
+    instrumented calls, counters are charged to the innermost call.
+    """
+
+    bysite = func.__code__.co_varnames[:1] == ('sitename',)
+    funcname = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _profile is None:
+            return func(*args, **kwargs)
+
+        if bysite and len(args) > 0:
+            sitename = args[0]
+        elif bysite:
+            sitename = kwargs.get('sitename', '')
+        else:
+            sitename = ''
+
+        stack = getattr(_profile_local, 'stack', None)
+        if stack is None:
+            stack = _profile_local.stack = []
+        toplevel = len(stack) == 0
+        counts = dict.fromkeys(_PROFILE_COUNTERS, 0)
+        stack.append(counts)
+        t0 = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            counts['wall'] = time.time() - t0
+            if toplevel:
+                counts['toplevel_wall'] = counts['wall']
+            counts['calls'] = 1
+            stack.pop()
+            _profile_add(funcname, sitename, counts)
+
+    return wrapper
+
+
+def _profile_count(counter, n=1):
+    """
+    Add n to one of the _PROFILE_COUNTERS of the innermost
+    instrumented call (if the instrumentation is on).
+    """
+
+    if _profile is None:
+        return
+
+    stack = getattr(_profile_local, 'stack', None)
+    if stack:
+        stack[-1][counter] += n
+    else:
+        _profile_add('', '', {counter: n})
+
+
+def _profile_add(funcname, sitename, fields):
+    """
+    Add the fields (calls, wall, toplevel_wall or one of the
+    _PROFILE_COUNTERS) to the profile record for a function and site.
+    """
+
+    profile = _profile
+    if profile is None:
+        return
+
+    with _profile_lock:
+        key = (funcname, sitename)
+        if key not in profile:
+            profile[key] = dict.fromkeys(('calls', 'wall', 'toplevel_wall') +
+                                         _PROFILE_COUNTERS, 0)
+        rec = profile[key]
+        for field, n in fields.items():
+            rec[field] += n
+
+######################################################################
+
+
+def get_profile():
+    """
+    Return the instrumentation records as a list of dictionaries with
+    keys function, site, calls, wall, toplevel_wall and the counters
+    listdir, glob, stat, files, db_queries and bytes_read.  Counts
+    made outside any instrumented function have function ''.  Returns
+    an empty list if the instrumentation is off.
+    """
+
+    if _profile is None:
+        return []
+
+    with _profile_lock:
+        records = []
+        for (funcname, sitename), rec in sorted(_profile.items()):
+            record = dict(rec)
+            record['function'] = funcname
+            record['site'] = sitename
+            records.append(record)
+
+    return records
+
+
+def merge_profile(records):
+    """
+    Add records from get_profile() (e.g. returned by a pool worker
+    process) to this process's profile.
+    """
+
+    for record in records:
+        fields = dict((field, n) for field, n in record.items()
+                      if field not in ('function', 'site'))
+        _profile_add(record['function'], record['site'], fields)
+
+######################################################################
+
+
+def _profile_totals(records, key, wallkey):
+    """
+    Sum the records by key ('function' or 'site').
+    """
+
+    totals = {}
+    for record in records:
+        name = record[key]
+        if name not in totals:
+            totals[name] = dict.fromkeys(('calls', 'wall') +
+                                         _PROFILE_COUNTERS, 0)
+        total = totals[name]
+        total['calls'] += record['calls']
+        total['wall'] += record[wallkey]
+        for counter in _PROFILE_COUNTERS:
+            total[counter] += record[counter]
+
+    return totals
+
+
+def print_profile(nmax=10, f=sys.stdout):
+    """
+    Print the nmax slowest functions and sites.  Function times are
+    inclusive of nested instrumented calls, site times only count the
+    outermost instrumented calls.
+    """
+
+    records = get_profile()
+    header = "{:<32s} {:>8s} {:>10s} {:>8s} {:>8s} {:>8s} {:>9s} {:>6s}\n"
+    line = "{:<32s} {:8d} {:10.3f} {:8d} {:8d} {:8d} {:9d} {:6d}\n"
+
+    for key, wallkey, title in (('function', 'wall', 'Slowest functions'),
+                                ('site', 'toplevel_wall', 'Slowest sites')):
+        totals = _profile_totals(
+            [r for r in records if r[key] != ''], key, wallkey)
+        names = sorted(totals.keys(), key=lambda x: -totals[x]['wall'])
+
+        f.write("\n{}\n".format(title))
+        f.write(header.format(key, "calls", "wall (s)", "listdir", "glob",
+                              "stat", "files", "db"))
+        for name in names[:nmax]:
+            t = totals[name]
+            f.write(line.format(name, t['calls'], t['wall'], t['listdir'],
+                                t['glob'], t['stat'], t['files'],
+                                t['db_queries']))
+
+######################################################################
+
+
+def _write_atomic(outpath, text):
+    """
+    Replace outpath with text via a temporary file and rename.
+    """
+
+    outdir = os.path.dirname(os.path.abspath(outpath))
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    fd, tmppath = tempfile.mkstemp(dir=outdir, prefix=".profile")
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(text)
+        os.chmod(tmppath, 0o644)
+        os.rename(tmppath, outpath)
+    except Exception:
+        os.unlink(tmppath)
+        raise
+
+
+def write_profile(script, run_wall, outdir=None):
+    """
+    Write the profile of a script run as a JSON summary,
+    <script>.json, and a Prometheus textfile collector file,
+    <script>.prom, in outdir (default PROFILE_DIR).  run_wall is the
+    wall time of the whole run.  The textfile has per-function and
+    per-site totals.
+    """
+
+    if outdir is None:
+        outdir = config.PROFILE_DIR
+
+    records = get_profile()
+    summary = {'script': script,
+               'time': int(time.time()),
+               'wall': run_wall,
+               'records': records}
+    _write_atomic(os.path.join(outdir, script + ".json"),
+                  json.dumps(summary, indent=1, sort_keys=True))
+
+    lines = []
+    labels = 'script="{}"'.format(script)
+    lines.append("# TYPE phenocam_run_seconds gauge")
+    lines.append("phenocam_run_seconds{{{}}} {:.3f}".format(labels,
+                                                            run_wall))
+    lines.append("# TYPE phenocam_run_timestamp_seconds gauge")
+    lines.append("phenocam_run_timestamp_seconds{{{}}} {}".format(
+        labels, summary['time']))
+
+    for key, wallkey in (('function', 'wall'), ('site', 'toplevel_wall')):
+        totals = _profile_totals(
+            [r for r in records if r[key] != ''], key, wallkey)
+        metrics = [('calls', 'calls'), ('seconds', 'wall')] + \
+            [(counter, counter) for counter in _PROFILE_COUNTERS]
+        for metric, field in metrics:
+            name = "phenocam_{}_{}".format(key, metric)
+            lines.append("# TYPE {} gauge".format(name))
+            for keyval in sorted(totals.keys()):
+                value = totals[keyval][field]
+                lines.append('{}{{{},{}="{}"}} {}'.format(
+                    name, labels, key, keyval,
+                    "{:.3f}".format(value) if field == 'wall' else value))
+
+    _write_atomic(os.path.join(outdir, script + ".prom"),
+                  "\n".join(lines) + "\n")
+
+######################################################################
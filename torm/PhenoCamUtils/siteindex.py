@@ -0,0 +1,207 @@
+"""
+Compact numpy-backed index of the images for a site.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from .archive import _archive_month_dirs, _month_channel_names
+from .filenames import fn2datetime_array, datetime2fn, fn2path
+
+######################################################################
+
+
+class SiteImageIndex(object):
+    """
+    Compact in-memory index of the images for a site.  Each image is
+    stored as an int64 timestamp (seconds since 1970-01-01 in the
+    archive's local standard time, as in the filenames) and a uint8
+    channel code (0 for RGB, 1 for IR).  The records are sorted by
+    channel and then by time so each channel is one sorted block
+    that can be searched with a bisection.  Paths aren't stored, they
+    are rebuilt with datetime2fn() and fn2path() when needed, so a
+    10-year site with RGB and IR images is only a few megabytes.
+
+    Build the index from the archive with SiteImageIndex.build(),
+    write it with save() and read it back (memory-mapped by default)
+    with SiteImageIndex.load().
+    """
+
+    CHANNELS = ('RGB', 'IR')
+    DTYPE = np.dtype([('time', '<i8'), ('channel', 'u1')])
+
+    def __init__(self, sitename, records=None):
+        self.sitename = sitename
+        if records is None:
+            records = np.zeros(0, dtype=self.DTYPE)
+        self.records = records
+        self.times = records['time']
+        self.channels = records['channel']
+
+    @classmethod
+    def build(cls, sitename):
+        """
+        Build the index for a site from the archive index if there
+        is one, otherwise from the archive month directories.
+        """
+
+        parts = []
+        for year, month, monpath in _archive_month_dirs(sitename):
+            names = _month_channel_names(sitename, year, month)
+            for code, channel in enumerate(cls.CHANNELS):
+                if channel not in names:
+                    continue
+                dts, valid = fn2datetime_array(sitename, names[channel],
+                                               irFlag=(channel == 'IR'))
+                part = np.zeros(np.count_nonzero(valid), dtype=cls.DTYPE)
+                part['time'] = dts[valid].astype('int64')
+                part['channel'] = code
+                parts.append(part)
+
+        if len(parts) == 0:
+            return cls(sitename)
+
+        records = np.concatenate(parts)
+        order = np.lexsort((records['time'], records['channel']))
+        return cls(sitename, records[order])
+
+    @classmethod
+    def load(cls, sitename, filename, mmap=True):
+        """
+        Read an index written by save().  The file is memory-mapped
+        unless mmap is False.
+        """
+
+        if mmap:
+            records = np.load(filename, mmap_mode='r')
+        else:
+            records = np.load(filename)
+        if records.dtype != cls.DTYPE:
+            raise ValueError("{} is not a site image index".format(filename))
+        return cls(sitename, records)
+
+    def save(self, filename):
+        """
+        Write the index to filename (a .npy file).  The file is
+        written to a temporary file and renamed into place.
+        """
+
+        outdir = os.path.dirname(os.path.abspath(filename))
+        fd, tmppath = tempfile.mkstemp(dir=outdir, suffix='.npy')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(self.records))
+            os.chmod(tmppath, 0o664)
+            os.rename(tmppath, filename)
+        except Exception:
+            os.unlink(tmppath)
+            raise
+
+    def __len__(self):
+        return len(self.records)
+
+    def _block(self, irFlag):
+        """
+        Return the (first, last+1) record numbers for a channel.
+        """
+
+        code = int(bool(irFlag))
+        first = np.searchsorted(self.channels, code, side='left')
+        last = np.searchsorted(self.channels, code, side='right')
+        return int(first), int(last)
+
+    @staticmethod
+    def _timestamp(dt):
+        return int(np.datetime64(dt, 's').astype('int64'))
+
+    def _paths(self, times, irFlag):
+        """
+        Rebuild the archive paths for an array of timestamps.
+        """
+
+        dts = np.asarray(times).astype('datetime64[s]').astype(object)
+        paths = []
+        for dt in dts:
+            fname = datetime2fn(self.sitename, dt, irFlag=irFlag)
+            paths.append(fn2path(self.sitename, fname, irFlag=irFlag))
+        return paths
+
+    def count(self, irFlag=False):
+        """
+        Return the number of images in a channel.
+        """
+
+        first, last = self._block(irFlag)
+        return last - first
+
+    def range_times(self, startDT, endDT, irFlag=False):
+        """
+        Return the timestamps of the images between startDT and endDT
+        (inclusive, either may be None) as an int64 array.
+        """
+
+        first, last = self._block(irFlag)
+        times = self.times[first:last]
+        i0 = 0
+        i1 = len(times)
+        if startDT is not None:
+            t0 = self._timestamp(startDT)
+            if startDT.microsecond > 0:
+                t0 += 1
+            i0 = np.searchsorted(times, t0, side='left')
+        if endDT is not None:
+            i1 = np.searchsorted(times, self._timestamp(endDT),
+                                 side='right')
+        return times[i0:i1]
+
+    def range(self, startDT, endDT, irFlag=False):
+        """
+        Return the archive paths of the images between startDT and
+        endDT (inclusive) in time order.
+        """
+
+        return self._paths(self.range_times(startDT, endDT, irFlag=irFlag),
+                           irFlag)
+
+    def nearest(self, dt, irFlag=False):
+        """
+        Return the archive path of the image closest in time to dt
+        (the earlier one on a tie) or None if there are no images.
+        """
+
+        first, last = self._block(irFlag)
+        times = self.times[first:last]
+        if len(times) == 0:
+            return None
+
+        t = self._timestamp(dt)
+        i = int(np.searchsorted(times, t, side='left'))
+        if i == len(times):
+            i -= 1
+        elif i > 0 and (t - times[i-1]) <= (times[i] - t):
+            i -= 1
+        return self._paths(times[i:i+1], irFlag)[0]
+
+    def time_of_day(self, start_time, end_time, irFlag=False,
+                    startDT=None, endDT=None):
+        """
+        Return the archive paths of the images taken between the
+        times of day start_time and end_time (datetime.time objects,
+        inclusive), optionally limited to startDT to endDT.  With
+        start_time after end_time the window runs across midnight.
+        """
+
+        times = self.range_times(startDT, endDT, irFlag=irFlag)
+        sod0 = start_time.hour*3600 + start_time.minute*60 + \
+            start_time.second
+        sod1 = end_time.hour*3600 + end_time.minute*60 + end_time.second
+        sod = times % 86400
+        if sod0 <= sod1:
+            keep = (sod >= sod0) & (sod <= sod1)
+        else:
+            keep = (sod >= sod0) | (sod <= sod1)
+        return self._paths(times[keep], irFlag)
+
+######################################################################
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Run the archive query daemon.  The daily file counts, midday images
+and last images for the active sites (or the sites given) and the
+dbinfo() site information are held in memory and refreshed in the
+background, and queries are answered over HTTP on a Unix socket
+(default DAEMON_ADDRESS) or a localhost port, e.g.
+
+    archiveDaemon.py -v
+    curl --unix-socket /var/cache/phenocam/archive_daemon.sock \\
+        'http://localhost/getMiddayImage?site=harvard&year=2020&month=6&day=1'
+
+Scripts use the daemon through PhenoCamUtils.client, which has the
+same getMiddayImage(), getLastImagePath() and getDailyFileCounts()
+functions as PhenoCamUtils and works locally if the daemon isn't
+running.
+"""
+
+import sys
+import time
+import signal
+import argparse
+from datetime import date
+
+import PhenoCamUtils as pcu
+from PhenoCamUtils import daemon
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-v", "--verbose",
+                        help="increase output verbosity",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("-s", "--socket",
+                        help="Unix socket to listen on (default {})".format(
+                            pcu.DAEMON_ADDRESS),
+                        default=None)
+
+    parser.add_argument("-p", "--port",
+                        help="listen on this localhost port instead of " +
+                        "a Unix socket",
+                        type=int,
+                        default=None)
+
+    parser.add_argument("-i", "--interval",
+                        help="seconds between archive refreshes " +
+                        "(default {})".format(pcu.DAEMON_REFRESH),
+                        type=float,
+                        default=None)
+
+    parser.add_argument("--offline",
+                        help="use the last site information snapshot " +
+                        "if the database is unavailable",
+                        action="store_true",
+                        default=None)
+
+    # positional arguments
+    parser.add_argument("sitelist",
+                        help="PhenoCam Sites (default all active sites)",
+                        nargs="*")
+
+    # parse arguments
+    args = parser.parse_args()
+    verbose = args.verbose
+
+    if args.port is not None:
+        address = ("localhost", args.port)
+    elif args.socket is not None:
+        address = args.socket
+    else:
+        address = None
+
+    sitelist = None
+    if len(args.sitelist) > 0:
+        sitelist = sorted(set(args.sitelist))
+
+    # print today's date
+    today = date.today()
+    print("Archive Daemon")
+    print("==============")
+    print(today)
+    sys.stdout.flush()
+
+    # load everything before answering queries
+    state = daemon.ArchiveState(sitelist=sitelist, offline=args.offline,
+                                verbose=verbose)
+    t0 = time.time()
+    nmonths = state.refresh()
+    print("{} sites, {} months loaded in {:.1f} s.".format(
+        len(state.tracked_sites()), nmonths, time.time() - t0))
+    sys.stdout.flush()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        daemon.serve(state, address=address, interval=args.interval)
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        sys.stderr.write("{}\n".format(e))
+        sys.exit(1)
+
+    sys.exit(0)
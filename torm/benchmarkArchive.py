@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the PhenoCamUtils archive functions and updateMiddayLists.py
+against fake archives (see makeFakeArchive.py) of several sizes.  For
+each size the functions are timed first with no archive index (every
+call scans the archive) and then with the archive index built.  The
+number of filesystem calls (listdir, scandir, stat, open) made by each
+function is counted too, so changes which add directory scans show up
+even when the archive is on a fast local disk.
+
+Each archive size is run in a separate process with PHENOCAM_ARCHIVE
+and PHENOCAM_CACHEDIR pointing at the fake archive.  Sizes are given
+as SITES:YEARS:PER_DAY, e.g.
+
+    benchmarkArchive.py -S 2:1:24 -S 4:2:48 -o bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import builtins
+import tempfile
+import subprocess
+from datetime import date
+from datetime import timedelta
+
+import makeFakeArchive
+
+DEFAULT_SIZES = ["2:1:24", "4:2:48"]
+
+# filesystem functions counted by FsCounter
+COUNTED = [(os, "listdir"), (os, "scandir"), (os, "stat"), (os, "lstat"),
+           (builtins, "open")]
+
+
+class FsCounter(object):
+    """
+    Context manager counting calls to the COUNTED filesystem functions
+    made while it is active.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def _wrap(self, name, func):
+        def counted(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return counted
+
+    def __enter__(self):
+        self.saved = []
+        for module, name in COUNTED:
+            func = getattr(module, name, None)
+            if func is None:
+                continue
+            self.saved.append((module, name, func))
+            setattr(module, name, self._wrap(name, func))
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, func in self.saved:
+            setattr(module, name, func)
+        return False
+
+
+def parse_size(arg):
+    """
+    Parse a SITES:YEARS:PER_DAY archive size.
+    """
+
+    try:
+        nsites, nyears, per_day = [int(x) for x in arg.split(":")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "size '{}' is not SITES:YEARS:PER_DAY".format(arg))
+
+    return nsites, nyears, per_day
+
+
+def time_call(results, name, mode, func, *args):
+    """
+    Run func(*args), adding its wall time and filesystem call counts
+    to results.
+    """
+
+    with FsCounter() as counter:
+        t0 = time.time()
+        func(*args)
+        wall = time.time() - t0
+
+    results.append({'name': name,
+                    'mode': mode,
+                    'wall': wall,
+                    'calls': counter.counts})
+
+
+def run_script(results, name, mode, script, args, env):
+    """
+    Time a full run of one of the scripts in a child process.
+    Filesystem calls in the child aren't counted.
+    """
+
+    cmd = [sys.executable, script] + args
+    t0 = time.time()
+    with open(os.devnull, 'w') as devnull:
+        status = subprocess.call(cmd, env=env, stdout=devnull)
+    wall = time.time() - t0
+
+    results.append({'name': name,
+                    'mode': mode,
+                    'wall': wall,
+                    'calls': {},
+                    'status': status})
+
+
+def make_sample_jpegs(outdir, nimages, size=(1296, 960)):
+    """
+    Write nimages real JPEG files to outdir for the make_thumb()
+    benchmark.  Returns their paths.
+    """
+
+    from PIL import Image
+
+    paths = []
+    for i in range(nimages):
+        im = Image.new("RGB", size, (40 + i % 200, 120, 60))
+        path = os.path.join(outdir, "sample_{:04d}.jpg".format(i))
+        im.save(path, "JPEG", quality=90)
+        paths.append(path)
+
+    return paths
+
+
+def benchmark_functions(pcu, sitelist, siteinfo, mode, results):
+    """
+    Time the archive functions for every site.
+    """
+
+    def each_site(func):
+        def run():
+            for sitename in sitelist:
+                func(sitename)
+        return run
+
+    def daily_counts(sitename):
+        date_last = siteinfo[sitename]['date_last']
+        mydate = date_last - timedelta(days=29)
+        while mydate <= date_last:
+            pcu.getDailyFileCounts(sitename, mydate)
+            mydate = mydate + timedelta(days=1)
+
+    time_call(results, "getsiteimgpaths", mode,
+              each_site(pcu.getsiteimgpaths))
+    time_call(results, "getsiteimglist", mode,
+              each_site(pcu.getsiteimglist))
+    time_call(results, "getMidDayImageList", mode,
+              each_site(pcu.getMidDayImageList))
+    time_call(results, "getDailyFileCounts (30 days)", mode,
+              each_site(daily_counts))
+    time_call(results, "getFirstLastCount", mode,
+              each_site(pcu.getFirstLastCount))
+
+
+def run_size(rootdir, nthumbs):
+    """
+    Run the benchmarks on the fake archive in rootdir and return the
+    results.  PHENOCAM_ARCHIVE and PHENOCAM_CACHEDIR must already be
+    set to the archive.
+    """
+
+    import PhenoCamUtils as pcu
+
+    with open(os.path.join(rootdir, "siteinfo.json")) as fh:
+        rows = json.load(fh)
+    siteinfo = {}
+    for sitename, row in rows.items():
+        for col in ('date_first', 'date_last'):
+            year, month, day = [int(x) for x in row[col].split("-")]
+            row[col] = date(year, month, day)
+        row['Site'] = str(row['Site'])
+        siteinfo[str(sitename)] = row
+    sitelist = sorted(siteinfo.keys())
+
+    results = []
+    scriptdir = os.path.dirname(os.path.abspath(__file__))
+    midday_script = os.path.join(scriptdir, "updateMiddayLists.py")
+
+    # no archive index, everything scans the archive
+    benchmark_functions(pcu, sitelist, siteinfo, "scan", results)
+    makeFakeArchive.write_snapshots(pcu, siteinfo)
+    run_script(results, "updateMiddayLists.py -r", "scan",
+               midday_script, ["-r"], os.environ.copy())
+
+    # build the archive index and repeat
+    time_call(results, "update_archive_index", "index",
+              lambda: [pcu.update_archive_index(x) for x in sitelist])
+    benchmark_functions(pcu, sitelist, siteinfo, "index", results)
+    makeFakeArchive.write_snapshots(pcu, siteinfo)
+    run_script(results, "updateMiddayLists.py -r", "index",
+               midday_script, ["-r"], os.environ.copy())
+
+    if nthumbs > 0:
+        jpegdir = os.path.join(rootdir, "jpegs")
+        os.makedirs(jpegdir)
+        paths = make_sample_jpegs(jpegdir, nthumbs)
+        thumbdir = os.path.join(rootdir, "thumbs")
+        pairs = [(path, os.path.join(thumbdir, os.path.basename(path)))
+                 for path in paths]
+        time_call(results, "make_thumb ({} images)".format(nthumbs), "",
+                  lambda: [pcu.make_thumb(x, y) for x, y in pairs])
+
+    return results
+
+
+def print_results(size, nfiles, results):
+    """
+    Print a table of the results for one archive size.
+    """
+
+    print("")
+    print("Archive {} sites x {} years x {} images/day ({} files)".format(
+        size[0], size[1], size[2], nfiles))
+    print("{:<32s} {:<6s} {:>9s} {:>8s} {:>8s} {:>8s} {:>8s}".format(
+        "function", "mode", "wall (s)", "listdir", "scandir", "stat",
+        "open"))
+    for r in results:
+        calls = r['calls']
+        nstat = calls.get('stat', 0) + calls.get('lstat', 0)
+        print("{:<32s} {:<6s} {:9.3f} {:8d} {:8d} {:8d} {:8d}".format(
+            r['name'], r['mode'], r['wall'], calls.get('listdir', 0),
+            calls.get('scandir', 0), nstat, calls.get('open', 0)))
+        if r.get('status', 0) != 0:
+            print("  ** exit status {}".format(r['status']))
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-S", "--size",
+                        help="archive size as SITES:YEARS:PER_DAY " +
+                        "(may be repeated, default {})".format(
+                            " ".join(DEFAULT_SIZES)),
+                        type=parse_size,
+                        action="append",
+                        default=None)
+
+    parser.add_argument("--thumbs",
+                        help="number of images for the make_thumb " +
+                        "benchmark",
+                        type=int,
+                        default=20)
+
+    parser.add_argument("-o", "--output",
+                        help="also write the results to a JSON file")
+
+    parser.add_argument("--keep",
+                        help="don't delete the fake archives",
+                        action="store_true",
+                        default=False)
+
+    # used to run a single size in a child process
+    parser.add_argument("--run-size",
+                        help=argparse.SUPPRESS)
+
+    # parse arguments
+    args = parser.parse_args()
+
+    if args.run_size is not None:
+        results = run_size(args.run_size, args.thumbs)
+        with open(os.path.join(args.run_size, "results.json"), 'w') as fh:
+            json.dump(results, fh)
+        sys.exit(0)
+
+    if args.size is None:
+        sizes = [parse_size(x) for x in DEFAULT_SIZES]
+    else:
+        sizes = args.size
+
+    allresults = []
+    for size in sizes:
+        rootdir = tempfile.mkdtemp(prefix="phenocam-bench-")
+        try:
+            t0 = time.time()
+            archivedir, cachedir, siteinfo, nfiles = \
+                makeFakeArchive.make_fake_archive(rootdir, nsites=size[0],
+                                                  nyears=size[1],
+                                                  per_day=size[2])
+            tmake = time.time() - t0
+            with open(os.path.join(rootdir, "siteinfo.json"), 'w') as fh:
+                json.dump(siteinfo, fh, default=str)
+
+            env = os.environ.copy()
+            env["PHENOCAM_ARCHIVE"] = archivedir
+            env["PHENOCAM_CACHEDIR"] = cachedir
+            cmd = [sys.executable, os.path.abspath(__file__),
+                   "--thumbs", str(args.thumbs), "--run-size", rootdir]
+            subprocess.check_call(cmd, env=env)
+            with open(os.path.join(rootdir, "results.json")) as fh:
+                results = json.load(fh)
+        finally:
+            if args.keep:
+                print("Fake archive kept in {}".format(rootdir))
+            else:
+                shutil.rmtree(rootdir)
+
+        print_results(size, nfiles, results)
+        allresults.append({'sites': size[0],
+                           'years': size[1],
+                           'per_day': size[2],
+                           'files': nfiles,
+                           'make_archive': tmake,
+                           'results': results})
+
+    if args.output is not None:
+        with open(args.output, 'w') as fh:
+            json.dump(allresults, fh, indent=2, sort_keys=True)
+
+    sys.exit(0)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Check the most recent metadata file uploaded by each camera to the
+FTP upload area and list those with all the given key=value settings
+(default balance=1, i.e. cameras on auto white balance).  Keys and
+values are compared ignoring case.  Output is one line per matching
+file, path:key=value, e.g.
+
+    checkMeta.py balance=1
+    checkMeta.py -d /home/ftp/data exposure_grid=1 balance=0
+"""
+
+import sys
+import time
+import argparse
+
+import PhenoCamUtils as pcu
+
+DEFAULT_TERMS = ["balance=1"]
+
+
+def parse_term(arg):
+    try:
+        return pcu.parse_meta_term(arg)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-v", "--verbose",
+                        help="increase output verbosity",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("-d", "--datadir",
+                        help="FTP upload directory (default {})".format(
+                            pcu.FTP_DATADIR),
+                        default=None)
+
+    parser.add_argument("-j", "--threads",
+                        help="directories scanned at a time " +
+                        "(default {})".format(pcu.META_SCAN_THREADS),
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--no-cache",
+                        help="read every directory, ignoring the results " +
+                        "of earlier runs",
+                        action="store_true",
+                        default=False)
+
+    # positional arguments
+    parser.add_argument("terms",
+                        help="key=value settings to look for " +
+                        "(default {})".format(" ".join(DEFAULT_TERMS)),
+                        type=parse_term,
+                        nargs="*")
+
+    # parse arguments
+    args = parser.parse_args()
+    terms = args.terms
+    if len(terms) == 0:
+        terms = [pcu.parse_meta_term(x) for x in DEFAULT_TERMS]
+
+    t0 = time.time()
+    try:
+        latest = pcu.latest_meta_files(datadir=args.datadir,
+                                       nthreads=args.threads,
+                                       use_cache=not args.no_cache)
+    except OSError as e:
+        sys.stderr.write("{}\n".format(e))
+        sys.exit(1)
+
+    nmatch = 0
+    for dirname in sorted(latest.keys()):
+        path, meta = latest[dirname]
+        if not pcu.match_meta(meta, terms):
+            continue
+        nmatch += 1
+        lowered = dict((key.lower(), key) for key in meta)
+        settings = ["{}={}".format(lowered[key.lower()],
+                                   meta[lowered[key.lower()]])
+                    for key, value in terms]
+        print("{}:{}".format(path, " ".join(settings)))
+
+    if args.verbose:
+        print("{} of {} cameras match, {:.2f} s.".format(
+            nmatch, len(latest), time.time() - t0))
+
+    sys.exit(0)
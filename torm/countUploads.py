@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Count the files uploaded to the archive for each day of year, from
+DOY d1 down to DOY d2, for a site and year.  The year's month
+directories are read once for the whole report.  Output is in the
+count_niwot.txt format, e.g. for the niwotflir FLIR images:
+
+    countUploads.py --pattern '{site}-*-{doy}_*' --size 617180c \\
+        niwotflir 2020 283 1
+"""
+
+import sys
+import argparse
+
+import PhenoCamUtils as pcu
+
+
+def parse_size(arg):
+    """
+    Parse a file size in bytes ("617180" or "617180c") or a size
+    range "MIN:MAX" where either bound may be left out.  Returns
+    (min_size, max_size).
+    """
+
+    def nbytes(value):
+        if value == "":
+            return None
+        if value.endswith("c"):
+            value = value[:-1]
+        return int(value)
+
+    try:
+        if ":" in arg:
+            lo, hi = arg.split(":")
+            return nbytes(lo), nbytes(hi)
+        size = nbytes(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "size '{}' is not SIZE or MIN:MAX".format(arg))
+
+    return size, size
+
+
+def parse_doy(arg):
+    """
+    Check a day of year argument, keeping it as given for the
+    report header.
+    """
+
+    try:
+        doy = int(arg)
+    except ValueError:
+        doy = 0
+    if not (1 <= doy <= 366):
+        raise argparse.ArgumentTypeError(
+            "'{}' is not a day of year".format(arg))
+
+    return arg
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-p", "--pattern",
+                        help="filename pattern, {doy} marks the day of " +
+                        "year and {site} stands for the sitename " +
+                        "(default: the site's standard RGB images)",
+                        default=None)
+
+    parser.add_argument("-s", "--size",
+                        help="count only files of SIZE bytes (e.g. " +
+                        "617180c) or with a size in the range MIN:MAX",
+                        type=parse_size,
+                        default=(None, None))
+
+    # positional arguments
+    parser.add_argument("site",
+                        help="PhenoCam site name")
+
+    parser.add_argument("year",
+                        help="year",
+                        type=int)
+
+    parser.add_argument("d1",
+                        help="first (latest) day of year",
+                        type=parse_doy)
+
+    parser.add_argument("d2",
+                        help="last (earliest) day of year",
+                        type=parse_doy)
+
+    # parse arguments
+    args = parser.parse_args()
+    min_size, max_size = args.size
+
+    try:
+        counts = pcu.getDOYFileCounts(args.site, args.year,
+                                      pattern=args.pattern,
+                                      min_size=min_size, max_size=max_size)
+    except ValueError as e:
+        sys.stderr.write("{}\n".format(e))
+        sys.exit(1)
+
+    print("Year {}:  {} to {}".format(args.year, args.d1, args.d2))
+    print("----------------------------")
+    for doy in range(int(args.d1), int(args.d2) - 1, -1):
+        print("DOY {:03d}:\t{}".format(doy, counts.get(doy, 0)))
+
+    sys.exit(0)
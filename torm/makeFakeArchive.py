@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build a synthetic PhenoCam archive for testing and benchmarking.
+The archive has the usual <site>/<YYYY>/<MM>/ layout with "standard"
+image and metadata filenames.  Images are zero-byte placeholders.
+Site information is written as dbinfo() snapshots so that the scripts
+can run against the fake archive without a database, e.g.
+
+    makeFakeArchive.py -s 4 -y 2 /tmp/fakearchive
+    PHENOCAM_ARCHIVE=/tmp/fakearchive/archive \\
+    PHENOCAM_CACHEDIR=/tmp/fakearchive/cache \\
+        python updateMiddayLists.py
+"""
+
+import os
+import sys
+import random
+import argparse
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+# dbinfo() column lists used by the scripts, a snapshot is written for
+# each of them
+SNAPSHOT_COLUMNS = [
+    ["Site", "Lat", "Lon", "Format"],
+    ["Site", "active", "date_first", "date_last"],
+    ["Site", "Lon", "utc_offset", "active", "date_first", "date_last"],
+    ["Site", "active"],
+    ["Site", "date_first"],
+]
+
+
+def fake_sitename(isite):
+    return "fakesite{:03d}".format(isite + 1)
+
+
+def make_fake_site(archivedir, sitename, start_date, ndays, per_day=48,
+                   ir_ratio=0.5, meta_ratio=1.0, gap_ratio=0.02,
+                   rng=random):
+    """
+    Create the archive directories and placeholder files for one site.
+    There are per_day images a day spread from 06:00 to 18:00 with a
+    little jitter.  ir_ratio and meta_ratio are the fractions of RGB
+    images with an IR image and a .meta file, gap_ratio the fraction
+    of days with no files at all.  Returns (date_first, date_last,
+    number of files).
+    """
+
+    interval = 12 * 3600. / per_day
+    date_first = None
+    date_last = None
+    nfiles = 0
+    monpath = None
+
+    for iday in range(ndays):
+        mydate = start_date + timedelta(days=iday)
+        if rng.random() < gap_ratio:
+            continue
+
+        if monpath is None or not monpath.endswith(
+                mydate.strftime("%Y{0}%m".format(os.sep))):
+            monpath = os.path.join(archivedir, sitename,
+                                   mydate.strftime("%Y"),
+                                   mydate.strftime("%m"))
+            if not os.path.exists(monpath):
+                os.makedirs(monpath)
+
+        day0 = datetime(mydate.year, mydate.month, mydate.day, 6, 0, 0)
+        for i in range(per_day):
+            secs = int(i * interval + rng.uniform(0, min(interval, 120.)))
+            dtstr = (day0 + timedelta(seconds=secs)).strftime(
+                "%Y_%m_%d_%H%M%S")
+            fnames = ["{}_{}.jpg".format(sitename, dtstr)]
+            if rng.random() < ir_ratio:
+                fnames.append("{}_IR_{}.jpg".format(sitename, dtstr))
+            if rng.random() < meta_ratio:
+                fnames.append("{}_{}.meta".format(sitename, dtstr))
+            for fname in fnames:
+                open(os.path.join(monpath, fname), 'w').close()
+            nfiles += len(fnames)
+
+        if date_first is None:
+            date_first = mydate
+        date_last = mydate
+
+    # midday lists etc. go in the ROI directory
+    roidir = os.path.join(archivedir, sitename, "ROI")
+    if not os.path.exists(roidir):
+        os.makedirs(roidir)
+
+    return date_first, date_last, nfiles
+
+
+def make_fake_archive(rootdir, nsites=2, nyears=1, per_day=48,
+                      ir_ratio=0.5, meta_ratio=1.0, gap_ratio=0.02,
+                      start_year=2015, seed=1):
+    """
+    Build a fake archive in rootdir/archive and site information for
+    it.  Returns (archivedir, cachedir, siteinfo, number of files),
+    siteinfo being keyed by sitename like the dbinfo() result with
+    all the SNAPSHOT_COLUMNS columns.
+    """
+
+    rng = random.Random(seed)
+    archivedir = os.path.join(rootdir, "archive")
+    cachedir = os.path.join(rootdir, "cache")
+    for dirname in (archivedir, cachedir):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+    start_date = date(start_year, 1, 1)
+    ndays = (date(start_year + nyears, 1, 1) - start_date).days
+
+    siteinfo = {}
+    ntotal = 0
+    for isite in range(nsites):
+        sitename = fake_sitename(isite)
+        date_first, date_last, nfiles = make_fake_site(
+            archivedir, sitename, start_date, ndays, per_day=per_day,
+            ir_ratio=ir_ratio, meta_ratio=meta_ratio, gap_ratio=gap_ratio,
+            rng=rng)
+        ntotal += nfiles
+        lat = rng.uniform(25., 60.)
+        lon = rng.uniform(-125., -65.)
+        siteinfo[sitename] = {'Site': sitename,
+                              'Lat': lat,
+                              'Lon': lon,
+                              'utc_offset': round(lon / 15.),
+                              'Format': 1,
+                              'active': True,
+                              'date_first': date_first,
+                              'date_last': date_last}
+
+    return archivedir, cachedir, siteinfo, ntotal
+
+
+def write_snapshots(pcu, siteinfo):
+    """
+    Write the dbinfo() snapshots for siteinfo (see make_fake_archive())
+    with the PhenoCamUtils module pcu, which must already point at the
+    fake archive's cache directory.
+    """
+
+    for colnames in SNAPSHOT_COLUMNS:
+        info = {}
+        for sitename, row in siteinfo.items():
+            info[sitename] = dict((col, row[col]) for col in colnames)
+        pcu.write_dbinfo_snapshot(info, colnames=colnames)
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-s", "--sites",
+                        help="number of sites",
+                        type=int,
+                        default=2)
+
+    parser.add_argument("-y", "--years",
+                        help="number of years of images per site",
+                        type=int,
+                        default=1)
+
+    parser.add_argument("-n", "--per-day",
+                        help="RGB images per day",
+                        type=int,
+                        default=48)
+
+    parser.add_argument("--ir-ratio",
+                        help="fraction of images with an IR image",
+                        type=float,
+                        default=0.5)
+
+    parser.add_argument("--meta-ratio",
+                        help="fraction of images with a .meta file",
+                        type=float,
+                        default=1.0)
+
+    parser.add_argument("--gap-ratio",
+                        help="fraction of days with no images",
+                        type=float,
+                        default=0.02)
+
+    parser.add_argument("--seed",
+                        help="random number seed",
+                        type=int,
+                        default=1)
+
+    # positional arguments
+    parser.add_argument("rootdir",
+                        help="directory for the fake archive and cache")
+
+    # parse arguments
+    args = parser.parse_args()
+
+    archivedir, cachedir, siteinfo, nfiles = make_fake_archive(
+        args.rootdir, nsites=args.sites, nyears=args.years,
+        per_day=args.per_day, ir_ratio=args.ir_ratio,
+        meta_ratio=args.meta_ratio, gap_ratio=args.gap_ratio,
+        seed=args.seed)
+
+    # PhenoCamUtils reads the directories from the environment
+    os.environ["PHENOCAM_ARCHIVE"] = archivedir
+    os.environ["PHENOCAM_CACHEDIR"] = cachedir
+    import PhenoCamUtils as pcu
+    write_snapshots(pcu, siteinfo)
+
+    print("{} sites, {} files in {}".format(len(siteinfo), nfiles,
+                                            archivedir))
+    print("export PHENOCAM_ARCHIVE={}".format(archivedir))
+    print("export PHENOCAM_CACHEDIR={}".format(cachedir))
+    sys.exit(0)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Write a network-wide archive inventory: image and metadata file counts
+with first and last timestamps per site, month and channel, scanned
+in parallel, to a single gzipped CSV file for the R dashboards.
+"""
+
+import os
+import sys
+import csv
+import gzip
+import argparse
+import tempfile
+import traceback
+import multiprocessing
+from datetime import date
+
+import PhenoCamUtils as pcu
+
+# columns in the inventory file
+COLUMNS = ["site", "year", "month", "channel", "count",
+           "first_timestamp", "last_timestamp"]
+
+
+def init_worker(scan_semaphore):
+    """
+    Pool initializer: share the directory scan semaphore with the
+    PhenoCamUtils module in each worker process.
+    """
+
+    pcu.set_scan_semaphore(scan_semaphore)
+
+
+def site_inventory(sitename):
+    """
+    Return (sitename, inventory rows, error) for a site.
+    """
+
+    try:
+        rows = pcu.getSiteInventory(sitename)
+    except Exception:
+        return sitename, [], traceback.format_exc()
+
+    return sitename, rows, None
+
+
+def write_inventory(outpath, results):
+    """
+    Write the inventory rows for all sites to a gzipped CSV file,
+    replacing any existing file atomically.
+    """
+
+    outdir = os.path.dirname(os.path.abspath(outpath))
+    fd, tmppath = tempfile.mkstemp(dir=outdir, prefix=".inventory")
+    os.close(fd)
+
+    try:
+        with gzip.open(tmppath, 'wt') as fh:
+            writer = csv.writer(fh, lineterminator="\n")
+            writer.writerow(COLUMNS)
+            for sitename, rows in results:
+                for row in rows:
+                    writer.writerow((sitename,) + tuple(row))
+        os.chmod(tmppath, 0o644)
+        os.rename(tmppath, outpath)
+    except Exception:
+        os.remove(tmppath)
+        raise
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-v", "--verbose",
+                        help="increase output verbosity",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("-o", "--output",
+                        help="output file",
+                        default=os.path.join(pcu.CACHEDIR,
+                                             "inventory.csv.gz"))
+
+    parser.add_argument("-j", "--jobs",
+                        help="number of sites to scan in parallel",
+                        type=int,
+                        default=4)
+
+    parser.add_argument("--max-scans",
+                        help="maximum concurrent archive directory scans " +
+                        "(0 for no limit)",
+                        type=int,
+                        default=0)
+
+    # positional arguments
+    parser.add_argument("sitelist",
+                        help="PhenoCam Sites",
+                        nargs="*")
+
+    # parse arguments
+    args = parser.parse_args()
+    siteargs = args.sitelist
+    verbose = args.verbose
+
+    # print today's date
+    today = date.today()
+    print("Archive Inventory")
+    print("=================")
+    print(today)
+
+    if len(siteargs) == 0:
+        siteInfo = pcu.dbinfo(colnames=["Site", "date_first"],
+                              max_age=pcu.DBINFO_BATCH_TTL)
+        sitelist = [x for x in siteInfo.keys()
+                    if siteInfo[x]['date_first'] is not None]
+    else:
+        sitelist = list(set(siteargs))
+    sitelist.sort()
+
+    scan_semaphore = None
+    if args.max_scans > 0:
+        scan_semaphore = multiprocessing.Semaphore(args.max_scans)
+    pool = multiprocessing.Pool(args.jobs, initializer=init_worker,
+                                initargs=(scan_semaphore,))
+
+    # results come back in site order
+    results = []
+    failed = []
+    for sitename, rows, error in pool.imap(site_inventory, sitelist):
+        if error is not None:
+            sys.stderr.write("Error scanning {}:\n".format(sitename))
+            sys.stderr.write(error)
+            failed.append(sitename)
+            continue
+        if verbose:
+            print("{}: {} month/channel rows".format(sitename, len(rows)))
+        results.append((sitename, rows))
+
+    pool.close()
+    pool.join()
+
+    write_inventory(args.output, results)
+
+    # print info message
+    print("{} sites written to {}.".format(len(results), args.output))
+    if len(failed) > 0:
+        print("{} sites failed: {}".format(len(failed), ", ".join(failed)))
+        sys.exit(1)
+    sys.exit(0)
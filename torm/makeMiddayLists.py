@@ -1,20 +1,33 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import sys
+import time
 import PhenoCamUtils as pcu
 
+# --profile prints the slowest sites and functions at the end, the run
+# summary is written to pcu.PROFILE_DIR
+profile = "--profile" in sys.argv[1:]
+if profile:
+	pcu.enable_profiling()
+t0 = time.time()
+
 # get a list of all sites
 siteInfo = pcu.dbinfo()
-siteList = siteInfo.keys()
-siteList.sort()
+siteList = sorted(siteInfo.keys())
 
 # loop over sites and generate a list of midday images
 for sitename in siteList:
 	if sitename in set(['HF_StarDot_IR', 'HF_StarDot_SC','HF_StarDot_XL','shiningrock-resized']):
 		continue;
-	print sitename;
+	print(sitename)
 	midday_list = pcu.getMidDayImageList(sitename)
 	outfile = open('/data/archive/' + sitename + '/ROI/' + sitename +'-midday.txt', 'w')
 
 	for item in midday_list:
   		outfile.write("%s\n" % item)
+
+if profile or pcu.profiling_enabled():
+	pcu.write_profile("makeMiddayLists", time.time() - t0)
+	if profile:
+		pcu.print_profile()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build or refresh the per-site archive index files used by the
+PhenoCamUtils listing functions.  The first run for a site scans
+every month directory, later runs only relist month directories
+whose mtime has changed.
+"""
+
+import sys
+import argparse
+from datetime import date
+
+import PhenoCamUtils as pcu
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-v", "--verbose",
+                        help="increase output verbosity",
+                        action="store_true",
+                        default=False)
+
+    # positional arguments
+    parser.add_argument("sitelist",
+                        help="PhenoCam Sites",
+                        nargs="*")
+
+    # parse arguments
+    args = parser.parse_args()
+    siteargs = args.sitelist
+    verbose = args.verbose
+
+    # print today's date
+    today = date.today()
+    print("Update Archive Index")
+    print("====================")
+    print(today)
+
+    if len(siteargs) == 0:
+        siteInfo = pcu.dbinfo(colnames=["Site", "date_first"],
+                              max_age=pcu.DBINFO_BATCH_TTL)
+        sitelist = [x for x in siteInfo.keys()
+                    if siteInfo[x]['date_first'] is not None]
+    else:
+        sitelist = list(set(siteargs))
+    sitelist.sort()
+
+    nindex = 0
+    nmonths = 0
+    for sitename in sitelist:
+        nscanned = pcu.update_archive_index(sitename)
+        if nscanned is None:
+            sys.stderr.write("Archive index disabled.\n")
+            sys.exit(1)
+
+        if verbose:
+            print("{}: {} month directories scanned".format(sitename,
+                                                            nscanned))
+        nindex += 1
+        nmonths += nscanned
+
+    # print info message
+    print("{} sites indexed.".format(nindex))
+    print("{} month directories scanned.".format(nmonths))
+    sys.exit(0)
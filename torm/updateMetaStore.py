@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build or refresh the per-site stores of parsed .meta files used by
+PhenoCamUtils.query_meta().  The first run for a site reads every
+.meta file, later runs only read the files in month directories whose
+mtime has changed (or in the last few months, see --recheck-months)
+which are new or have changed themselves.  A .meta file rewritten in
+place in an older month is only found with --recheck-months -1.
+"""
+
+import sys
+import argparse
+from datetime import date
+
+import PhenoCamUtils as pcu
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-v", "--verbose",
+                        help="increase output verbosity",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--recheck-months",
+                        help="check the files in each site's last N " +
+                        "month directories even if the directory is " +
+                        "unchanged, -1 for all (default " +
+                        "{})".format(pcu.META_STORE_RECHECK_MONTHS),
+                        metavar="N",
+                        type=int,
+                        default=None)
+
+    # positional arguments
+    parser.add_argument("sitelist",
+                        help="PhenoCam Sites",
+                        nargs="*")
+
+    # parse arguments
+    args = parser.parse_args()
+    siteargs = args.sitelist
+    verbose = args.verbose
+
+    # print today's date
+    today = date.today()
+    print("Update Metadata Store")
+    print("=====================")
+    print(today)
+
+    if len(siteargs) == 0:
+        siteInfo = pcu.dbinfo(colnames=["Site", "date_first"],
+                              max_age=pcu.DBINFO_BATCH_TTL)
+        sitelist = [x for x in siteInfo.keys()
+                    if siteInfo[x]['date_first'] is not None]
+    else:
+        sitelist = list(set(siteargs))
+    sitelist.sort()
+
+    nsites = 0
+    nfiles = 0
+    for sitename in sitelist:
+        nstored = pcu.update_meta_store(
+            sitename, recheck_months=args.recheck_months)
+        if nstored is None:
+            sys.stderr.write("Metadata store disabled.\n")
+            sys.exit(1)
+
+        if verbose:
+            print("{}: {} .meta files stored".format(sitename, nstored))
+        nsites += 1
+        nfiles += nstored
+
+    # print info message
+    print("{} sites updated.".format(nsites))
+    print("{} .meta files stored.".format(nfiles))
+    sys.exit(0)
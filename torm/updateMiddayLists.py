@@ -1,11 +1,16 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from __future__ import print_function
-
 import os
 import sys
+import time
+import fcntl
+import shutil
 import argparse
+import tempfile
+import traceback
+import multiprocessing
+from io import StringIO
 from datetime import date
 from datetime import timedelta
 
@@ -27,6 +32,25 @@ def middaylistpath(sitename):
     return outpath
 
 
+def lock_midday_list(sitename):
+    """
+    Take an exclusive lock on a site's midday image list, returning
+    the open lock file; closing it releases the lock.  Anything that
+    reads the end of the list and then replaces it holds the lock from
+    the read through the rename, so that updates from this script and
+    watchArchive.py can't interleave.
+    """
+
+    lockfh = open(middaylistpath(sitename) + ".lock", 'a')
+    try:
+        fcntl.flock(lockfh, fcntl.LOCK_EX)
+    except Exception:
+        lockfh.close()
+        raise
+
+    return lockfh
+
+
 def make_midday_list(sitename, date_first, date_last, verbose=False):
     """
     Create a new midday list file for a site.
@@ -43,12 +67,7 @@ def make_midday_list(sitename, date_first, date_last, verbose=False):
                         'HF_StarDot_XL', 'shiningrock-resized']):
         return
 
-    midday_list = []
-    for mydate in daterange(date_first, date_last):
-        midday_image = pcu.getMiddayImage(sitename, mydate.year,
-                                          mydate.month,
-                                          mydate.day)
-        midday_list.append(midday_image)
+    midday_list = pcu.getMiddayImageRange(sitename, date_first, date_last)
 
     with open(outpath, 'w') as fh:
         for item in midday_list:
@@ -71,21 +90,23 @@ def read_midday_list(sitename, verbose=False):
     # read in lines from the file and make dictionary
     # with date and image name/path
     with open(inpath, 'r') as fh:
-        lines = list(fh)
-
-    path1 = lines[0]
-    img1 = os.path.basename(path1)
-    date_first = pcu.fn2datetime(sitename, img1).date()
-    if verbose:
-        print("First date: {}".format(date_first))
-
+        lines = [line.rstrip() for line in fh]
+
+    # parse the dates of all the image names in one go, or one at a
+    # time without numpy
+    imgnames = [os.path.basename(line) for line in lines if line != ""]
+    try:
+        imgdates = pcu.fn2datetime_array(sitename, imgnames)[0]
+        imgdates = iter(imgdates.astype('datetime64[D]').tolist())
+    except ImportError:
+        imgdates = iter([pcu.fn2datetime(sitename, imgname).date()
+                         for imgname in imgnames])
+
+    date_first = None
     midday_list = []
-    for i in range(len(lines)):
-        imgpath = lines[i].rstrip()
-        # print(imgpath)
+    for imgpath in lines:
         if imgpath != "":
-            imgname = os.path.basename(imgpath)
-            imgdate = pcu.fn2datetime(sitename, imgname).date()
+            imgdate = next(imgdates)
             midday_list.append({"date": imgdate,
                                 "path": imgpath})
         else:
@@ -93,6 +114,11 @@ def read_midday_list(sitename, verbose=False):
             midday_list.append({"date": imgdate,
                                 "path": ""})
 
+        if date_first is None:
+            date_first = imgdate
+            if verbose:
+                print("First date: {}".format(date_first))
+
     date_last = imgdate
     if verbose:
         print("Last Date: {}".format(date_last))
@@ -100,6 +126,368 @@ def read_midday_list(sitename, verbose=False):
     return midday_list
 
 
+def read_midday_tail(sitename, blocksize=4096):
+    """
+    Find the date of the last entry in a midday image list by reading
+    backwards from the end of the file, so the cost doesn't depend on
+    the length of the list.  Returns a tuple (lastdate, offset) where
+    offset is the byte offset of the last line in the file, or None
+    if the file doesn't exist or has no image entries.
+    """
+
+    inpath = middaylistpath(sitename)
+    if not os.path.exists(inpath):
+        return None
+
+    with open(inpath, 'rb') as fh:
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        if size == 0:
+            return None
+
+        # read blocks from the end of the file until we have the
+        # whole of the last non-empty line
+        data = b""
+        pos = size
+        while pos > 0:
+            nread = min(blocksize, pos)
+            pos -= nread
+            fh.seek(pos)
+            data = fh.read(nread) + data
+            lines = data.split(b"\n")
+            nonempty = [i for i in range(1, len(lines))
+                        if lines[i].strip() != b""]
+            if len(nonempty) > 0:
+                break
+
+    # list files are written one entry per line with a trailing
+    # newline
+    if not data.endswith(b"\n"):
+        return None
+
+    lines = data.split(b"\n")[:-1]
+    if pos == 0:
+        first = 0
+    else:
+        first = 1
+    nonempty = [i for i in range(first, len(lines))
+                if lines[i].strip() != b""]
+    if len(nonempty) == 0:
+        return None
+
+    ilast = nonempty[-1]
+    imgname = os.path.basename(lines[ilast].strip().decode())
+    imgdate = pcu.fn2datetime(sitename, imgname).date()
+
+    # empty lines following the last image are days without images
+    lastdate = imgdate + timedelta(days=len(lines) - 1 - ilast)
+    offset = size - len(lines[-1]) - 1
+
+    return lastdate, offset
+
+
+def append_midday_list(sitename, lastdate, offset, lastimgdate,
+                       verbose=False):
+    """
+    Replace the last entry of a midday image list (the one for
+    lastdate, starting at byte offset) and append entries up to
+    lastimgdate.  Only the new days are scanned.  The existing entries
+    are copied unparsed to a temporary file which then replaces the
+    list so that readers never see a partly written file.  The caller
+    must hold lock_midday_list() from reading offset until this
+    returns.
+    """
+
+    outpath = middaylistpath(sitename)
+    outdir = os.path.dirname(outpath)
+
+    midday_images = pcu.getMiddayImageRange(sitename, lastdate,
+                                            lastimgdate)
+
+    fd, tmppath = tempfile.mkstemp(dir=outdir, prefix=".midday")
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            with open(outpath, 'rb') as infh:
+                remaining = offset
+                while remaining > 0:
+                    buf = infh.read(min(remaining, 1 << 20))
+                    if not buf:
+                        break
+                    fh.write(buf)
+                    remaining -= len(buf)
+
+            for mydate, midday_image in zip(daterange(lastdate,
+                                                      lastimgdate),
+                                            midday_images):
+                if verbose:
+                    entry = {"date": mydate,
+                             "path": midday_image}
+                    print("Adding entry: {}".format(entry))
+                fh.write("{}\n".format(midday_image).encode())
+
+            fh.flush()
+            os.fsync(fh.fileno())
+
+        shutil.copymode(outpath, tmppath)
+        os.rename(tmppath, outpath)
+    except Exception:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+    return
+
+
+def patch_midday_list(sitename, dates, verbose=False):
+    """
+    Recompute the entries of an existing midday image list for dates
+    which are already in the list, e.g. after late uploads for those
+    days.  The list is replaced atomically if any entry changed.
+    Returns the number of entries changed.  The caller must hold
+    lock_midday_list().
+    """
+
+    inpath = middaylistpath(sitename)
+    with open(inpath, 'r') as fh:
+        lines = [line.rstrip("\n") for line in fh]
+    if len(lines) == 0 or lines[0] == "":
+        return 0
+
+    date_first = pcu.fn2datetime(sitename,
+                                 os.path.basename(lines[0])).date()
+
+    nchanged = 0
+    middays = {}
+    for mydate in sorted(set(dates)):
+        idx = (mydate - date_first).days
+        if idx < 0 or idx >= len(lines):
+            continue
+
+        month = (mydate.year, mydate.month)
+        if month not in middays:
+            middays[month] = pcu.getMonthMiddayImages(sitename,
+                                                      mydate.year,
+                                                      mydate.month)
+        midday_image = middays[month].get(mydate.day, "")
+        if midday_image != lines[idx]:
+            if verbose:
+                entry = {"date": mydate,
+                         "path": midday_image}
+                print("Replacing entry: {}".format(entry))
+            lines[idx] = midday_image
+            nchanged += 1
+
+    if nchanged == 0:
+        return 0
+
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(inpath),
+                                   prefix=".midday")
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            for line in lines:
+                fh.write("{}\n".format(line))
+        shutil.copymode(inpath, tmppath)
+        os.rename(tmppath, inpath)
+    except Exception:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+    return nchanged
+
+
+def update_midday_dates(sitename, dates, verbose=False):
+    """
+    Bring the entries for a set of dates in an existing midday image
+    list up to date.  Dates inside the list are recomputed with
+    patch_midday_list(), dates past the end extend the list.  Returns
+    True if the list was changed.
+    """
+
+    if not os.path.exists(middaylistpath(sitename)):
+        return False
+
+    with lock_midday_list(sitename):
+        tail = read_midday_tail(sitename)
+        if tail is None:
+            return False
+        lastdate, offset = tail
+
+        dates = sorted(set(dates))
+        changed = False
+        olddates = [mydate for mydate in dates if mydate < lastdate]
+        if len(olddates) > 0:
+            if patch_midday_list(sitename, olddates, verbose=verbose) > 0:
+                changed = True
+                lastdate, offset = read_midday_tail(sitename)
+
+        if dates[-1] >= lastdate:
+            append_midday_list(sitename, lastdate, offset, dates[-1],
+                               verbose=verbose)
+            changed = True
+
+    return changed
+
+
+def update_site(sitename, siteinfo, recreate=False, verbose=False):
+    """
+    Create or update the midday list for a single site.  siteinfo is
+    the dbinfo() entry for the site.  Returns "created", "updated" or
+    None if nothing was done.
+    """
+
+    firstimgdate = siteinfo['date_first']
+    lastimgdate = siteinfo['date_last']
+
+    # skip sites which no images yet
+    if firstimgdate is None:
+        return None
+
+    print("Site: {}".format(sitename))
+    print("===========================")
+    outpath = middaylistpath(sitename)
+    if verbose:
+        print("Output list file: {}".format(outpath))
+
+    with lock_midday_list(sitename):
+        return _update_site_list(sitename, firstimgdate, lastimgdate,
+                                 recreate=recreate, verbose=verbose)
+
+
+def _update_site_list(sitename, firstimgdate, lastimgdate,
+                      recreate=False, verbose=False):
+    """
+    Body of update_site(), run holding the site's midday list lock.
+    """
+
+    outpath = middaylistpath(sitename)
+
+    # if the output file doesn't exist create one
+    if not os.path.exists(outpath) or recreate:
+        if verbose:
+            msg = "Creating new midday image list for {}"
+            msg = msg.format(sitename)
+            print(msg)
+
+        # make a midday list
+        make_midday_list(sitename, firstimgdate, lastimgdate)
+        return "created"
+
+    if verbose:
+        print("Updating midday image list for {}".format(sitename))
+
+    # find the last date in the midday image list from the end of
+    # the file
+    tail = read_midday_tail(sitename)
+    if tail is None:
+        if verbose:
+            print("  No entries found, recreating list.")
+        make_midday_list(sitename, firstimgdate, lastimgdate)
+        return "created"
+
+    lastdate, offset = tail
+    if verbose:
+        print("  Last midday date: {}".format(lastdate))
+
+    # last image date from the database
+    if verbose:
+        print("  Last image date: {}".format(lastimgdate))
+
+    # check if update is needed
+    if not (lastimgdate > lastdate):
+        if verbose:
+            print("  No update needed.")
+        return None
+
+    # always redo last date to account for sites where the
+    # archive update only picks up a partial day
+    append_midday_list(sitename, lastdate, offset, lastimgdate,
+                       verbose=verbose)
+
+    return "updated"
+
+
+def store_midday_list(sitename, result, verbose=False):
+    """
+    Rewrite the binary midday image store for a site from its midday
+    list if the list was just created or updated (result from
+    update_site()) or the store doesn't exist yet.
+    """
+
+    storepath = pcu.midday_store_path(sitename)
+    if result is None and os.path.exists(storepath):
+        return False
+    if not os.path.exists(middaylistpath(sitename)):
+        return False
+
+    # make_midday_list() writes the list in place
+    with lock_midday_list(sitename):
+        midday_list = read_midday_list(sitename)
+    if midday_list is None or len(midday_list) == 0:
+        return False
+
+    paths = [x['path'] for x in midday_list]
+    ndays = pcu.write_midday_store(sitename, midday_list[0]['date'], paths)
+    if verbose:
+        print("  Wrote {} days to {}".format(ndays, storepath))
+
+    return True
+
+
+# set in pool workers which send their profile back with each site
+worker_profile = False
+
+
+def init_worker(scan_semaphore, profile=False):
+    """
+    Pool initializer: share the directory scan semaphore with the
+    PhenoCamUtils module in each worker process and start the
+    worker's own profile if profiling.
+    """
+
+    global worker_profile
+
+    pcu.set_scan_semaphore(scan_semaphore)
+    if profile:
+        pcu.enable_profiling()
+        worker_profile = True
+
+
+def run_site(task):
+    """
+    Run update_site() for one site in a pool worker.  Output is
+    captured so that it can be printed in site order, and any
+    exception is returned rather than raised so that one bad site
+    doesn't stop the run.  Returns (sitename, result, output, error,
+    profile), profile being the PhenoCamUtils profile records for the
+    site when run in a profiling pool worker and otherwise None.
+    """
+
+    sitename, siteinfo, recreate, store, verbose = task
+
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    result = None
+    error = None
+    try:
+        result = update_site(sitename, siteinfo, recreate=recreate,
+                             verbose=verbose)
+        if store:
+            store_midday_list(sitename, result, verbose=verbose)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+
+    profile = None
+    if worker_profile:
+        profile = pcu.get_profile()
+        pcu.enable_profiling()
+
+    return sitename, result, output, error, profile
+
+
 if __name__ == "__main__":
 
     # get arguments
@@ -115,7 +503,37 @@ if __name__ == "__main__":
                         help="recreate entire list",
                         action="store_true",
                         default=False)
-    
+
+    parser.add_argument("--store",
+                        help="also write the binary midday image store",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--offline",
+                        help="use the last site information snapshot " +
+                        "if the database is unavailable",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("-j", "--jobs",
+                        help="number of sites to process in parallel",
+                        type=int,
+                        default=1)
+
+    parser.add_argument("--profile",
+                        help="record timings and archive/database " +
+                        "calls, write a run summary to " +
+                        "{} and print the slowest ".format(pcu.PROFILE_DIR) +
+                        "sites and functions",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--max-scans",
+                        help="maximum concurrent archive directory scans " +
+                        "(0 for no limit)",
+                        type=int,
+                        default=0)
+
     # positional arguments
     parser.add_argument("sitelist",
                         help="PhenoCam Sites",
@@ -126,6 +544,15 @@ if __name__ == "__main__":
     siteargs = args.sitelist
     verbose = args.verbose
     recreate = args.recreate
+    jobs = args.jobs
+    max_scans = args.max_scans
+    offline = args.offline
+    store = args.store
+    profile = args.profile or pcu.profiling_enabled()
+
+    t0 = time.time()
+    if args.profile:
+        pcu.enable_profiling()
 
     # print today's date
     today = date.today()
@@ -135,11 +562,14 @@ if __name__ == "__main__":
     if verbose:
         print("verbose: {}".format(verbose))
         print("recreate lists: {}".format(recreate))
+        print("jobs: {}".format(jobs))
 
     # get information on all sites
     siteInfo = pcu.dbinfo(colnames=["Site", "active",
-                                    "date_first", "date_last"])
-    all_sitelist = siteInfo.keys()
+                                    "date_first", "date_last"],
+                          max_age=pcu.DBINFO_BATCH_TTL,
+                          offline=offline)
+    all_sitelist = list(siteInfo.keys())
     if verbose:
         print("PhenoCam Sites: {}".format(len(all_sitelist)))
     active_sitelist = [x for x in all_sitelist if siteInfo[x]['active']]
@@ -169,98 +599,52 @@ if __name__ == "__main__":
         sitelist = list(set(siteargs))
         sitelist.sort()
 
+    tasks = [(sitename, siteInfo[sitename], recreate, store, verbose)
+             for sitename in sitelist]
+
     nupdate = 0
     ncreate = 0
-    for sitename in sitelist:
-
-        firstimgdate = siteInfo[sitename]['date_first']
-        lastimgdate = siteInfo[sitename]['date_last']
-
-        # skip sites which no images yet
-        if firstimgdate is None:
-            continue
-        
-        print("Site: {}".format(sitename))
-        print("===========================")
-        outpath = middaylistpath(sitename)
-        if verbose:
-            print("Output list file: {}".format(outpath))
-
-        # if the output file doesn't exist create one
-        if not os.path.exists(outpath) or recreate:
-            if verbose:
-                msg = "Creating new midday image list for {}"
-                msg = msg.format(sitename)
-                print(msg)
-
-            # make a midday list
-            make_midday_list(sitename, firstimgdate, lastimgdate)
+    failed = []
+    if jobs > 1:
+        scan_semaphore = None
+        if max_scans > 0:
+            scan_semaphore = multiprocessing.Semaphore(max_scans)
+        pool = multiprocessing.Pool(jobs, initializer=init_worker,
+                                    initargs=(scan_semaphore, profile))
+        results = pool.imap(run_site, tasks)
+    else:
+        results = (run_site(task) for task in tasks)
+
+    # results come back in site order so output is deterministic
+    for sitename, result, output, error, site_profile in results:
+        sys.stdout.write(output)
+        if site_profile is not None:
+            pcu.merge_profile(site_profile)
+        if error is not None:
+            sys.stderr.write("Error updating {}:\n".format(sitename))
+            sys.stderr.write(error)
+            failed.append(sitename)
+        elif result == "created":
             ncreate += 1
-
-        else:
-            if verbose:
-                print("Updating midday image list for {}".format(sitename))
-
-            # # get last date recorded in midday list file
-            # with open(outpath, 'r') as fh:
-            #     lineList = fh.readlines()
-            #     nlines = len(lineList)
-            #     if nlines > 0:
-            #         lastline = lineList[-1]
-            #     else:
-            #         lastline = ""
-
-            # # find the last date in midday image list
-            # if (lastline.rstrip() == ""):
-            #     lastdate = siteInfo[sitename]['date_first']
-            #     lastdate = firstimgdate + timedelta(days=nlines-1)
-            # else:
-            #     filename = os.path.basename(lastline)
-            #     lastdt = pcu.fn2datetime(sitename, filename)
-            #     lastdate = lastdt.date()
-            midday_list = read_midday_list(sitename)
-            ndays = len(midday_list)
-            lastdate = midday_list[ndays-1]['date']
-            if verbose:
-                print("  Last midday date: {}".format(lastdate))
-
-            # find the date of the first and last image for this site
-            lastimgdate = siteInfo[sitename]['date_last']
-            if verbose:
-                print("  Last image date: {}".format(lastimgdate))
-
-            # check if update is needed
-            if not (lastimgdate > lastdate):
-                if verbose:
-                    print("  No update needed.")
-                continue
-
-            # always redo last date to account for sites where the
-            # archive update only picks up a partial day
-            nextdate = lastdate
-
-            # remove last entry in list
-            midday_list.pop()
-
-            for mydate in daterange(nextdate, lastimgdate):
-                midday_image = pcu.getMiddayImage(sitename, mydate.year,
-                                                  mydate.month,
-                                                  mydate.day)
-                entry = {"date": mydate,
-                         "path": midday_image}
-
-                if verbose:
-                    print("Adding entry: {}".format(entry))
-
-                midday_list.append(entry)
-
-            with open(outpath, 'w') as fh:
-                for item in midday_list:
-                    fh.write("{}\n".format(item["path"]))
-
+        elif result == "updated":
             nupdate += 1
 
+    if jobs > 1:
+        pool.close()
+        pool.join()
+
     # print info message
     print("{} sites updated.".format(nupdate))
     print("{} new sites.".format(ncreate))
+
+    if profile:
+        try:
+            pcu.write_profile("updateMiddayLists", time.time() - t0)
+        except EnvironmentError as e:
+            sys.stderr.write("Unable to write profile: {}\n".format(e))
+        if args.profile:
+            pcu.print_profile()
+    if len(failed) > 0:
+        print("{} sites failed: {}".format(len(failed), ", ".join(failed)))
+        sys.exit(1)
     sys.exit(0)
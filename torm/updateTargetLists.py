@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Create daily image lists for a set of target times of day.  For each
+site the archive is read once and for every day the image closest to
+each target is picked.  Targets are fixed clock times given as
+NAME=HH:MM or solar noon computed from the site longitude and UTC
+offset.  Each target is written to its own list file,
+ROI/<sitename>-<name>.txt, in the same format as the midday image
+list.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import functools
+from datetime import date
+
+import PhenoCamUtils as pcu
+
+DEFAULT_TARGETS = ["morning=10:00", "afternoon=14:00"]
+
+
+def parse_target(arg):
+    """
+    Parse a NAME=HH:MM target argument into (name, decimal hours).
+    """
+
+    try:
+        name, hhmm = arg.split("=")
+        hh, mm = hhmm.split(":")
+        hh, mm = int(hh), int(mm)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "target '{}' is not NAME=HH:MM".format(arg))
+
+    if name == "" or not (0 <= hh < 24) or not (0 <= mm < 60):
+        raise argparse.ArgumentTypeError(
+            "target '{}' is not NAME=HH:MM".format(arg))
+
+    return name, hh + mm/60.
+
+
+def targetlistpath(sitename, name, irFlag=False):
+
+    # create path for a target image list from sitename
+    if irFlag:
+        outfile = "{}_IR-{}.txt".format(sitename, name)
+    else:
+        outfile = "{}-{}.txt".format(sitename, name)
+    outpath = os.path.join(pcu.STARTDIR, sitename, "ROI", outfile)
+
+    return outpath
+
+
+def write_target_list(outpath, imglist):
+    """
+    Write an image list to outpath, replacing it atomically.
+    """
+
+    outdir = os.path.dirname(outpath)
+    fd, tmppath = tempfile.mkstemp(dir=outdir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            for item in imglist:
+                fh.write("%s\n" % item)
+        os.chmod(tmppath, 0o664)
+        os.rename(tmppath, outpath)
+    except Exception:
+        os.unlink(tmppath)
+        raise
+
+
+def make_target_lists(sitename, siteinfo, targets, solarnoon=False,
+                      irFlag=False, verbose=False):
+    """
+    Create the target image lists for a single site.  siteinfo is the
+    dbinfo() entry for the site.  Returns the number of lists written.
+    """
+
+    firstimgdate = siteinfo['date_first']
+    lastimgdate = siteinfo['date_last']
+
+    # skip sites which no images yet
+    if firstimgdate is None:
+        return 0
+
+    targets = dict(targets)
+    if solarnoon:
+        if siteinfo['Lon'] is None:
+            sys.stderr.write("{}: no longitude, skipping solar noon.\n"
+                             .format(sitename))
+        else:
+            # without a UTC offset solar_noon_table() assumes the time
+            # zone nearest the longitude, which can be an hour out
+            utc_offset = siteinfo['utc_offset']
+            if utc_offset is None:
+                sys.stderr.write("{}: no UTC offset, guessing the time "
+                                 "zone from the longitude.\n"
+                                 .format(sitename))
+            else:
+                utc_offset = float(utc_offset)
+            targets['solarnoon'] = functools.partial(pcu.solar_noon_table,
+                                                     float(siteinfo['Lon']),
+                                                     utc_offset=utc_offset)
+
+    if len(targets) == 0:
+        return 0
+
+    lists = pcu.getTargetImageRange(sitename, firstimgdate, lastimgdate,
+                                    targets, irFlag=irFlag)
+
+    for name in sorted(lists.keys()):
+        outpath = targetlistpath(sitename, name, irFlag=irFlag)
+        write_target_list(outpath, lists[name])
+        if verbose:
+            print("  {}: {} days".format(outpath, len(lists[name])))
+
+    return len(lists)
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-v", "--verbose",
+                        help="increase output verbosity",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("-t", "--target",
+                        help="target time of day as NAME=HH:MM " +
+                        "(may be repeated, default {})".format(
+                            " ".join(DEFAULT_TARGETS)),
+                        type=parse_target,
+                        action="append",
+                        default=None)
+
+    parser.add_argument("--solar-noon",
+                        help="add a 'solarnoon' target from the site " +
+                        "longitude and UTC offset (sites with no UTC " +
+                        "offset use the time zone nearest the longitude)",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--ir",
+                        help="make lists of IR images",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--offline",
+                        help="use the last site information snapshot " +
+                        "if the database is unavailable",
+                        action="store_true",
+                        default=False)
+
+    # positional arguments
+    parser.add_argument("sitelist",
+                        help="PhenoCam Sites",
+                        nargs="*")
+
+    # parse arguments
+    args = parser.parse_args()
+    siteargs = args.sitelist
+    verbose = args.verbose
+    if args.target is None:
+        targets = [parse_target(x) for x in DEFAULT_TARGETS]
+    else:
+        targets = args.target
+
+    # print today's date
+    today = date.today()
+    print("Update Target Image Lists")
+    print("=========================")
+    print(today)
+    if verbose:
+        print("targets: {}".format(", ".join(
+            "{}={:.2f}".format(name, hour) for name, hour in targets)))
+        print("solar noon: {}".format(args.solar_noon))
+
+    # get information on all sites
+    siteInfo = pcu.dbinfo(colnames=["Site", "Lon", "utc_offset", "active",
+                                    "date_first", "date_last"],
+                          max_age=pcu.DBINFO_BATCH_TTL,
+                          offline=args.offline)
+    if len(siteargs) == 0:
+        sitelist = [x for x in siteInfo.keys() if siteInfo[x]['active']]
+    else:
+        sitelist = []
+        for site in set(siteargs):
+            if site not in siteInfo:
+                errmsg = "Site '{}' not found.\n".format(site)
+                sys.stderr.write(errmsg)
+            else:
+                sitelist.append(site)
+        if len(sitelist) == 0:
+            sys.exit(1)
+    sitelist.sort()
+
+    nsites = 0
+    for sitename in sitelist:
+        if verbose:
+            print("Site: {}".format(sitename))
+        nlists = make_target_lists(sitename, siteInfo[sitename], targets,
+                                   solarnoon=args.solar_noon,
+                                   irFlag=args.ir, verbose=verbose)
+        if nlists > 0:
+            nsites += 1
+
+    # print info message
+    print("{} sites updated.".format(nsites))
+    sys.exit(0)
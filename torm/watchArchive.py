@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Watch the PhenoCam archive for new files and keep the per-site
+archive indexes and midday image lists up to date as images arrive.
+File create/rename events in the recent month directories of each
+site come from inotify (via pyinotify) where available.  On NFS, or
+with --poll, those directories are polled instead.  Events are
+collected for --interval seconds and applied as one batch per site.
+"""
+
+import os
+import sys
+import time
+import argparse
+import traceback
+from datetime import date
+from datetime import timedelta
+
+import PhenoCamUtils as pcu
+from updateMiddayLists import update_midday_dates
+
+# inotify is optional, without it the archive is polled
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+def parse_archive_path(path):
+    """
+    Split an archive file path into (sitename, date, channel) for a
+    "standard" image or metadata filename.  Returns None for anything
+    else.
+    """
+
+    relpath = os.path.relpath(path, pcu.STARTDIR)
+    parts = relpath.split(os.sep)
+    if len(parts) != 4:
+        return None
+
+    sitename, yeardir, mondir, fname = parts
+    parsed = pcu.parse_archive_filename(sitename, fname)
+    if parsed is None:
+        return None
+
+    channel, dt = parsed
+    if (yeardir != "%4.4d" % (dt.year,)) | (mondir != "%2.2d" % (dt.month,)):
+        return None
+
+    return sitename, dt.date(), channel
+
+
+def apply_batch(batch, verbose=False):
+    """
+    Apply a batch of new files, a dictionary keyed by sitename of sets
+    of (date, channel) tuples.  The archive index (if the site has
+    one) is refreshed for the months involved and the midday list is
+    updated for days with new RGB images.  Errors are reported and
+    don't stop the other sites.
+    """
+
+    for sitename in sorted(batch.keys()):
+        events = batch[sitename]
+        months = set((mydate.year, mydate.month) for mydate, ch in events)
+        rgbdates = set(mydate for mydate, ch in events if ch == 'RGB')
+        try:
+            pcu.update_archive_index(sitename, create=False, months=months)
+            if len(rgbdates) > 0:
+                changed = update_midday_dates(sitename, rgbdates,
+                                              verbose=verbose)
+            else:
+                changed = False
+        except Exception:
+            sys.stderr.write("Error updating {}:\n".format(sitename))
+            sys.stderr.write(traceback.format_exc())
+            continue
+
+        if verbose:
+            msg = "{}: {} new files, midday list {}"
+            print(msg.format(sitename, len(events),
+                             "updated" if changed else "unchanged"))
+
+
+def add_event(batch, path, sitelist):
+    """
+    Add the file at path to a batch if it's an archive file for one of
+    the watched sites (all sites if sitelist is None).
+    """
+
+    parsed = parse_archive_path(path)
+    if parsed is None:
+        return
+
+    sitename, mydate, channel = parsed
+    if sitelist is not None and sitename not in sitelist:
+        return
+
+    batch.setdefault(sitename, set()).add((mydate, channel))
+
+
+def recent_months(nmonths):
+    """
+    Return (year, month) tuples for the current and previous
+    nmonths-1 months.
+    """
+
+    months = []
+    mydate = date.today().replace(day=1)
+    for i in range(nmonths):
+        months.append((mydate.year, mydate.month))
+        mydate = (mydate - timedelta(days=1)).replace(day=1)
+
+    return months
+
+
+def recent_dirs(sitename, nmonths):
+    """
+    Return the directories to watch for a site: the site directory
+    (where new year directories appear) and the year and month
+    directories of the recent nmonths months.
+    """
+
+    sitepath = os.path.join(pcu.STARTDIR, sitename)
+    dirs = [sitepath]
+    for year, month in recent_months(nmonths):
+        yearpath = os.path.join(sitepath, "%4.4d" % (year,))
+        monpath = os.path.join(yearpath, "%2.2d" % (month,))
+        for path in (yearpath, monpath):
+            if path not in dirs:
+                dirs.append(path)
+
+    return dirs
+
+
+def watch_inotify(sitelist, interval, nmonths=2, verbose=False):
+    """
+    Watch the recent month directories of each site with inotify and
+    apply batches of events every interval seconds.  Only the site
+    directories and the recent year and month directories are
+    watched, not the whole archive, so the number of watches stays
+    small.  New year and month directories are watched as soon as
+    they are created and watches on months which are no longer
+    recent are dropped.
+    """
+
+    wm = pyinotify.WatchManager()
+    mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | \
+        pyinotify.IN_CREATE
+
+    batch = {}
+
+    # watch descriptors keyed by directory path, and the directories
+    # which couldn't be watched (retried, but only reported once)
+    watches = {}
+    failed = set()
+
+    def sync_watches(sitename, initial=False):
+        """
+        Watch the site's recent directories which exist and stop
+        watching those which are no longer recent.  Files already in
+        a month directory which is first watched after startup are
+        added to the batch, as they may have arrived before the watch
+        was in place.
+        """
+
+        wanted = recent_dirs(sitename, nmonths)
+        sitepath = wanted[0]
+        for path in sorted(watches.keys()):
+            if path.startswith(sitepath + os.sep) and path not in wanted:
+                wm.rm_watch(watches.pop(path), quiet=True)
+
+        for path in wanted:
+            if path in watches or not os.path.isdir(path):
+                continue
+            wd = wm.add_watch(path, mask).get(path, -1)
+            if wd < 0:
+                if path not in failed:
+                    errmsg = "Unable to watch {} (see " + \
+                        "fs.inotify.max_user_watches)\n"
+                    sys.stderr.write(errmsg.format(path))
+                    failed.add(path)
+                continue
+            watches[path] = wd
+            failed.discard(path)
+
+            # a month directory
+            if not initial and \
+                    os.path.dirname(os.path.dirname(path)) == sitepath:
+                try:
+                    names = os.listdir(path)
+                except OSError:
+                    continue
+                for fname in names:
+                    add_event(batch, os.path.join(path, fname), sitelist)
+
+    class Handler(pyinotify.ProcessEvent):
+        def process_default(self, event):
+            if not event.dir:
+                add_event(batch, event.pathname, sitelist)
+                return
+
+            # a new year or month directory
+            relpath = os.path.relpath(event.pathname, pcu.STARTDIR)
+            sitename = relpath.split(os.sep)[0]
+            if sitename in sitelist:
+                sync_watches(sitename)
+
+    notifier = pyinotify.Notifier(wm, Handler(), timeout=1000)
+    for sitename in sorted(sitelist):
+        sync_watches(sitename, initial=True)
+
+    if verbose:
+        print("Watching {} directories of {} sites with inotify".format(
+            len(watches), len(sitelist)))
+
+    next_flush = time.time() + interval
+    while True:
+        notifier.process_events()
+        if notifier.check_events():
+            notifier.read_events()
+
+        if time.time() >= next_flush:
+            if len(batch) > 0:
+                apply_batch(batch, verbose=verbose)
+                batch.clear()
+
+            # move on to a new month even if no directory was created
+            for sitename in sorted(sitelist):
+                sync_watches(sitename)
+            next_flush = time.time() + interval
+
+
+def watch_poll(sitelist, interval, nmonths=2, verbose=False):
+    """
+    Poll the recent month directories of each site every interval
+    seconds.  A directory is only listed when its mtime changes, and
+    only names not seen before become events.
+    """
+
+    # (mtime, set of names) keyed by month directory path
+    known = {}
+    first = True
+
+    if verbose:
+        print("Polling {} sites".format(len(sitelist)))
+
+    while True:
+        t0 = time.time()
+        batch = {}
+        for sitename in sorted(sitelist):
+            for year, month in recent_months(nmonths):
+                monpath = os.path.join(pcu.STARTDIR, sitename,
+                                       "%4.4d" % (year,),
+                                       "%2.2d" % (month,))
+                try:
+                    mtime = os.stat(monpath).st_mtime
+                    if monpath in known and known[monpath][0] == mtime:
+                        continue
+                    names = set(os.listdir(monpath))
+                except OSError:
+                    continue
+
+                if monpath in known:
+                    for fname in names - known[monpath][1]:
+                        add_event(batch, os.path.join(monpath, fname),
+                                  sitelist)
+                known[monpath] = (mtime, names)
+
+        # the first pass only records what is already there
+        if not first and len(batch) > 0:
+            apply_batch(batch, verbose=verbose)
+        first = False
+
+        time.sleep(max(interval - (time.time() - t0), 0))
+
+
+if __name__ == "__main__":
+
+    # get arguments
+    parser = argparse.ArgumentParser()
+
+    # optional arguments
+    parser.add_argument("-v", "--verbose",
+                        help="increase output verbosity",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("-i", "--interval",
+                        help="seconds between batches of updates",
+                        type=float,
+                        default=60.)
+
+    parser.add_argument("--poll",
+                        help="poll directories instead of using inotify " +
+                        "(e.g. on NFS)",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--months", "--poll-months",
+                        help="number of recent months to watch or poll",
+                        dest="months",
+                        type=int,
+                        default=2)
+
+    # positional arguments
+    parser.add_argument("sitelist",
+                        help="PhenoCam Sites",
+                        nargs="*")
+
+    # parse arguments
+    args = parser.parse_args()
+    verbose = args.verbose
+
+    if len(args.sitelist) > 0:
+        sitelist = set(args.sitelist)
+    else:
+        siteInfo = pcu.dbinfo(colnames=["Site", "active"])
+        sitelist = set(x for x in siteInfo.keys()
+                       if siteInfo[x]['active'])
+
+    use_inotify = not args.poll
+    if use_inotify and pyinotify is None:
+        sys.stderr.write("pyinotify not available, polling instead.\n")
+        use_inotify = False
+
+    if use_inotify:
+        watch_inotify(sitelist, args.interval, nmonths=args.months,
+                      verbose=verbose)
+    else:
+        watch_poll(sitelist, args.interval, nmonths=args.months,
+                   verbose=verbose)